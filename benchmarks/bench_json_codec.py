@@ -0,0 +1,63 @@
+"""
+Compare the JSON backends available to onedrive_d.common.json_codec on a large children page.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_json_codec [--items 10000] [--rounds 20]
+"""
+
+import argparse
+import copy
+import time
+
+from onedrive_d.common import json_codec
+from onedrive_d.tests import get_data
+
+
+def build_page(num_items):
+    """
+    Build a children page of num_items full item resources, based on the sample items in the test data.
+    :param int num_items:
+    :rtype: dict
+    """
+    samples = [get_data(f) for f in ('image_item.json', 'folder_item.json', 'folder_child_item.json')]
+    page = {'value': [], '@odata.nextLink': 'https://api.onedrive.com/v1.0/drive/root/children?$skiptoken=foo'}
+    for i in range(num_items):
+        item = copy.deepcopy(samples[i % len(samples)])
+        item['id'] = '%s!%d' % (item['id'].split('!')[0], i)
+        item['name'] = '%d %s' % (i, item['name'])
+        page['value'].append(item)
+    return page
+
+
+def time_best_of(func, arg, rounds):
+    best = None
+    for _ in range(rounds):
+        t = time.perf_counter()
+        func(arg)
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--items', type=int, default=10000, help='Number of items in the page.')
+    parser.add_argument('--rounds', type=int, default=20, help='Number of rounds; the best time is reported.')
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    payload = json_codec.use_backend('json').dumps(page).encode('utf-8')
+    print('Page of %d items, %.1f KiB.' % (args.items, len(payload) / 1024))
+    print('%-8s %12s %12s' % ('backend', 'decode (ms)', 'encode (ms)'))
+    for name in json_codec.get_available_backends():
+        backend = json_codec.use_backend(name)
+        decode = time_best_of(backend.loads, payload, args.rounds)
+        encode = time_best_of(backend.dumps, page, args.rounds)
+        print('%-8s %12.2f %12.2f' % (name, decode * 1000, encode * 1000))
+    json_codec.use_backend()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""
+Micro-benchmarks of the code that runs once per item: the items database, the task pool, the path filter, the hasher,
+the reader-writer lock and building OneDriveItem objects. Each benchmark runs at every given size (number of items),
+and the best of a few rounds is reported. Results can be saved as JSON, and two saved runs can be compared.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_micro [--sizes 1000 10000 100000] [--rounds 3] [--filter items_db] [--output FILE]
+    python -m benchmarks.bench_micro --compare BASE.json NEW.json [--threshold 0.1]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from onedrive_d.api import items
+from onedrive_d.common import hasher
+from onedrive_d.common import tasks
+from onedrive_d.common.path_filter import PathFilter
+from onedrive_d.store import items_db
+from onedrive_d.tests import get_content
+from onedrive_d.tests import get_data
+from onedrive_d.tests.api import drive_factory
+from onedrive_d.tests.store import db_factory
+from onedrive_d.vendor import rwlock
+
+# Items per folder when a benchmark spreads items over folders.
+ITEMS_PER_DIR = 100
+# Bytes hashed per item by the hasher benchmarks.
+HASH_BYTES_PER_ITEM = 256
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function takes the size, does the setup and returns a pair: a function that
+    runs the timed part and returns the number of operations it did, and a cleanup function or None.
+    """
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def get_parent_path(i, size):
+    return '/drive/root:/dir%d' % (i % max(1, size // ITEMS_PER_DIR))
+
+
+def build_items_data(size):
+    """
+    :param int size:
+    :return [dict]: Resources of size distinct files, spread over folders.
+    """
+    template = get_data('image_item.json')
+    data = []
+    for i in range(size):
+        d = dict(template)
+        d['id'] = 'BENCH!%d' % i
+        d['name'] = 'file%d.jpg' % i
+        d['parentReference'] = dict(template['parentReference'], path=get_parent_path(i, size))
+        data.append(d)
+    return data
+
+
+class ItemStorageFixture:
+    """
+    An items database in a temporary directory, because the database is on disk in the daemon.
+    """
+
+    def __init__(self, size, populate=True):
+        self.work_dir = tempfile.mkdtemp(prefix='bench_micro_')
+        self.drive = drive_factory.get_sample_drive_object()
+        self.storage = items_db.ItemStorage(self.work_dir + '/items.db', self.drive)
+        self.items = [items.OneDriveItem(self.drive, d) for d in build_items_data(size)]
+        if populate:
+            for item in self.items:
+                self.storage.update_item(item)
+            self.storage.flush()
+
+    def close(self):
+        self.storage.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+@benchmark('items_db.update_item')
+def bench_update_item(size):
+    fixture = ItemStorageFixture(size, populate=False)
+
+    def run():
+        for item in fixture.items:
+            fixture.storage.update_item(item)
+        fixture.storage.flush()
+        return size
+
+    return run, fixture.close
+
+
+@benchmark('items_db.get_items_by_id')
+def bench_get_items_by_id(size):
+    fixture = ItemStorageFixture(size)
+
+    def run():
+        for item in fixture.items:
+            fixture.storage.get_items_by_id(item_id=item.id)
+        return size
+
+    return run, fixture.close
+
+
+@benchmark('items_db.get_items_by_local_path')
+def bench_get_items_by_local_path(size):
+    fixture = ItemStorageFixture(size)
+    queries = [(item.parent_reference.path.split(':', 1)[1], item.name) for item in fixture.items]
+
+    def run():
+        for local_parent_path, name in queries:
+            fixture.storage.get_items_by_id(local_parent_path=local_parent_path, item_name=name)
+        return size
+
+    return run, fixture.close
+
+
+@benchmark('items_db.delete_item')
+def bench_delete_item(size):
+    fixture = ItemStorageFixture(size)
+
+    def run():
+        for item in fixture.items:
+            fixture.storage.delete_item(item_id=item.id)
+        fixture.storage.flush()
+        return size
+
+    return run, fixture.close
+
+
+def build_tasks(size, task_pool):
+    drive = drive_factory.get_sample_drive_object()
+    task_base = tasks.TaskMixin(drive=drive, items_store=None, task_pool=task_pool)
+    return [tasks.CreateDirTask(task_base, local_parent_path=get_parent_path(i, size).split(':', 1)[1],
+                                name='dir%d' % i) for i in range(size)]
+
+
+@benchmark('task_pool.add_task')
+def bench_add_task(size):
+    task_pool = db_factory.get_sample_task_pool()
+    all_tasks = build_tasks(size, task_pool)
+
+    def run():
+        for task in all_tasks:
+            task_pool.add_task(task)
+        return size
+
+    return run, None
+
+
+@benchmark('task_pool.pop_task')
+def bench_pop_task(size):
+    task_pool = db_factory.get_sample_task_pool()
+    for task in build_tasks(size, task_pool):
+        task_pool.add_task(task)
+
+    def run():
+        for _ in range(size):
+            task_pool.pop_task()
+        return size
+
+    return run, None
+
+
+@benchmark('task_pool.has_pending_task')
+def bench_has_pending_task(size):
+    task_pool = db_factory.get_sample_task_pool()
+    all_tasks = build_tasks(size, task_pool)
+    for task in all_tasks:
+        task_pool.add_task(task)
+    paths = [task_pool.get_task_path(task) for task in all_tasks]
+
+    def run():
+        for path in paths:
+            task_pool.has_pending_task(path)
+        return size
+
+    return run, None
+
+
+@benchmark('task_pool.remove_children_tasks')
+def bench_remove_children_tasks(size):
+    """
+    Remove the tasks of ten folders from a pool of size tasks; the cost is per call.
+    """
+    task_pool = db_factory.get_sample_task_pool()
+    all_tasks = build_tasks(size, task_pool)
+    for task in all_tasks:
+        task_pool.add_task(task)
+    local_parent_paths = sorted({t.local_parent_path for t in all_tasks})[:10]
+
+    def run():
+        for path in local_parent_paths:
+            task_pool.remove_children_tasks(path)
+        return len(local_parent_paths)
+
+    return run, None
+
+
+@benchmark('path_filter.should_ignore')
+def bench_should_ignore(size):
+    path_filter = PathFilter(get_content('ignore_list.txt').splitlines())
+    paths = ['/dir%d/sub%d/file%d.%s' % (i % 100, i % 7, i, ('txt', 'tmp', 'jpg', 'swp')[i % 4]) for i in range(size)]
+
+    def run():
+        for path in paths:
+            path_filter.should_ignore(path)
+        return size
+
+    return run, None
+
+
+class HashFileFixture:
+    def __init__(self, size):
+        fd, self.path = tempfile.mkstemp(prefix='bench_micro_')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(size * HASH_BYTES_PER_ITEM))
+
+    def close(self):
+        os.remove(self.path)
+
+
+@benchmark('hasher.hash_value')
+def bench_hash_value(size):
+    """
+    Hash a file of HASH_BYTES_PER_ITEM bytes per item.
+    """
+    fixture = HashFileFixture(size)
+
+    def run():
+        hasher.hash_value(fixture.path)
+        return size
+
+    return run, fixture.close
+
+
+@benchmark('hasher.crc32_value')
+def bench_crc32_value(size):
+    fixture = HashFileFixture(size)
+
+    def run():
+        hasher.crc32_value(fixture.path)
+        return size
+
+    return run, fixture.close
+
+
+@benchmark('rwlock.reader')
+def bench_rwlock_reader(size):
+    lock = rwlock.RWLock()
+
+    def run():
+        for _ in range(size):
+            lock.reader_acquire()
+            lock.reader_release()
+        return size
+
+    return run, None
+
+
+@benchmark('rwlock.writer')
+def bench_rwlock_writer(size):
+    lock = rwlock.RWLock()
+
+    def run():
+        for _ in range(size):
+            lock.writer_acquire()
+            lock.writer_release()
+        return size
+
+    return run, None
+
+
+@benchmark('items.OneDriveItem')
+def bench_build_item(size):
+    drive = drive_factory.get_sample_drive_object()
+    all_data = build_items_data(size)
+
+    def run():
+        for data in all_data:
+            items.OneDriveItem(drive, data)
+        return size
+
+    return run, None
+
+
+def run_benchmark(name, size, rounds):
+    """
+    :return dict: The best round of the benchmark at the size.
+    """
+    best = None
+    for _ in range(rounds):
+        run, cleanup = BENCHMARKS[name](size)
+        gc.collect()
+        gc.disable()
+        try:
+            t = time.perf_counter()
+            ops = run()
+            t = time.perf_counter() - t
+        finally:
+            gc.enable()
+            if cleanup is not None:
+                cleanup()
+        if best is None or t < best[0]:
+            best = t, ops
+    t, ops = best
+    return {'name': name, 'size': size, 'ops': ops, 'seconds': round(t, 6), 'ns_per_op': round(t * 1e9 / ops, 1)}
+
+
+def get_metadata():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(base, new, threshold):
+    """
+    Print the change of every benchmark found in both runs.
+    :param dict base: A saved run.
+    :param dict new: A saved run.
+    :param float threshold: Relative slowdown beyond which a benchmark counts as regressed.
+    :return int: Number of regressed benchmarks.
+    """
+    base_results = {(r['name'], r['size']): r for r in base['results']}
+    regressions = 0
+    print('%-34s %9s %14s %14s %9s' % ('benchmark', 'size', 'base (ns/op)', 'new (ns/op)', 'change'))
+    for r in new['results']:
+        b = base_results.get((r['name'], r['size']))
+        if b is None:
+            continue
+        change = r['ns_per_op'] / b['ns_per_op'] - 1 if b['ns_per_op'] > 0 else 0
+        mark = ''
+        if change > threshold:
+            mark = '  slower'
+            regressions += 1
+        elif change < -threshold:
+            mark = '  faster'
+        print('%-34s %9d %14.1f %14.1f %+8.1f%%%s' % (r['name'], r['size'], b['ns_per_op'], r['ns_per_op'],
+                                                      change * 100, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of items to run each benchmark with, e.g., up to 1000000.')
+    parser.add_argument('--rounds', type=int, default=3, help='Number of rounds; the best time is reported.')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this.')
+    parser.add_argument('--output', help='Write the results to this file as JSON.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Compare two saved runs.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown reported as a regression by --compare.')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0], 'r') as f:
+            base = json.load(f)
+        with open(args.compare[1], 'r') as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        print('%d regression(s) beyond %.0f%%.' % (regressions, args.threshold * 100))
+        sys.exit(1 if regressions > 0 else 0)
+
+    names = [n for n in sorted(BENCHMARKS) if args.filter is None or args.filter in n]
+    results = []
+    print('%-34s %9s %12s %12s' % ('benchmark', 'size', 'total (s)', 'ns/op'))
+    for name in names:
+        for size in args.sizes:
+            result = run_benchmark(name, size, args.rounds)
+            print('%-34s %9d %12.4f %12.1f' % (name, size, result['seconds'], result['ns_per_op']))
+            results.append(result)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': get_metadata(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
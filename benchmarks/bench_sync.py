@@ -0,0 +1,236 @@
+"""
+End-to-end sync benchmark: run the real task pool, workers, items database and DriveObject against a local stand-in
+of the OneDrive API (benchmarks.fake_onedrive), and time the initial sync, an incremental sync with no changes and an
+incremental sync after remote and local changes.
+
+Each scenario runs in its own process so that the peak RSS reported is that of the scenario alone.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_sync [--scenario many_small few_huge deep wide] [--scale 1.0] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from onedrive_d import datetime_to_str
+from onedrive_d import timestamp_to_datetime
+from onedrive_d.common import drive_config
+from onedrive_d.common import tasks
+from onedrive_d.common import task_worker
+from onedrive_d.common.user_config import UserConfig
+from onedrive_d.store import items_db
+from onedrive_d.store.task_pool import TaskPool
+from onedrive_d.tests.api import drive_factory
+
+from benchmarks import fake_onedrive
+
+KiB = 1024
+MiB = 1024 * KiB
+
+
+def build_many_small(drive, scale):
+    """
+    Thousands of small files spread over a flat set of folders.
+    """
+    for i in range(int(5000 * scale)):
+        drive.add_path('/dir%d/file%d.txt' % (i % 50, i), size=KiB + (i * 7919) % (15 * KiB))
+
+
+def build_few_huge(drive, scale):
+    """
+    A handful of files that are downloaded by ranges and uploaded by sessions.
+    """
+    for i in range(4):
+        drive.add_path('/huge%d.bin' % i, size=int(32 * MiB * scale) + i)
+
+
+def build_deep(drive, scale):
+    """
+    A chain of nested folders with a few files on each level; the sync discovers one level per task.
+    """
+    path = ''
+    for level in range(int(64 * scale)):
+        path += '/level%d' % level
+        for i in range(4):
+            drive.add_path('%s/file%d.txt' % (path, i), size=4 * KiB)
+
+
+def build_wide(drive, scale):
+    """
+    One folder whose children take many pages to list.
+    """
+    for i in range(int(10000 * scale)):
+        drive.add_path('/wide/file%d.txt' % i, size=KiB)
+
+
+SCENARIOS = {
+    'many_small': build_many_small,
+    'few_huge': build_few_huge,
+    'deep': build_deep,
+    'wide': build_wide,
+}
+
+
+class SyncBench:
+    """
+    The sync stack of one drive, wired to a fake server, with a way to run it until it has nothing left to do.
+    """
+
+    # Polls the stack must be idle for in a row before a sync is considered done.
+    IDLE_POLLS = 5
+    POLL_INTERVAL_SECONDS = 0.02
+
+    def __init__(self, work_dir, fake_drive):
+        self.local_root = os.path.join(work_dir, 'root')
+        os.mkdir(self.local_root)
+        self.server = fake_onedrive.FakeOneDriveServer(fake_drive)
+        self.server.start()
+        self.drive = drive_factory.get_sample_drive_object()
+        self.drive.drive_uri = self.server.api_uri
+        self.drive.config = drive_config.DriveConfig({'local_root': self.local_root})
+        self.items_store = items_db.ItemStorageManager(work_dir).get_item_storage(self.drive)
+        self.task_pool = TaskPool.get_instance()
+        self.task_base = tasks.TaskMixin(drive=self.drive, items_store=self.items_store, task_pool=self.task_pool)
+        self.worker_lanes = []
+        for lane, sizes in UserConfig.DEFAULT_WORKER_LANES.items():
+            worker_lane = task_worker.WorkerLane(self.task_pool, lane, sizes['min_workers'], sizes['max_workers'])
+            worker_lane.start()
+            self.worker_lanes.append(worker_lane)
+        task_worker.WorkerLaneScaler(self.worker_lanes, interval_sec=0.5).start()
+
+    def is_idle(self):
+        if self.task_pool.get_queue_length() > 0 or self.task_pool.get_next_due_time() is not None:
+            return False
+        for worker_lane in self.worker_lanes:
+            if any(w.current_task is not None for w in list(worker_lane.workers)):
+                return False
+        return True
+
+    def sync(self):
+        """
+        Sync the whole drive and wait until every task it spawned is done.
+        :return dict: Wall time, requests and bytes of the sync.
+        """
+        self.server.stats.reset()
+        start_time = time.perf_counter()
+        self.task_pool.add_task(tasks.SynchronizeDirTask(self.task_base, local_parent_path='', name=''))
+        idle_polls = 0
+        while idle_polls < self.IDLE_POLLS:
+            time.sleep(self.POLL_INTERVAL_SECONDS)
+            idle_polls = idle_polls + 1 if self.is_idle() else 0
+        elapsed = time.perf_counter() - start_time - self.IDLE_POLLS * self.POLL_INTERVAL_SECONDS
+        self.items_store.flush()
+        result = self.server.stats.dump()
+        result['wall_sec'] = round(elapsed, 3)
+        return result
+
+    def make_changes(self, fraction=0.1):
+        """
+        Add new files on the server, and modify existing files locally.
+        :param float fraction: Share of the existing files to add and to modify.
+        :return (int, int): Number of files added remotely and modified locally.
+        """
+        fake_drive = self.server.drive
+        files = sorted(n.path for n in list(fake_drive.nodes.values()) if not n.is_folder)
+        count = max(1, int(len(files) * fraction))
+        for path in files[:count]:
+            parent, name = path.rsplit('/', 1)
+            fake_drive.add_path('%s/new_%s' % (parent, name), size=fake_drive.find('root', path).size)
+        mtime = time.time() + 60
+        for path in files[-count:]:
+            local_path = self.local_root + path
+            with open(local_path, 'ab') as f:
+                f.write(b'local change')
+            os.utime(local_path, (mtime, mtime))
+        return count, count
+
+    def stop(self):
+        task_worker.TaskConsumer.terminate_sign.set()
+        self.server.stop()
+
+
+def run_scenario(name, scale):
+    fake_drive = fake_onedrive.FakeDrive()
+    # Remote items are older than anything written locally during the run.
+    modified = datetime_to_str(timestamp_to_datetime(int(time.time()) - 3600))
+    SCENARIOS[name](fake_drive, scale)
+    for node in list(fake_drive.nodes.values()):
+        node.created = node.modified = modified
+    num_files = sum(1 for n in list(fake_drive.nodes.values()) if not n.is_folder)
+    num_folders = len(fake_drive.nodes) - num_files
+    total_bytes = sum(n.size for n in list(fake_drive.nodes.values()))
+    work_dir = tempfile.mkdtemp(prefix='bench_sync_')
+    try:
+        bench = SyncBench(work_dir, fake_drive)
+        try:
+            result = {
+                'scenario': name,
+                'scale': scale,
+                'files': num_files,
+                'folders': num_folders,
+                'bytes': total_bytes,
+                'initial': bench.sync(),
+                'no_change': bench.sync(),
+            }
+            added, modified = bench.make_changes()
+            result['changed'] = bench.sync()
+            result['changed'].update({'remote_added': added, 'local_modified': modified})
+        finally:
+            bench.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mib'] = round(max_rss / (MiB if sys.platform == 'darwin' else KiB), 1)
+    return result
+
+
+def run_in_subprocess(name, scale):
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_sync', '--run-one', name,
+                                      '--scale', str(scale)])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def print_result(result):
+    print('%s: %d files, %d folders, %.1f MiB, peak RSS %.1f MiB' % (
+        result['scenario'], result['files'], result['folders'], result['bytes'] / MiB, result['peak_rss_mib']))
+    print('  %-10s %10s %10s %12s %12s' % ('phase', 'wall (s)', 'requests', 'down (MiB)', 'up (MiB)'))
+    for phase in ('initial', 'no_change', 'changed'):
+        r = result[phase]
+        print('  %-10s %10.3f %10d %12.2f %12.2f' % (phase, r['wall_sec'], r['total_requests'],
+                                                    r['bytes_downloaded'] / MiB, r['bytes_uploaded'] / MiB))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS),
+                        help='Scenarios to run.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply the size of every scenario by this.')
+    parser.add_argument('--output', help='Write the results to this file as JSON.')
+    parser.add_argument('--run-one', choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        print(json.dumps(run_scenario(args.run_one, args.scale)))
+        return
+
+    results = []
+    for name in args.scenario:
+        result = run_in_subprocess(name, args.scale)
+        print_result(result)
+        results.append(result)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""
+A local stand-in for the OneDrive API endpoints that DriveObject uses, serving an in-memory tree over HTTP. Good enough
+to drive the sync stack for benchmarks; not a faithful emulation of the service.
+
+Supported: listing children with paging, getting and patching items, downloading content with ranges, simple uploads,
+upload sessions, creating folders, deleting items and async copies with a monitor URL. File content is synthetic and
+generated on the fly, so huge files cost no memory.
+"""
+
+import hashlib
+import http.server
+import itertools
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+import zlib
+
+from onedrive_d import datetime_to_str
+from onedrive_d import timestamp_to_datetime
+from onedrive_d.common import json_codec
+
+PAGE_SIZE = 200
+PATTERN_SIZE = 65536
+
+
+class Node:
+    __slots__ = ('id', 'name', 'parent', 'is_folder', 'children', 'size', 'version', 'created', 'modified')
+
+    def __init__(self, node_id, name, parent, is_folder, size=0, modified=None):
+        self.id = node_id
+        self.name = name
+        self.parent = parent
+        self.is_folder = is_folder
+        self.children = {} if is_folder else None
+        self.size = size
+        self.version = 0
+        self.created = modified
+        self.modified = modified
+
+    @property
+    def path(self):
+        """
+        :return str: Path relative to the drive root, '' for the root.
+        """
+        if self.parent is None:
+            return ''
+        return self.parent.path + '/' + self.name
+
+
+class FakeDrive:
+    """
+    The tree of one drive, safe to use from many threads.
+    """
+
+    def __init__(self, drive_path='/drive', drive_id='fake_drive'):
+        self.drive_path = drive_path
+        self.drive_id = drive_id
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.root = self._new_node('root', None, True)
+        self.nodes = {self.root.id: self.root}
+        self._hashes = {}
+
+    def _new_node(self, name, parent, is_folder, size=0, modified=None):
+        if modified is None:
+            modified = datetime_to_str(timestamp_to_datetime(int(time.time())))
+        return Node('%s!%d' % (self.drive_id, next(self._ids)), name, parent, is_folder, size, modified)
+
+    def add(self, parent, name, is_folder, size=0, modified=None):
+        """
+        Add an item, or replace the content of the file of the same name.
+        :param Node parent:
+        :param str name:
+        :param True | False is_folder:
+        :param int size:
+        :param str | None modified: (Optional) Modification time in API format.
+        :rtype: Node
+        """
+        with self._lock:
+            node = parent.children.get(name)
+            if node is None:
+                node = self._new_node(name, parent, is_folder, size, modified)
+                parent.children[name] = node
+                self.nodes[node.id] = node
+            else:
+                node.size = size
+                node.version += 1
+                if modified is not None:
+                    node.modified = modified
+            return node
+
+    def add_path(self, path, is_folder=False, size=0):
+        """
+        Add an item by its path relative to the drive root, creating the missing folders on the way.
+        :param str path: e.g., "/a/b/c.txt".
+        """
+        parent = self.root
+        names = path.strip('/').split('/')
+        for name in names[:-1]:
+            parent = parent.children.get(name) or self.add(parent, name, True)
+        return self.add(parent, names[-1], is_folder, size)
+
+    def find(self, base, rel=''):
+        """
+        :param str base: "root" or "items/<id>".
+        :param str rel: Path relative to base.
+        :rtype: Node | None
+        """
+        with self._lock:
+            node = self.root if base == 'root' else self.nodes.get(base.split('/', 1)[1])
+            for name in filter(None, rel.split('/')):
+                if node is None or not node.is_folder:
+                    return None
+                node = node.children.get(name)
+            return node
+
+    def move(self, node, new_parent, new_name):
+        with self._lock:
+            del node.parent.children[node.name]
+            node.parent, node.name = new_parent, new_name
+            new_parent.children[new_name] = node
+            node.version += 1
+
+    def remove(self, node):
+        with self._lock:
+            del node.parent.children[node.name]
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                del self.nodes[n.id]
+                if n.is_folder:
+                    stack.extend(n.children.values())
+
+    def copy(self, node, new_parent, new_name):
+        with self._lock:
+            new_node = self.add(new_parent, new_name, node.is_folder, node.size, node.modified)
+            if node.is_folder:
+                for child in list(node.children.values()):
+                    self.copy(child, new_node, child.name)
+            return new_node
+
+    def to_json(self, node):
+        tag = '%s.%d' % (node.id, node.version)
+        data = {
+            'id': node.id,
+            'name': node.name,
+            'eTag': 'e' + tag,
+            'cTag': 'c' + tag,
+            'size': node.size,
+            'createdDateTime': node.created,
+            'lastModifiedDateTime': node.modified,
+            'fileSystemInfo': {'createdDateTime': node.created, 'lastModifiedDateTime': node.modified},
+        }
+        if node.parent is not None:
+            data['parentReference'] = {'driveId': self.drive_id, 'id': node.parent.id,
+                                       'path': self.drive_path + '/root:' + node.parent.path}
+        if node.is_folder:
+            data['folder'] = {'childCount': len(node.children)}
+        else:
+            data['file'] = {'mimeType': 'application/octet-stream', 'hashes': self.get_hashes(node)}
+        return data
+
+    def get_hashes(self, node):
+        """
+        :return dict[str, str]: The hashes facet of a file, in the format of onedrive_d.common.hasher.
+        """
+        key = (node.id, node.version, node.size)
+        hashes = self._hashes.get(key)
+        if hashes is None:
+            sha1, crc = hashlib.sha1(), 0
+            for start in range(0, node.size, PATTERN_SIZE * 16):
+                data = get_content(node, start, min(start + PATTERN_SIZE * 16, node.size))
+                sha1.update(data)
+                crc = zlib.crc32(data, crc)
+            hashes = self._hashes[key] = {'sha1Hash': sha1.hexdigest().upper(), 'crc32Hash': str(crc)}
+        return hashes
+
+
+def get_content(node, start, end):
+    """
+    Synthetic content of a file: a block derived from the ID and version of the file, repeated.
+    :param Node node:
+    :param int start: First byte, inclusive.
+    :param int end: Last byte, exclusive.
+    :rtype: bytes
+    """
+    seed = hashlib.sha256(('%s.%d' % (node.id, node.version)).encode('utf-8')).digest()
+    block = seed * (PATTERN_SIZE // len(seed))
+    offset = start % PATTERN_SIZE
+    length = end - start
+    repeated = block * ((offset + length) // PATTERN_SIZE + 1)
+    return repeated[offset:offset + length]
+
+
+class _FakeOneDriveHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class FakeOneDriveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    _bytes_received = 0
+
+    # Strip "/v1.0/drive/" or "/v1.0/drives/<id>/" off the path.
+    API_PATH_RE = re.compile(r'^/v1\.0/drives?(?:/[^/]+(?=/(?:root|items)))?/(?P<ref>.*)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def drive(self):
+        """
+        :rtype: FakeDrive
+        """
+        return self.server.drive
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self._bytes_received = length
+        return self.rfile.read(length) if length > 0 else b''
+
+    def _send(self, code, data=None, content=None, headers=None):
+        if data is not None:
+            content = json_codec.dumps(data).encode('utf-8')
+        if content is None:
+            content = b''
+        self.send_response(code)
+        if data is not None:
+            self.send_header('Content-Type', 'application/json')
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        # Only file content counts as transferred bytes, not the JSON around it.
+        sent = len(content) if data is None and self.command == 'GET' else 0
+        received = self._bytes_received if self.command == 'PUT' else 0
+        self._bytes_received = 0
+        self.server.stats.record(self.command, sent, received)
+
+    def _send_error(self, code, message):
+        self._send(code, {'error': {'code': str(code), 'message': message}})
+
+    def _parse(self):
+        """
+        :return (str, str, str, dict) | None: Base ("root" or "items/<id>"), path relative to base, action and query.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        match = self.API_PATH_RE.match(urllib.parse.unquote(url.path))
+        if match is None:
+            return None
+        # Forms sent by DriveObject: "root/children", "root:/a/b", "root:/a/b:/children", "root/b:/content",
+        # "items/<id>/children", "items/<id>:/b:/content".
+        parts = match.group('ref').rstrip(':').split(':/')
+        segments = parts.pop(0).rstrip(':').split('/')
+        n = 2 if segments[0] == 'items' else 1
+        base, extra = '/'.join(segments[:n]), '/'.join(segments[n:])
+        if len(parts) == 0:
+            return base, '', extra, query
+        if extra:
+            return base, extra, parts[0], query
+        return base, parts[0].rstrip(':'), parts[1] if len(parts) > 1 else '', query
+
+    def do_GET(self):
+        if self.path.startswith('/monitor/'):
+            return self._get_monitor()
+        parsed = self._parse()
+        if parsed is None:
+            return self._send_error(404, 'Unknown path.')
+        base, rel, action, query = parsed
+        node = self.drive.find(base, rel)
+        if node is None:
+            return self._send_error(404, 'Item not found.')
+        if action == 'children':
+            return self._get_children(node, int(query.get('$skiptoken', 0)))
+        if action == 'content':
+            return self._get_content(node)
+        data = self.drive.to_json(node)
+        if query.get('expand') == 'children' and node.is_folder:
+            data['children'] = [self.drive.to_json(c) for c in list(node.children.values())]
+        self._send(200, data)
+
+    def _get_children(self, node, skip):
+        children = list(node.children.values())
+        page = {'value': [self.drive.to_json(c) for c in children[skip:skip + PAGE_SIZE]]}
+        if skip + PAGE_SIZE < len(children):
+            url = urllib.parse.urlsplit(self.path)
+            page['@odata.nextLink'] = '%s%s?$skiptoken=%d' % (self.server.base_url, url.path, skip + PAGE_SIZE)
+        self._send(200, page)
+
+    def _get_content(self, node):
+        content_range = self.headers.get('Range')
+        if content_range is None:
+            return self._send(200, content=get_content(node, 0, node.size))
+        start, end = content_range.split('=', 1)[1].split('-')
+        end = min(int(end) + 1, node.size)
+        self._send(206, content=get_content(node, int(start), end),
+                   headers={'Content-Range': 'bytes %s-%d/%d' % (start, end - 1, node.size)})
+
+    def do_PUT(self):
+        body = self._read_body()
+        if self.path.startswith('/upload/'):
+            return self._put_fragment(body)
+        parsed = self._parse()
+        if parsed is None or parsed[2] != 'content':
+            return self._send_error(404, 'Unknown path.')
+        base, rel, _, _ = parsed
+        parent_rel, name = rel.rsplit('/', 1) if '/' in rel else ('', rel)
+        parent = self.drive.find(base, parent_rel)
+        if parent is None:
+            return self._send_error(404, 'Parent not found.')
+        node = self.drive.add(parent, name, False, len(body))
+        self._send(201, self.drive.to_json(node))
+
+    def _put_fragment(self, body):
+        session = self.server.upload_sessions.get(self.path.split('/')[2])
+        if session is None:
+            return self._send_error(404, 'Upload session not found.')
+        parent, name = session
+        content_range, total = self.headers['Content-Range'].split('/')
+        start, end = (int(i) for i in content_range.split('-'))
+        if end + 1 < int(total):
+            return self._send(202, {'uploadUrl': self.server.base_url + self.path,
+                                    'nextExpectedRanges': ['%d-' % (end + 1)]})
+        del self.server.upload_sessions[self.path.split('/')[2]]
+        node = self.drive.add(parent, name, False, int(total))
+        self._send(201, self.drive.to_json(node))
+
+    def do_POST(self):
+        body = json_codec.loads(self._read_body() or b'{}')
+        parsed = self._parse()
+        if parsed is None:
+            return self._send_error(404, 'Unknown path.')
+        base, rel, action, _ = parsed
+        if action == 'upload.createSession':
+            parent_rel, name = rel.rsplit('/', 1) if '/' in rel else ('', rel)
+            parent = self.drive.find(base, parent_rel)
+            if parent is None:
+                return self._send_error(404, 'Parent not found.')
+            token = '%032x' % next(self.server.tokens)
+            self.server.upload_sessions[token] = (parent, name)
+            return self._send(200, {'uploadUrl': '%s/upload/%s' % (self.server.base_url, token),
+                                    'nextExpectedRanges': ['0-']})
+        node = self.drive.find(base, rel)
+        if node is None:
+            return self._send_error(404, 'Item not found.')
+        if action == 'children':
+            new_node = self.drive.add(node, body['name'], True)
+            return self._send(201, self.drive.to_json(new_node))
+        if action == 'action.copy':
+            parent = self._find_parent(body.get('parentReference', {}))
+            if parent is None:
+                return self._send_error(400, 'Bad parent reference.')
+            token = '%032x' % next(self.server.tokens)
+            self.server.copy_jobs[token] = [node, parent, body.get('name', node.name), 0]
+            return self._send(202, headers={'Location': '%s/monitor/%s' % (self.server.base_url, token)})
+        self._send_error(404, 'Unknown action.')
+
+    def _find_parent(self, reference):
+        if 'id' in reference:
+            return self.drive.find('items/' + reference['id'])
+        if 'path' in reference:
+            return self.drive.find('root', reference['path'].split('root:', 1)[-1])
+        return None
+
+    def _get_monitor(self):
+        token = self.path.split('/')[2]
+        job = self.server.copy_jobs.get(token)
+        if job is None:
+            return self._send_error(404, 'Job not found.')
+        node, parent, name, polls = job
+        if polls < self.server.copy_polls:
+            job[3] += 1
+            return self._send(202, {'operation': 'ItemCopy', 'status': 'inProgress',
+                                    'percentageComplete': 100.0 * polls / self.server.copy_polls})
+        new_node = self.drive.copy(node, parent, name)
+        del self.server.copy_jobs[token]
+        self._send(303, headers={'Location': '%s/v1.0%s/items/%s' % (self.server.base_url, self.drive.drive_path,
+                                                                     new_node.id)})
+
+    def do_PATCH(self):
+        body = json_codec.loads(self._read_body() or b'{}')
+        parsed = self._parse()
+        node = None if parsed is None else self.drive.find(parsed[0], parsed[1])
+        if node is None:
+            return self._send_error(404, 'Item not found.')
+        if 'parentReference' in body or 'name' in body:
+            parent = self._find_parent(body.get('parentReference', {})) or node.parent
+            self.drive.move(node, parent, body.get('name', node.name))
+        if 'fileSystemInfo' in body:
+            node.modified = body['fileSystemInfo'].get('lastModifiedDateTime', node.modified)
+            node.version += 1
+        self._send(200, self.drive.to_json(node))
+
+    def do_DELETE(self):
+        parsed = self._parse()
+        node = None if parsed is None else self.drive.find(parsed[0], parsed[1])
+        if node is None:
+            return self._send_error(404, 'Item not found.')
+        self.drive.remove(node)
+        self._send(204)
+
+
+class RequestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    # noinspection PyAttributeOutsideInit
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def record(self, method, bytes_sent=0, bytes_received=0):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.bytes_sent += bytes_sent
+            self.bytes_received += bytes_received
+
+    def dump(self):
+        with self._lock:
+            return {'requests': dict(self.requests), 'total_requests': sum(self.requests.values()),
+                    'bytes_downloaded': self.bytes_sent, 'bytes_uploaded': self.bytes_received}
+
+
+class FakeOneDriveServer:
+    """
+    Serve a FakeDrive on a local port in a daemon thread. Point DriveObject.drive_uri to api_uri to use it.
+    """
+
+    def __init__(self, drive=None, host='127.0.0.1', port=0, copy_polls=1):
+        """
+        :param FakeDrive | None drive: (Optional) The tree to serve.
+        :param int copy_polls: (Optional) Number of "in progress" answers of a copy monitor before the copy is done.
+        """
+        self.drive = drive if drive is not None else FakeDrive()
+        self._server = _FakeOneDriveHTTPServer((host, port), FakeOneDriveHandler)
+        self._server.drive = self.drive
+        self._server.stats = RequestStats()
+        self._server.upload_sessions = {}
+        self._server.copy_jobs = {}
+        self._server.copy_polls = copy_polls
+        self._server.tokens = itertools.count(1)
+        self._server.base_url = 'http://%s:%d' % self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='FakeOneDriveServer', daemon=True)
+
+    @property
+    def stats(self):
+        """
+        :rtype: RequestStats
+        """
+        return self._server.stats
+
+    @property
+    def api_uri(self):
+        return self._server.base_url + '/v1.0'
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -17,10 +17,15 @@ __status__ = "Development"
 __updated__ = "2015-08-08"
 __version__ = "2.0.0.dev1"
 
+import time
+
+# Read by the daemon to time its imports when asked to profile its startup.
+LOAD_TIME = time.perf_counter()
+
 import os
 import pkgutil
 from calendar import timegm
-from datetime import datetime
+from datetime import datetime, timedelta
 from pwd import getpwnam, getpwuid
 from ciso8601 import parse_datetime
 
@@ -46,8 +51,33 @@ def get_current_os_user():
     return user_uid, user_name, user_home, user_gid
 
 
-OS_USER_ID, OS_USER_NAME, OS_USER_HOME, OS_USER_GID = get_current_os_user()
+def get_os_user():
+    """
+    Same as get_current_os_user(), but looked up on the first call only rather than at import, because the password
+    database lookup may be slow (e.g., over LDAP) and most importers never need it.
+    :rtype: (int, str, str, int)
+    """
+    if not hasattr(get_os_user, '_os_user'):
+        setattr(get_os_user, '_os_user', get_current_os_user())
+    return getattr(get_os_user, '_os_user')
+
+
+def get_os_user_name():
+    """
+    :rtype: str
+    """
+    return get_os_user()[1]
+
+
+def get_os_user_home():
+    """
+    :rtype: str
+    """
+    return get_os_user()[2]
+
+
 OS_HOSTNAME = os.uname()[1]
+EPOCH = datetime(1970, 1, 1)
 
 
 def datetime_to_str(d):
@@ -83,6 +113,39 @@ def timestamp_to_datetime(t):
     return datetime.utcfromtimestamp(t)
 
 
+def datetime_to_ns(d):
+    """
+    :param datetime.datetime d: A UTC datetime object.
+    :return int: An equivalent UNIX timestamp in nanoseconds.
+    """
+    return (timegm(d.utctimetuple()) * 1000000 + d.microsecond) * 1000
+
+
+def ns_to_datetime(t):
+    """
+    Convert a UNIX timestamp in nanoseconds to a datetime object. Sub-microsecond part is truncated.
+    :param int t: A UNIX timestamp in nanoseconds.
+    :return datetime.datetime: An equivalent datetime object.
+    """
+    return EPOCH + timedelta(microseconds=t // 1000)
+
+
+def compare_timestamps_ns(t1, t2, tolerance=1000000):
+    """
+    Compare two UNIX timestamps in nanoseconds. Differences within tolerance (default 1ms) are ignored.
+    :param int t1:
+    :param int t2:
+    :param int tolerance:
+    :return int: 1 if t1 is later than t2, -1 if earlier, 0 otherwise.
+    """
+    if t1 - t2 > tolerance:
+        return 1
+    elif t2 - t1 > tolerance:
+        return -1
+    else:
+        return 0
+
+
 def compare_timestamps(t1, t2):
     if t1 - t2 > 0.001:
         return 1
@@ -107,5 +170,6 @@ def get_content(file_name, pkg_name='onedrive_d', is_text=True):
 
 
 def mkdir(path):
+    user_id, _, _, group_id = _load_os_user()
     os.makedirs(path, mode=0o700)
-    os.chown(path, OS_USER_ID, OS_USER_GID)
+    os.chown(path, user_id, group_id)
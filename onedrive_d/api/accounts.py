@@ -2,14 +2,17 @@
 Account types of OneDrive API. Each account has its own session tokens and a managed REST client.
 """
 
-import json
+import threading
 import time
 from urllib import parse
 
 import requests
 
+from onedrive_d.api import errors
 from onedrive_d.api import resources
 from onedrive_d.api import restapi
+from onedrive_d.common import json_codec
+from onedrive_d.common import logger_factory
 
 
 def get_personal_account(client, code=None, uri=None):
@@ -37,7 +40,7 @@ def get_personal_account(client, code=None, uri=None):
     response = requests.post(client.OAUTH_TOKEN_URI, data=params, proxies=client.proxies)
     if response.status_code != requests.codes.ok:
         raise ValueError('The authentication code is not valid.')
-    account = PersonalAccount(client, response.json())
+    account = PersonalAccount(client, json_codec.load_response(response))
     return account
 
 
@@ -73,6 +76,9 @@ class PersonalAccount:
         if expires_at is None:
             expires_at = time.time() + session_info['expires_in']
         self.expires_at = expires_at
+        self._renew_lock = threading.Lock()
+        # Set to an onedrive_d.store.account_db.TokenStore to share tokens with other processes.
+        self.token_store = None
         self.session = restapi.ManagedRESTClient(
             session=requests.Session(), account=self, proxies=client.proxies, net_mon=client.net_monitor)
         self.load_session(session_info)
@@ -103,7 +109,27 @@ class PersonalAccount:
         self.scope = session_info['scope'].split(' ')
         self.session.session.headers['Authorization'] = 'Bearer ' + session_info['access_token']
 
-    def renew_tokens(self):
+    def renew_tokens(self, expired_token=None):
+        """
+        Renew the access token. Only one renewal runs at a time; concurrent callers wait for it to finish. With a token
+        store, renewals are also serialized across processes, and tokens another process renewed are taken instead.
+        :param str | None expired_token: (Optional) The access token the caller found expired. If another thread has
+        replaced it by the time the caller gets its turn, return without sending another renewal request.
+        """
+        with self._renew_lock:
+            if expired_token is not None and expired_token != self.access_token:
+                return
+            if self.token_store is None:
+                self._request_tokens()
+                return
+            with self.token_store.lock():
+                # The refresh token of this process is used up if another process renewed the tokens.
+                if self.token_store.reload_tokens(self):
+                    return
+                self._request_tokens()
+                self.token_store.save_tokens(self)
+
+    def _request_tokens(self):
         params = {
             'client_id': self.client.client_id,
             'client_secret': self.client.client_secret,
@@ -111,8 +137,8 @@ class PersonalAccount:
             'refresh_token': self.refresh_token,
             'grant_type': 'refresh_token'
         }
-        request = self.session.post(self.client.OAUTH_TOKEN_URI, data=params,  auto_renew=False)
-        session_info = request.json()
+        request = self.session.post(self.client.OAUTH_TOKEN_URI, data=params, auto_renew=False)
+        session_info = json_codec.load_response(request)
         self.expires_at = time.time() + session_info['expires_in']
         self.load_session(session_info)
 
@@ -127,7 +153,7 @@ class PersonalAccount:
         :return onedrive_d.resources.UserProfile: Profile of the target user.
         """
         request = self.session.get('https://apis.live.net/v5.0/' + account_id)
-        return resources.UserProfile(request.json())
+        return resources.UserProfile(json_codec.load_response(request))
 
     def dump(self):
         """
@@ -143,7 +169,7 @@ class PersonalAccount:
             'expires_at': self.expires_at,
             self.VERSION_KEY: self.VERSION_VALUE
         }
-        return json.dumps(data)
+        return json_codec.dumps(data)
 
     @classmethod
     def load(cls, client, s):
@@ -153,7 +179,7 @@ class PersonalAccount:
         :param str s: A string returned by a dump() call.
         :return onedrive_d.api.accounts.PersonalAccount: A deserialized account object.
         """
-        data = json.loads(s)
+        data = json_codec.loads(s)
         if cls.VERSION_KEY not in data:
             raise ValueError('Unsupported serialization data format.')
         if data[cls.VERSION_KEY] != cls.VERSION_VALUE:
@@ -161,6 +187,112 @@ class PersonalAccount:
         return PersonalAccount(client=client, session_info=data['session_info'], expires_at=data['expires_at'])
 
 
+class TokenRefresher(threading.Thread):
+    """
+    A daemon thread that renews the tokens of registered accounts shortly before they expire, so that worker threads
+    rarely run into expired tokens.
+    """
+
+    THREAD_NAME = 'token_refresher'
+    RENEW_AHEAD_SECONDS = 300
+    RETRY_DELAY_SECONDS = 60
+    MAX_RETRY_DELAY_SECONDS = 1800
+    logger = logger_factory.get_logger(__name__)
+
+    def __init__(self, renew_ahead_sec=RENEW_AHEAD_SECONDS, retry_delay_sec=RETRY_DELAY_SECONDS,
+                 max_retry_delay_sec=MAX_RETRY_DELAY_SECONDS):
+        """
+        :param int renew_ahead_sec: (Optional) Amount of seconds before expiration to renew the tokens.
+        :param int retry_delay_sec: (Optional) Amount of seconds to wait before retrying a failed renewal.
+        :param int max_retry_delay_sec: (Optional) Upper bound of the retry delay, which doubles after each failure.
+        """
+        super().__init__()
+        self.name = self.THREAD_NAME
+        self.daemon = True
+        self.renew_ahead = renew_ahead_sec
+        self.retry_delay = retry_delay_sec
+        self.max_retry_delay = max(retry_delay_sec, max_retry_delay_sec)
+        self._accounts = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add_account(self, account):
+        """
+        :param PersonalAccount account: The account whose tokens will be renewed.
+        """
+        with self._cond:
+            # Account, the earliest time to renew it at, and the number of renewals of it that failed in a row.
+            self._accounts[id(account)] = (account, 0, 0)
+            self._cond.notify()
+
+    def remove_account(self, account):
+        with self._cond:
+            self._accounts.pop(id(account), None)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def get_next_renewal(self):
+        """
+        :return (PersonalAccount | None, float): The account to renew next and the timestamp to renew it at.
+        """
+        next_account, next_time = None, None
+        for account, retry_at, _ in self._accounts.values():
+            t = max(account.expires_at - self.renew_ahead, retry_at)
+            if next_time is None or t < next_time:
+                next_account, next_time = account, t
+        return next_account, next_time
+
+    def renew(self, account):
+        """
+        :param PersonalAccount account: The account whose tokens are about to expire.
+        :return True | False: True if the tokens were renewed.
+        """
+        try:
+            account.renew_tokens(expired_token=account.access_token)
+            self.logger.info('Renewed tokens. New tokens expire at %d.', account.expires_at)
+            return True
+        except errors.OneDriveError as e:
+            self.logger.error('Failed to renew tokens: %s.', e)
+        except Exception:
+            # Network and decoding errors, among others, must not end the thread, or tokens would silently expire.
+            self.logger.exception('Unexpected error while renewing tokens.')
+        return False
+
+    def get_retry_delay(self, failures):
+        """
+        :param int failures: Number of renewals of an account that failed in a row.
+        :return int: Amount of seconds to wait before the next renewal of the account.
+        """
+        if failures == 0:
+            return self.retry_delay
+        return min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    account, renew_at = self.get_next_renewal()
+                    delay = None if account is None else renew_at - time.time()
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+            renewed = self.renew(account)
+            with self._cond:
+                entry = self._accounts.get(id(account))
+                if entry is not None:
+                    failures = 0 if renewed else entry[2] + 1
+                    delay = self.get_retry_delay(failures)
+                    if failures > 0:
+                        self.logger.info('Retry renewing tokens in %d seconds.', delay)
+                    # Never attempt the same account more often than once per retry delay.
+                    self._accounts[id(account)] = (account, time.time() + delay, failures)
+
+
 class BusinessAccount:
     """Abstraction of an OneDrive Business account type."""
 
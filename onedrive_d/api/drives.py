@@ -4,16 +4,19 @@ accesses a file, and a "*item" call accesses either a directory or a file.
 https://github.com/OneDrive/onedrive-api-docs#root-resources
 """
 
-import json
-
 import requests
 
 from onedrive_d.api import facets
 from onedrive_d.api import items
 from onedrive_d.api import options
 from onedrive_d.api import resources
+from onedrive_d.common import json_codec
 from onedrive_d.common import logger_factory
 from onedrive_d.common import drive_config
+from onedrive_d.common import metrics
+
+TRANSFER_BYTES = metrics.counter('onedrived_transfer_bytes_total', 'Bytes of file content transferred.',
+                                 ['direction'])
 
 
 class DriveRoot:
@@ -43,7 +46,7 @@ class DriveRoot:
         uri = self.account.client.API_URI + '/drives'
         request = self.account.session.get(uri)
         all_drives = {d['id']: DriveObject(self, d, drive_config.DriveConfig.default_config())
-                      for d in request.json()['value']}
+                      for d in json_codec.load_response(request)['value']}
         return all_drives
 
     def get_default_drive(self):
@@ -70,7 +73,7 @@ class DriveRoot:
         if drive_id is not None:
             uri = uri + 's/' + drive_id
         request = self.account.session.get(uri)
-        d = DriveObject(self, request.json(), drive_config.DriveConfig.default_config())
+        d = DriveObject(self, json_codec.load_response(request), drive_config.DriveConfig.default_config())
         self._cached_drives[d.drive_id] = d
         return d
 
@@ -167,7 +170,7 @@ class DriveObject:
         if list_children:
             uri += '?expand=children'
         request = self.root.account.session.get(uri)
-        return items.OneDriveItem(self, request.json())
+        return items.OneDriveItem(self, json_codec.load_response(request))
 
     def get_children(self, item_id=None, item_path=None):
         """
@@ -181,7 +184,7 @@ class DriveObject:
             uri += ':'
         uri += '/children'
         request = self.root.account.session.get(uri)
-        return items.ItemCollection(self, request.json())
+        return items.ItemCollection(self, json_codec.load_response(request))
 
     def create_dir(self, name, parent_id=None, parent_path=None,
                    conflict_behavior=options.NameConflictBehavior.DEFAULT):
@@ -200,7 +203,7 @@ class DriveObject:
         }
         uri = self.get_item_uri(parent_id, parent_path) + '/children'
         request = self.root.account.session.post(uri, json=data, ok_status_code=requests.codes.created)
-        return items.OneDriveItem(self, request.json())
+        return items.OneDriveItem(self, json_codec.load_response(request))
 
     def upload_file(self, filename, data, size, parent_id=None, parent_path=None,
                     conflict_behavior=options.NameConflictBehavior.REPLACE):
@@ -215,7 +218,9 @@ class DriveObject:
         :rtype: onedrive_d.api.items.OneDriveItem
         """
         if size <= self.config.max_put_size_bytes:
-            return self.put_file(filename, data, parent_id, parent_path, conflict_behavior)
+            item = self.put_file(filename, data, parent_id, parent_path, conflict_behavior)
+            TRANSFER_BYTES.labels(direction='upload').inc(size)
+            return item
         else:
             return self.put_large_file(filename, data, size, parent_id, parent_path, conflict_behavior)
 
@@ -230,7 +235,8 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
-        :rtype: onedrive_d.api.items.OneDriveItem
+        :return onedrive_d.api.items.OneDriveItem | None: The uploaded item, if the server returns it with the last
+        fragment.
         """
         # Create an upload session.
         if parent_id is not None:
@@ -241,9 +247,10 @@ class DriveObject:
             payload['item']['@name.conflictBehavior'] = conflict_behavior
         size_str = str(size)
         request = self.root.account.session.post(uri, json=payload)
-        current_session = resources.UploadSession(request.json())
+        current_session = resources.UploadSession(json_codec.load_response(request))
 
         # Upload content.
+        item = None
         expected_ranges = [(0, size - 1)]  # Use local value rather than that given in session.
         while len(expected_ranges) > 0:  # Ranges must come in order
             f, t = expected_ranges.pop(0)  # Both inclusive
@@ -258,11 +265,18 @@ class DriveObject:
             headers = {
                 'Content-Range': str(f) + '-' + str(t) + '/' + size_str
             }
+            # The server answers the last fragment with the item it created or replaced.
             request = self.root.account.session.put(current_session.upload_url, data=chunk, headers=headers,
-                                                    ok_status_code=requests.codes.accepted)
-            current_session.update(request.json())
+                                                    ok_status_code={requests.codes.accepted, requests.codes.created,
+                                                                    requests.codes.ok})
+            TRANSFER_BYTES.labels(direction='upload').inc(len(chunk))
+            if request.status_code == requests.codes.accepted:
+                current_session.update(json_codec.load_response(request))
+            else:
+                item = items.OneDriveItem(self, json_codec.load_response(request))
             # TODO: handle timeout error
             # https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md#request-upload-status
+        return item
 
     def put_file(self, filename, data, parent_id=None, parent_path=None,
                  conflict_behavior=options.NameConflictBehavior.REPLACE):
@@ -281,7 +295,7 @@ class DriveObject:
         if conflict_behavior != options.NameConflictBehavior.REPLACE:
             uri += '?@name.conflictBehavior=' + conflict_behavior
         request = self.root.account.session.put(uri, data=data, ok_status_code=requests.codes.created)
-        return items.OneDriveItem(self, request.json())
+        return items.OneDriveItem(self, json_codec.load_response(request))
 
     def download_file(self, file, size, item_id=None, item_path=None):
         """
@@ -320,6 +334,7 @@ class DriveObject:
             headers = {'Range': 'bytes=%d-%d' % range_bytes}
             ok_status_code = requests.codes.partial
         request = self.root.account.session.get(uri, headers=headers, ok_status_code=ok_status_code)
+        TRANSFER_BYTES.labels(direction='download').inc(len(request.content))
         if file is not None:
             file.write(request.content)
         else:
@@ -367,7 +382,7 @@ class DriveObject:
             raise ValueError('Nothing is to change.')
         uri = self.get_item_uri(item_id, item_path)
         request = self.root.account.session.patch(uri, data)
-        return items.OneDriveItem(self, request.json())
+        return items.OneDriveItem(self, json_codec.load_response(request))
 
     def copy_item(self, dest_reference, item_id=None, item_path=None, new_name=None):
         """
@@ -390,7 +405,9 @@ class DriveObject:
         if new_name is not None:
             data['name'] = new_name
         headers = {'Prefer': 'respond-async'}
-        request = self.root.account.session.post(uri, json=data, headers=headers)
+        # The server accepts the job with 202 and a monitor URL in Location.
+        request = self.root.account.session.post(uri, json=data, headers=headers,
+                                                 ok_status_code={requests.codes.accepted, requests.codes.ok})
         return resources.AsyncCopySession(self, request.headers)
 
     def get_thumbnail(self):
@@ -410,7 +427,7 @@ class DriveObject:
             params['select'] = ','.join(select)
         uri = self.get_item_uri(item_id, item_path) + '/view.search'
         request = self.root.account.session.get(uri, params=params)
-        return items.ItemCollection(self, request.json())
+        return items.ItemCollection(self, json_codec.load_response(request))
 
     def get_changes(self):
         raise NotImplementedError('The API feature is not used yet.')
@@ -424,11 +441,11 @@ class DriveObject:
             'data': self._data,
             self.VERSION_KEY: self.VERSION_VALUE
         }
-        return json.dumps(data)
+        return json_codec.dumps(data)
 
     @classmethod
     def load(cls, drive_root, account_id, account_type, s):
-        data = json.loads(s)
+        data = json_codec.loads(s)
         drive = DriveObject(drive_root, data['data'], drive_config.DriveConfig.load(data['config_dump']))
         try:
             drive_root.add_cached_drive(account_id, account_type, drive)
@@ -27,6 +27,7 @@ class OneDriveServerInternalError(OneDriveError):
 
 
 class OneDriveRecoverableError(Exception):
-    def __init__(self, retry_after_seconds):
+    def __init__(self, retry_after_seconds, status_code=None):
         super().__init__()
         self.retry_after_seconds = retry_after_seconds
+        self.status_code = status_code
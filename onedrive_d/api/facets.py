@@ -18,12 +18,17 @@ class FileSystemInfoFacet:
     https://github.com/OneDrive/onedrive-api-docs/blob/master/facets/filesysteminfo_facet.md
     """
 
+    __slots__ = ('data', '_created_time', '_modified_time')
+
     def __init__(self, data=None, created_time=None, modified_time=None):
         """
-        :param dict[str, str] | None data: A JSON dictionary of FileSystemInfoFacet.
+        :param dict[str, str] | None data: A JSON dictionary of FileSystemInfoFacet. Timestamps in it are parsed on
+        first access.
         :param datetime.datetime | None created_time: A datetime object for creation time.
         :param datetime.datetime | None modified_time: A datetime object for last modification time.
         """
+        self._created_time = None
+        self._modified_time = None
         if data is None:
             self.data = {}
             if created_time is not None:
@@ -31,8 +36,6 @@ class FileSystemInfoFacet:
             if modified_time is not None:
                 self.set_datetime('_modified_time', 'lastModifiedDateTime', modified_time)
         else:
-            self._created_time = str_to_datetime(data['createdDateTime'])
-            self._modified_time = str_to_datetime(data['lastModifiedDateTime'])
             self.data = data
 
     def set_datetime(self, prop, key, value):
@@ -45,19 +48,26 @@ class FileSystemInfoFacet:
         setattr(self, prop, value)
         self.data[key] = datetime_to_str(value)
 
+    def _get_datetime(self, prop, key):
+        value = getattr(self, prop)
+        if value is None and key in self.data:
+            value = str_to_datetime(self.data[key])
+            setattr(self, prop, value)
+        return value
+
     @property
     def created_time(self):
         """
         :rtype: datetime.datetime
         """
-        return self._created_time
+        return self._get_datetime('_created_time', 'createdDateTime')
 
     @property
     def modified_time(self):
         """
         :rtype: datetime.datetime
         """
-        return self._modified_time
+        return self._get_datetime('_modified_time', 'lastModifiedDateTime')
 
 
 class HashFacet:
@@ -69,6 +79,8 @@ class HashFacet:
     https://github.com/OneDrive/onedrive-api-docs/blob/master/facets/hashes_facet.md
     """
 
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         if 'crc32Hash' not in data:
             data['crc32Hash'] = None
@@ -99,6 +111,8 @@ class FileFacet:
     https://github.com/OneDrive/onedrive-api-docs/blob/master/facets/file_facet.md
     """
 
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -122,6 +136,8 @@ class ImageFacet:
     https://github.com/OneDrive/onedrive-api-docs/blob/master/facets/image_facet.md
     """
 
+    __slots__ = ('height', 'width')
+
     def __init__(self, data):
         """
         :param dict[str, int] data: A dictionary representing the dimension of the image
@@ -135,6 +151,8 @@ class PhotoFacet:
     https://github.com/OneDrive/onedrive-api-docs/blob/master/facets/photo_facet.md
     """
 
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -204,6 +222,8 @@ class PhotoFacet:
 
 
 class FolderFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -217,6 +237,8 @@ class FolderFacet:
 
 
 class AudioFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -350,6 +372,8 @@ class AudioFacet:
 
 
 class VideoFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -391,11 +415,15 @@ class DeletedFacet:
     Indicates that the item on OneDrive has been deleted. OneDrive API v1.0 has no properties in it.
     """
 
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
 
 class QuotaFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -441,6 +469,8 @@ class QuotaFacet:
 
 
 class LocationFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         """
         :param dict[str, float] data: JSON deserialized location facet dict.
@@ -470,6 +500,8 @@ class LocationFacet:
 
 
 class SharingLinkFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -525,6 +557,8 @@ class SharingLinkFacet:
 
 
 class PermissionFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -579,6 +613,8 @@ class PermissionFacet:
 
 
 class SpecialFolderFacet:
+    __slots__ = ('_data',)
+
     def __init__(self, data):
         self._data = data
 
@@ -1,6 +1,10 @@
+import collections
+import threading
+
 from onedrive_d import str_to_datetime
 from onedrive_d.api import resources
 from onedrive_d.api import facets
+from onedrive_d.common import json_codec
 
 
 class OneDriveItemTypes:
@@ -14,6 +18,9 @@ class OneDriveItemTypes:
 
 
 class ItemCollection:
+    PREFETCH_THREAD_NAME = 'item_collection_prefetch'
+    LOOK_AHEAD_PAGES = 2
+
     def __init__(self, drive, data):
         self._drive = drive
         self._data = data
@@ -33,12 +40,86 @@ class ItemCollection:
         """
         if self._page_count > 0:
             request = self._drive.root.account.session.get(self._data['@odata.nextLink'])
-            self._data = request.json()
+            self._data = json_codec.load_response(request)
         self._page_count += 1
         return [OneDriveItem(self._drive, d) for d in self._data['value']]
 
+    def iter_pages(self, look_ahead=LOOK_AHEAD_PAGES):
+        """
+        Iterate over the remaining pages. While the caller processes one page, the following pages are fetched by a
+        background thread, so that network round trips overlap with local work. No thread is started for a collection
+        of one page.
+        :param int look_ahead: (Optional) Max number of fetched pages waiting to be consumed. 0 fetches each page
+        only when it is asked for, like get_next().
+        :return collections.Iterable[[onedrive_d.api.items.OneDriveItem]]: A generator of pages. Errors raised when
+        fetching a page are re-raised in the consuming thread.
+        """
+        if look_ahead < 1:
+            while self.has_next:
+                yield self.get_next()
+            return
+        first_page = None
+        if self._page_count == 0:
+            # The first page is already here. Most collections have no other page.
+            first_page = self.get_next()
+            if not self.has_next:
+                yield first_page
+                return
+        pages = collections.deque()
+        cond = threading.Condition()
+        stopped = False
+
+        def put(entry):
+            with cond:
+                # Give up if the consumer went away so that the thread does not block forever on a full buffer.
+                while len(pages) >= look_ahead and not stopped:
+                    cond.wait()
+                if stopped:
+                    return False
+                pages.append(entry)
+                cond.notify_all()
+                return True
+
+        def fetch():
+            try:
+                while self.has_next:
+                    if not put((self.get_next(), None)):
+                        return
+            except Exception as e:
+                put((None, e))
+                return
+            put((None, None))
+
+        fetcher = threading.Thread(target=fetch, name=self.PREFETCH_THREAD_NAME)
+        fetcher.daemon = True
+        fetcher.start()
+        try:
+            if first_page is not None:
+                yield first_page
+            while True:
+                with cond:
+                    while len(pages) == 0:
+                        cond.wait()
+                    page, error = pages.popleft()
+                    cond.notify_all()
+                if error is not None:
+                    raise error
+                if page is None:
+                    return
+                yield page
+        finally:
+            with cond:
+                stopped = True
+                cond.notify_all()
+
 
 class OneDriveItem:
+    # Listing a large folder creates one object per child, so keep instances free of __dict__. Facets are built on
+    # first access and cached in their slots.
+    __slots__ = ('drive', '_data', '_type', '_fs_info', '_parent_reference', '_children', '_folder_props',
+                 '_file_props', '_image_props', '_photo_props', '_audio_props', '_video_props', '_location_props',
+                 '_deleted_props', '_special_folder_props')
+
     def __init__(self, drive, data):
         """
         :param onedrive_d.api.drives.DriveObject drive: The parent drive object.
@@ -46,10 +127,11 @@ class OneDriveItem:
         """
         self.drive = drive
         self._data = data
-        if 'fileSystemInfo' in data:
-            self._fs_info = facets.FileSystemInfoFacet(data['fileSystemInfo'])
-        else:
-            self._fs_info = None
+        self._type = None
+        for t in OneDriveItemTypes.ALL:
+            if t in data:
+                self._type = t
+                break
 
     @property
     def id(self):
@@ -63,16 +145,14 @@ class OneDriveItem:
         """
         :return True | False: True if the item is a folder; False if the item is a file (image, audio, ..., inclusive).
         """
-        return OneDriveItemTypes.FOLDER in self._data
+        return self._type == OneDriveItemTypes.FOLDER
 
     @property
     def type(self):
         """
         :rtype: str
         """
-        for x in OneDriveItemTypes.ALL:
-            if x in self._data:
-                return x
+        return self._type
 
     @property
     def name(self):
@@ -124,13 +204,12 @@ class OneDriveItem:
         return self._data['size']
 
     def _get_prop(self, prop, key, type):
-        if not hasattr(self, prop):
-            if key not in self._data:
-                v = None
-            else:
-                v = type(self._data[key])
+        try:
+            return getattr(self, prop)
+        except AttributeError:
+            v = type(self._data[key]) if key in self._data else None
             setattr(self, prop, v)
-        return getattr(self, prop)
+            return v
 
     @property
     def parent_reference(self):
@@ -155,10 +234,11 @@ class OneDriveItem:
 
     @property
     def children(self):
-        if not hasattr(self, '_children'):
-            # noinspection PyAttributeOutsideInit
+        try:
+            return self._children
+        except AttributeError:
             self._children = {d['id']: OneDriveItem(self.drive, d) for d in self._data['children']}
-        return self._children
+            return self._children
 
     @property
     def file_props(self):
@@ -221,15 +301,16 @@ class OneDriveItem:
         """
         :return facets.FileSystemInfoFacet:
         """
-        return self._fs_info
+        return self._get_prop('_fs_info', 'fileSystemInfo', facets.FileSystemInfoFacet)
 
     @property
     def created_time(self):
         """
         :rtype: int
         """
-        if self._fs_info is not None:
-            return self._fs_info.created_time
+        fs_info = self.fs_info
+        if fs_info is not None:
+            return fs_info.created_time
         return str_to_datetime(self._data['createdDateTime'])
 
     @property
@@ -237,6 +318,7 @@ class OneDriveItem:
         """
         :rtype: int
         """
-        if self._fs_info is not None:
-            return self._fs_info.modified_time
+        fs_info = self.fs_info
+        if fs_info is not None:
+            return fs_info.modified_time
         return str_to_datetime(self._data['lastModifiedDateTime'])
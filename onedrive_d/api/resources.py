@@ -1,9 +1,8 @@
 __author__ = 'xb'
 
-import json
-
 from onedrive_d import str_to_datetime
 from onedrive_d.api import options
+from onedrive_d.common import json_codec
 
 
 class UserProfile:
@@ -56,7 +55,7 @@ class UserProfile:
         return self._data['name']
 
     def dump(self):
-        return json.dumps({'data': self._data, self.VERSION_KEY: self.VERSION_VALUE})
+        return json_codec.dumps({'data': self._data, self.VERSION_KEY: self.VERSION_VALUE})
 
     @classmethod
     def load(cls, s):
@@ -64,7 +63,7 @@ class UserProfile:
         :param str s: Some value previously returned by dump() call.
         :rtype: onedrive_d.api.resources.UserProfile
         """
-        data = json.loads(s)
+        data = json_codec.loads(s)
         if cls.VERSION_KEY not in data:
             raise ValueError('Unsupported user profile serialization data.')
         if data[cls.VERSION_KEY] != cls.VERSION_VALUE:
@@ -168,14 +167,14 @@ class AsyncCopySession:
     def update_status(self):
         request = self.drive.root.account.session.get(self.url, ok_status_code=self.ACCEPTABLE_STATUS_CODES)
         if request.status_code == 202:
-            data = request.json()
+            data = json_codec.load_response(request)
             self._operation = data['operation']
             self._percentage_complete = data['percentageComplete']
             self._status = data['status']
         elif request.status_code == 200:
             self._percentage_complete = 100
             self._status = options.AsyncOperationStatuses.COMPLETED
-            self._item = self.drive.build_item(request.json())
+            self._item = self.drive.build_item(json_codec.load_response(request))
 
     @property
     def operation(self):
@@ -1,34 +1,164 @@
 """
 A RESTful HTTP wrapper based on requests.Session. It wraps HTTP requests so that when a
 connection error is detected, the caller thread is suspended and managed by
-network monitor.
+network monitor. Requests of one account share a concurrency governor so that all
+worker threads back off together when the server throttles the account.
 """
 
+import re
+import threading
 import time
+from urllib.parse import urlsplit
 
 import requests
 
 from onedrive_d.api import errors
+from onedrive_d.common import json_codec
 from onedrive_d.common import logger_factory
+from onedrive_d.common import metrics
+
+REQUEST_DURATION = metrics.histogram('onedrived_http_request_duration_seconds', 'Latency of HTTP requests.',
+                                     ['method', 'endpoint'])
+RESPONSES = metrics.counter('onedrived_http_responses_total', 'Number of HTTP responses by status code.',
+                            ['method', 'code'])
+RETRIES = metrics.counter('onedrived_http_retries_total', 'Number of HTTP requests retried.', ['reason'])
+
+_ENDPOINT_PATTERNS = [
+    (re.compile(r'/items/[^/:]+'), '/items/{id}'),
+    (re.compile(r':/.*?(:/|:$|$)'), r':/{path}\1'),
+    # Tokens of upload sessions, async job monitors, etc.
+    (re.compile(r'/[^/]{40,}'), '/{token}'),
+]
+
+
+def get_endpoint_label(url):
+    """
+    Reduce a request URL to its endpoint, so that requests of all items share a few metric labels.
+    :param str url:
+    :return str: Host and path of the URL with item IDs, item paths and tokens replaced by placeholders.
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    for pattern, repl in _ENDPOINT_PATTERNS:
+        path = pattern.sub(repl, path)
+    return parts.netloc + path
+
+
+class ConcurrencyGovernor:
+    """
+    Limit the number of in-flight requests of an account with an AIMD (additive increase, multiplicative decrease)
+    policy. The limit is cut by DECREASE_FACTOR when the server throttles the account, and grows by about one
+    request per window of successful requests. While a Retry-After period is in effect, no caller may start a new
+    request.
+    """
+
+    DEFAULT_MIN_LIMIT = 1
+    DEFAULT_MAX_LIMIT = 16
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 1.0
+    logger = logger_factory.get_logger(__name__)
+
+    def __init__(self, min_limit=DEFAULT_MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT, initial_limit=None):
+        """
+        :param int min_limit: (Optional) Lowest number of concurrent requests allowed.
+        :param int max_limit: (Optional) Highest number of concurrent requests allowed.
+        :param int | None initial_limit: (Optional) Starting limit. Default to max_limit.
+        """
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError('Invalid concurrency bounds: [%d, %d].' % (min_limit, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(max_limit if initial_limit is None else initial_limit)
+        self._in_flight = 0
+        self._resume_at = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        :return int: Number of requests allowed to be in flight at the moment.
+        """
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self):
+        """
+        :rtype: int
+        """
+        return self._in_flight
+
+    @property
+    def resume_at(self):
+        """
+        :return float: Timestamp before which no new request should be sent.
+        """
+        return self._resume_at
+
+    def acquire(self):
+        """
+        Block the caller until a pause announced by the server is over and there is a free request slot.
+        """
+        waited_until = None
+        while True:
+            with self._cond:
+                delay = self._resume_at - time.time()
+                # Only wait again if a later pause was announced while the caller was sleeping.
+                if delay <= 0 or waited_until == self._resume_at:
+                    while self._in_flight >= self.limit:
+                        self._cond.wait()
+                    self._in_flight += 1
+                    return
+                waited_until = self._resume_at
+            time.sleep(delay)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        """
+        Additively increase the limit. A full window of successful requests raises the limit by INCREASE_STEP.
+        """
+        with self._cond:
+            if self._limit < self.max_limit:
+                self._limit = min(self.max_limit, self._limit + self.INCREASE_STEP / self._limit)
+                self._cond.notify_all()
+
+    def on_throttled(self, retry_after_seconds):
+        """
+        Multiplicatively decrease the limit and pause all callers for the given amount of seconds.
+        :param int retry_after_seconds: Amount of seconds advertised by the server in Retry-After header.
+        """
+        with self._cond:
+            self._limit = max(self.min_limit, self._limit * self.DECREASE_FACTOR)
+            self._resume_at = max(self._resume_at, time.time() + retry_after_seconds)
+            self.logger.info('Throttled by server. Reduce concurrency limit to %d and pause for %d seconds.',
+                             self.limit, retry_after_seconds)
 
 
 class ManagedRESTClient:
     AUTO_RETRY_SECONDS = 30
     RECOVERABLE_STATUS_CODES = {requests.codes.too_many, 500, 502, 503, 504}
+    THROTTLING_STATUS_CODES = {requests.codes.too_many, requests.codes.unavailable}
     logger = logger_factory.get_logger(__name__)
 
-    def __init__(self, session, net_mon, account, proxies=None):
+    def __init__(self, session, net_mon, account, proxies=None, governor=None):
         """
         :param session: Dictate a requests Session object.
         :param onedrive_d.common.netman.NetworkMonitor net_mon: Network monitor instance.
         :param onedrive_d.api.accounts.PersonalAccount | onedrive_d.api.accounts.BusinessAccount account: Account.
         :param dict[str, str] proxies: (Optional) A dictionary of protocol-host pairs.
+        :param ConcurrencyGovernor | None governor: (Optional) Governor shared by all requests of the account.
         :return: No return value.
         """
         self.session = session
         self.net_mon = net_mon
         self.account = account
         self.proxies = proxies
+        if governor is None:
+            governor = ConcurrencyGovernor()
+        self.governor = governor
 
     def request(self, method, url, params, ok_status_code, auto_renew):
         """
@@ -42,8 +172,19 @@ class ManagedRESTClient:
         :raise errors.OneDriveError:
         """
         while True:
+            access_token = getattr(self.account, 'access_token', None)
             try:
-                request = getattr(self.session, method)(url, **params)
+                self.governor.acquire()
+                start_time = time.monotonic()
+                try:
+                    request = getattr(self.session, method)(url, **params)
+                finally:
+                    self.governor.release()
+                    REQUEST_DURATION.labels(method=method, endpoint=get_endpoint_label(url)).observe(
+                        time.monotonic() - start_time)
+                RESPONSES.labels(method=method, code=request.status_code).inc()
+                if self.net_mon is not None:
+                    self.net_mon.report_success()
                 bad_status = request.status_code != ok_status_code if isinstance(ok_status_code, int) \
                     else request.status_code not in ok_status_code
                 if bad_status:
@@ -54,17 +195,29 @@ class ManagedRESTClient:
                             retry_after_seconds = self.AUTO_RETRY_SECONDS
                         self.logger.info('Server returned code %d which is assumed recoverable. Retry in %d seconds',
                                          request.status_code, retry_after_seconds)
-                        raise errors.OneDriveRecoverableError(retry_after_seconds)
-                    raise errors.OneDriveError(request.json())
+                        raise errors.OneDriveRecoverableError(retry_after_seconds, request.status_code)
+                    raise errors.OneDriveError(json_codec.load_response(request))
+                self.governor.on_success()
                 return request
             except requests.ConnectionError:
-                self.net_mon.suspend_caller()
+                RETRIES.labels(reason='connection_error').inc()
+                if self.net_mon is not None:
+                    self.net_mon.suspend_caller()
+                else:
+                    time.sleep(self.AUTO_RETRY_SECONDS)
             except errors.OneDriveRecoverableError as e:
-                time.sleep(e.retry_after_seconds)
+                if e.status_code in self.THROTTLING_STATUS_CODES:
+                    RETRIES.labels(reason='throttled').inc()
+                    # Subsequent acquire() calls of all threads of this account will wait out the pause.
+                    self.governor.on_throttled(e.retry_after_seconds)
+                else:
+                    RETRIES.labels(reason='server_error').inc()
+                    time.sleep(e.retry_after_seconds)
             except errors.OneDriveTokenExpiredError as e:
                 if auto_renew:
+                    RETRIES.labels(reason='token_expired').inc()
                     self.logger.info('Access token expired. Try refreshing...')
-                    self.account.renew_tokens()
+                    self.account.renew_tokens(expired_token=access_token)
                 else:
                     raise e
 
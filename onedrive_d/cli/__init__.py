@@ -4,20 +4,32 @@ __all__ = ['cli_main', 'cli_worker', 'pref_main']
 import atexit
 import os
 
-from onedrive_d import OS_USER_HOME
+from onedrive_d import get_os_user_home
 from onedrive_d.common import user_config
 from onedrive_d.store import user_config_db
 
-CONFIG_DIR = OS_USER_HOME + '/.onedrived'
-USER_CONF_PATH = CONFIG_DIR + '/user_config.json'
+def get_config_dir():
+    """
+    Derived when asked for rather than at import, because it takes a lookup of the OS user.
+    :return str: The directory holding the configuration and databases of the OS user.
+    """
+    return get_os_user_home() + '/.onedrived'
+
+
+def get_user_conf_path():
+    """
+    :rtype: str
+    """
+    return get_config_dir() + '/user_config.json'
 
 
 def get_current_user_config():
     if not hasattr(get_current_user_config, '_user_conf'):
-        if os.path.exists(USER_CONF_PATH):
-            user_conf = user_config_db.load_user_config(USER_CONF_PATH)
+        user_conf_path = get_user_conf_path()
+        if os.path.exists(user_conf_path):
+            user_conf = user_config_db.load_user_config(user_conf_path)
         else:
             user_conf = user_config.UserConfig(user_config.UserConfig.DEFAULT_CONFIG)
-        atexit.register(user_config_db.save_user_config, USER_CONF_PATH, user_conf)
+        atexit.register(user_config_db.save_user_config, user_conf_path, user_conf)
         setattr(get_current_user_config, '_user_conf', user_conf)
     return getattr(get_current_user_config, '_user_conf')
@@ -6,9 +6,10 @@ import os
 import sys
 import time
 
-from onedrive_d.api import clients
-from onedrive_d.cli import CONFIG_DIR, get_current_user_config
-from onedrive_d.common import logger_factory, netman, tasks, task_worker
+from onedrive_d import LOAD_TIME
+from onedrive_d.api import accounts, clients
+from onedrive_d.cli import get_config_dir, get_current_user_config
+from onedrive_d.common import diagnostics, logger_factory, netman, scan_scheduler, supervisor, tasks, task_worker
 from onedrive_d.store import account_db, drives_db, items_db, task_pool
 
 logger = None
@@ -19,7 +20,17 @@ account_store = None
 drive_store = None
 task_store = None
 item_store_mgr = None
-network_monitor = netman.NetworkMonitor()
+network_monitor = None
+token_refresher = None
+scheduler = None
+refreshed_accounts = set()
+# Keys of the drives this process syncs, or None for all drives. Set in the processes of the multi-process mode.
+drive_keys = None
+
+# How often the supervisor of the multi-process mode looks for added, removed and exited drive processes.
+SUPERVISE_INTERVAL_SECONDS = 5
+# How often to check for drives with directories due for a scan, at most.
+SCAN_CHECK_INTERVAL_SECONDS = 30
 
 
 def parse_args():
@@ -27,13 +38,26 @@ def parse_args():
     argparser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                            default='DEBUG', help='Set the minimum logging level.')
     argparser.add_argument('--log-file', default=None, required=False, help='Store program logs in the specified file.')
+    argparser.add_argument('--metrics-address', default=None, required=False,
+                           help='Serve metrics in Prometheus text format on HOST:PORT, or on a Unix socket if a path '
+                                'is given.')
+    argparser.add_argument('--profile-startup', default=False, action='store_true',
+                           help='Print how long imports and each initialization phase took, up to the first tasks. In '
+                                'multi-process mode, each Drive process prints its own profile.')
+    argparser.add_argument('--multi-process', default=False, action='store_true',
+                           help='Sync each Drive in its own process, restarting processes that exit. Logs of a Drive '
+                                'are appended to the log file name followed by the Drive ID.')
     return argparser.parse_args()
 
 
-def fix_log_args(args):
+def fix_log_args(args, append=False):
+    """
+    :param argparse.Namespace args:
+    :param True | False append: (Optional) If True, keep what the log file holds instead of truncating it.
+    """
     try:
         if args.log_file is not None:
-            with open(args.log_file, 'w'):
+            with open(args.log_file, 'a' if append else 'w'):
                 pass
     except (OSError, IOError) as e:
         print('Cannot open log file "%s": %s. Use stderr.' % (args.log_file, str(e)), file=sys.stderr)
@@ -42,21 +66,33 @@ def fix_log_args(args):
     return args
 
 
+def add_new_accounts():
+    # The account and drive storages hand back the objects already loaded, so only accounts added since the last call
+    # are new to the token refresher.
+    for key, account in account_store.get_all_accounts().items():
+        if key not in refreshed_accounts:
+            token_refresher.add_account(account)
+            refreshed_accounts.add(key)
+
+
 def add_initial_tasks():
     all_drives = drive_store.get_all_drives()
     for key, drive in all_drives.items():
-        # root_item = drive.get_root_dir(list_children=False)
-        # print(root_item._data)
+        if drive_keys is not None and key not in drive_keys:
+            continue
+        # A pass starts once the previous pass of the drive is done and some directory of the drive is due.
+        scan_pass = scheduler.start_pass(key)
+        if scan_pass is None:
+            continue
+        logger.info('Starting scan pass %d of drive %s.', scan_pass.generation, drive.drive_id)
         task_base = tasks.TaskMixin(
             drive=drive, items_store=item_store_mgr.get_item_storage(drive), task_pool=task_store)
-        task = tasks.SynchronizeDirTask(task_base, local_parent_path='', name='')
-        if not task_store.has_pending_task(task_store.get_task_path(task)):
-            task_store.add_task(task)
+        task_store.add_task(tasks.SynchronizeDirTask(task_base, local_parent_path='', name='', scan_pass=scan_pass))
 
 
 def load_item_storage():
     global item_store_mgr
-    item_store_mgr = items_db.ItemStorageManager(CONFIG_DIR)
+    item_store_mgr = items_db.ItemStorageManager(get_config_dir())
 
 
 def load_task_storage():
@@ -64,53 +100,149 @@ def load_task_storage():
     task_store = task_pool.TaskPool.get_instance()
 
 
+def load_scan_scheduler():
+    global scheduler
+    scheduler = scan_scheduler.ScanScheduler(user_conf.deep_sync_interval_seconds,
+                                             user_conf.max_rescan_interval_seconds, user_conf.scan_budget)
+
+
 def load_user_config():
     global personal_client, business_client, user_conf
-    global account_store, drive_store
+    global account_store, drive_store, network_monitor, token_refresher
     user_conf = get_current_user_config()
     user_conf.take_effect()
+    network_monitor = netman.NetworkMonitor()
     network_monitor.start()
     personal_client = clients.PersonalClient(proxies=user_conf.proxies, net_monitor=network_monitor)
     business_client = None
-    account_store = account_db.AccountStorage(CONFIG_DIR + '/accounts.db',
-                                              personal_client=personal_client, business_client=business_client)
-    drive_store = drives_db.DriveStorage(CONFIG_DIR + '/drives.db', account_store)
-    account_store.get_all_accounts()
+    account_keys = None if drive_keys is None else {key[1:] for key in drive_keys}
+    # Processes of the multi-process mode may renew the tokens of the same account.
+    account_db_path = get_config_dir() + '/accounts.db'
+    account_store = account_db.AccountStorage(account_db_path, personal_client=personal_client,
+                                               business_client=business_client, account_keys=account_keys,
+                                               token_store=account_db.TokenStore(account_db_path))
+    drive_store = drives_db.DriveStorage(get_config_dir() + '/drives.db', account_store)
+    token_refresher = accounts.TokenRefresher()
+    add_new_accounts()
+    token_refresher.start()
 
 
 def check_config_dir():
-    if not os.path.isdir(CONFIG_DIR):
-        logger.critical('Configuration directory "%s" does not exist. Please run `onedrived-pref` first.', CONFIG_DIR)
+    config_dir = get_config_dir()
+    if not os.path.isdir(config_dir):
+        logger.critical('Configuration directory "%s" does not exist. Please run `onedrived-pref` first.', config_dir)
         sys.exit(1)
 
 
 def start_task_workers():
-    for i in range(user_conf.num_consumers):
-        t = task_worker.TaskConsumer(task_pool=task_store)
-        t.name = 'Worker' + str(i)
-        t.start()
+    worker_lanes = []
+    for lane, sizes in user_conf.worker_lanes.items():
+        worker_lane = task_worker.WorkerLane(task_store, lane, sizes['min_workers'], sizes['max_workers'])
+        worker_lane.start()
+        worker_lanes.append(worker_lane)
+    task_worker.WorkerLaneScaler(worker_lanes).start()
 
 
 def refill_tasks():
     try:
         while True:
-            logger.info('Refilling initial tasks...')
+            time.sleep(min(SCAN_CHECK_INTERVAL_SECONDS, user_conf.deep_sync_interval_seconds))
+            logger.debug('Looking for drives to scan...')
+            add_new_accounts()
             add_initial_tasks()
-            time.sleep(5 * 60)
     except (KeyboardInterrupt, InterruptedError):
         logger.info('Exiting...')
+        item_store_mgr.flush_all()
         sys.exit(0)
 
 
-def main():
-    global logger
-    args = fix_log_args(parse_args())
+def start_metrics_server(address):
+    # Imported here so that the HTTP stack is only loaded by daemons that serve their metrics.
+    from onedrive_d.common import metrics_server
+    try:
+        server = metrics_server.MetricsServer(address)
+        server.start()
+        logger.info('Serving metrics on "%s".', address)
+    except (OSError, ValueError) as e:
+        logger.error('Cannot serve metrics on "%s": %s.', address, e)
+
+
+def run_drive_worker(drive_key, args):
+    """
+    Entry of a process started by the supervisor in multi-process mode. The process syncs one drive, with its own
+    task pool and workers, and shares the account, drive and item databases with the other processes.
+    :param (str, str, str) drive_key: Key of the drive in the drive storage.
+    :param argparse.Namespace args: Arguments of the supervisor.
+    """
+    global logger, drive_keys
+    supervisor.handle_stop_signals()
+    startup = diagnostics.StartupProfile(LOAD_TIME)
+    startup.mark('imports')
+    drive_keys = {drive_key}
+    if args.log_file is not None:
+        args.log_file = '%s.%s' % (args.log_file, drive_key[0])
+    # The log of a process that exited explains why, so it is kept when the process is restarted.
+    fix_log_args(args, append=True)
     logger = logger_factory.get_logger('Main')
-    check_config_dir()
+    logger.info('Started process %d for drive %s.', os.getpid(), drive_key[0])
+    diagnostics.DiagnosticsSignalHandler(get_config_dir()).install()
+    startup.mark('arguments and logging')
+    start_sync(startup)
+    if args.profile_startup:
+        print('Startup profile of drive %s:\n' % drive_key[0] + startup.format_report(), file=sys.stderr)
+    refill_tasks()
+
+
+def run_supervisor(args):
+    global drive_store
+    if args.metrics_address is not None:
+        logger.warning('Metrics are not served in multi-process mode.')
+    # The supervisor only reads the keys of drives; each drive process loads its drive and account.
+    drive_store = drives_db.DriveStorage(get_config_dir() + '/drives.db', None)
+    drive_processes = supervisor.ProcessSupervisor(run_drive_worker, args=(args,))
+    try:
+        while True:
+            drive_processes.update(drive_store.get_all_drive_keys())
+            time.sleep(SUPERVISE_INTERVAL_SECONDS)
+    except (KeyboardInterrupt, InterruptedError):
+        logger.info('Stopping drive processes...')
+        drive_processes.stop_all()
+        sys.exit(0)
+
+
+def start_sync(startup):
     load_user_config()
+    startup.mark('config and accounts')
     load_item_storage()
     load_task_storage()
+    load_scan_scheduler()
+    startup.mark('storage')
     start_task_workers()
+    startup.mark('workers')
+    logger.info('Adding initial tasks...')
+    add_initial_tasks()
+    startup.mark('initial tasks')
+
+
+def main():
+    global logger
+    startup = diagnostics.StartupProfile(LOAD_TIME)
+    startup.mark('imports')
+    args = fix_log_args(parse_args())
+    logger = logger_factory.get_logger('Main')
+    check_config_dir()
+    startup.mark('arguments and logging')
+    if args.multi_process:
+        run_supervisor(args)
+        return
+    # SIGUSR1 dumps thread stacks and SIGUSR2 profiles the daemon, both to files in the config directory.
+    diagnostics.DiagnosticsSignalHandler(get_config_dir()).install()
+    if args.metrics_address is not None:
+        start_metrics_server(args.metrics_address)
+    startup.mark('diagnostics and metrics')
+    start_sync(startup)
+    if args.profile_startup:
+        print('Startup profile:\n' + startup.format_report(), file=sys.stderr)
     refill_tasks()
 
 
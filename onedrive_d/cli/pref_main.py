@@ -5,27 +5,38 @@ import sys
 
 from clint.textui import colored, columns, indent, prompt, puts, validators
 
-from onedrive_d import OS_USER_NAME, OS_USER_HOME, mkdir
+from onedrive_d import get_os_user_home, get_os_user_name, mkdir
 from onedrive_d.api import accounts, clients
-from onedrive_d.cli import CONFIG_DIR, get_current_user_config
+from onedrive_d.cli import get_config_dir, get_current_user_config
 from onedrive_d.common import drive_config, netman
 from onedrive_d.store import account_db, drives_db
 from onedrive_d.vendor.utils import pretty_print_bytes
 
-try:
-    if not os.path.exists(CONFIG_DIR):
-        mkdir(CONFIG_DIR)
-        print(colored.green('Created path "' + CONFIG_DIR + '".'))
-    user_conf = get_current_user_config()
-    network_monitor = netman.NetworkMonitor()
-    personal_client = clients.PersonalClient(proxies=user_conf.proxies, net_monitor=network_monitor)
-    business_client = None
-    account_store = account_db.AccountStorage(
-        CONFIG_DIR + '/accounts.db', personal_client=personal_client, business_client=business_client)
-    drive_store = drives_db.DriveStorage(CONFIG_DIR + '/drives.db', account_store)
-except Exception as e:
-    print(colored.red('Fatal error: ' + str(e)))
-    sys.exit(1)
+user_conf = None
+network_monitor = None
+personal_client = None
+business_client = None
+account_store = None
+drive_store = None
+
+
+def load_user_config():
+    global user_conf, network_monitor, personal_client, business_client, account_store, drive_store
+    try:
+        config_dir = get_config_dir()
+        if not os.path.exists(config_dir):
+            mkdir(config_dir)
+            print(colored.green('Created path "' + config_dir + '".'))
+        user_conf = get_current_user_config()
+        network_monitor = netman.NetworkMonitor()
+        personal_client = clients.PersonalClient(proxies=user_conf.proxies, net_monitor=network_monitor)
+        business_client = None
+        account_store = account_db.AccountStorage(
+            config_dir + '/accounts.db', personal_client=personal_client, business_client=business_client)
+        drive_store = drives_db.DriveStorage(config_dir + '/drives.db', account_store)
+    except Exception as e:
+        print(colored.red('Fatal error: ' + str(e)))
+        sys.exit(1)
 
 
 def add_personal_account():
@@ -105,7 +116,7 @@ def prompt_drive_config(drive):
     else:
         drive_config_data = drive_config.DriveConfig.DEFAULT_VALUES
     if drive_config_data['local_root'] is None or drive_config_data['local_root'] == '':
-        drive_config_data['local_root'] = OS_USER_HOME + '/OneDrive/' + drive.drive_id
+        drive_config_data['local_root'] = get_os_user_home() + '/OneDrive/' + drive.drive_id
     puts(colored.green('You selected Drive "%s"...' % drive.drive_id))
 
     puts()
@@ -137,6 +148,13 @@ def prompt_drive_config(drive):
     drive_config_data['max_put_size_bytes'] = prompt.query('Maximum size, in KB, for a single upload request?',
                                                            default=str(drive_config_data['max_put_size_bytes'] >> 10),
                                                            validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['weight'] = prompt.query('Share of the workers for this Drive, relative to other Drives with '
+                                               'pending work?', default=str(drive_config_data['weight']),
+                                               validators=[validators.IntegerValidator()])
+    max_concurrent_tasks = prompt.query('Maximum number of tasks of this Drive to run at the same time (0 for no '
+                                        'limit)?', default=str(drive_config_data['max_concurrent_tasks'] or 0),
+                                        validators=[validators.IntegerValidator()])
+    drive_config_data['max_concurrent_tasks'] = max_concurrent_tasks if max_concurrent_tasks > 0 else None
     try:
         while not prompt.yn('Do you have ignore list files specific to this Drive to add?', default='n'):
             ignore_file_path = prompt.query('Path to the ignore list file (hit [Ctrl+C] to skip): ',
@@ -287,7 +305,7 @@ def print_existing_ignore_list_paths():
 def edit_default_ignore_list():
     puts(colored.green('Editing global ignore list files...\n'))
 
-    default_path = OS_USER_HOME + './onedrived/odignore.txt'
+    default_path = get_os_user_home() + './onedrived/odignore.txt'
     if os.path.isfile(default_path) and default_path not in user_conf.default_drive_config.ignore_files:
         puts(colored.yellow('Found factory ignore list file "%s".' % default_path))
         if prompt.yn('Do you want to add this ignore list? '):
@@ -362,12 +380,21 @@ def edit_proxies():
 
 def edit_sync_params():
     puts(colored.green('Editing synchronization workload parameters...\n'))
-    user_conf.num_consumers = prompt.query('Number of worker threads: ',
-                                           default=str(user_conf.num_consumers),
-                                           validators=[validators.IntegerValidator()])
-    user_conf.deep_sync_interval_seconds = prompt.query('Number of seconds to wait before next full scan: ',
+    for lane, sizes in user_conf.worker_lanes.items():
+        for key, desc in (('min_workers', 'Minimum'), ('max_workers', 'Maximum')):
+            sizes[key] = prompt.query('%s number of worker threads for %s tasks: ' % (desc, lane.replace('_', ' ')),
+                                      default=str(sizes[key]), validators=[validators.IntegerValidator()])
+    user_conf.deep_sync_interval_seconds = prompt.query('Number of seconds to wait before rescanning a directory '
+                                                        'that changed: ',
                                                         default=str(user_conf.deep_sync_interval_seconds),
                                                         validators=[validators.IntegerValidator()])
+    user_conf.max_rescan_interval_seconds = prompt.query('Maximum number of seconds to wait before rescanning a '
+                                                         'directory that did not change: ',
+                                                         default=str(user_conf.max_rescan_interval_seconds),
+                                                         validators=[validators.IntegerValidator()])
+    scan_budget = prompt.query('Maximum number of directories to scan in that many seconds (0 for no limit): ',
+                               default=str(user_conf.scan_budget or 0), validators=[validators.IntegerValidator()])
+    user_conf.scan_budget = scan_budget if scan_budget > 0 else None
     puts()
     puts(colored.green('Workload parameters saved.'))
 
@@ -417,8 +444,8 @@ def dispatch_task():
 def print_system_info():
     puts(colored.green('\nSystem Information'))
     items = {
-        'User name': OS_USER_NAME,
-        'Configuration path': CONFIG_DIR,
+        'User name': get_os_user_name(),
+        'Configuration path': get_config_dir(),
     }
     for k, v in items.items():
         puts(columns([k, 30], [v, None]))
@@ -435,6 +462,7 @@ def prompt_task():
 
 
 def main():
+    load_user_config()
     network_monitor.start()
     try:
         prompt_task()
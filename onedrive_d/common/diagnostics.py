@@ -0,0 +1,190 @@
+"""
+Diagnostics of a running daemon, triggered by signals so that nothing runs until asked: SIGUSR1 dumps the stacks of all
+threads, with the task each worker is handling, and SIGUSR2 samples the stacks of all threads for a while and writes
+them in the collapsed format read by flame graph tools (e.g., flamegraph.pl, speedscope). StartupProfile times the
+phases of starting the daemon.
+"""
+
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from onedrive_d.common import logger_factory
+
+logger = logger_factory.get_logger('Diagnostics')
+
+PROFILER_THREAD_NAME = 'SamplingProfiler'
+
+
+def describe_thread(thread):
+    """
+    :param threading.Thread thread:
+    :return str: Name of the thread, and the task it is handling if it is a task worker.
+    """
+    task = getattr(thread, 'current_task', None)
+    if task is None:
+        return thread.name
+    return '%s (%s on "%s")' % (thread.name, task.__class__.__name__, task.local_parent_path + '/' + task.name)
+
+
+def format_thread_stacks():
+    """
+    :return str: Stacks of all threads, most recent call last.
+    """
+    threads = {t.ident: t for t in threading.enumerate()}
+    blocks = []
+    for ident, frame in sys._current_frames().items():
+        thread = threads.get(ident)
+        title = describe_thread(thread) if thread is not None else 'Thread %d' % ident
+        blocks.append('Thread %s:\n%s' % (title, ''.join(traceback.format_stack(frame))))
+    return '\n'.join(blocks)
+
+
+def _frame_label(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def collapse_stack(frame):
+    """
+    :param frame: The innermost frame of a stack.
+    :return str: Functions of the stack, outermost first, joined by ";".
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Sample the stacks of all other threads at a fixed interval for a fixed duration, and write the number of times each
+    stack was seen to a file in collapsed format, i.e., lines of "thread;outer;...;inner count".
+    """
+
+    DURATION_SECONDS = 30
+    INTERVAL_SECONDS = 0.01
+
+    def __init__(self, output_path, duration_sec=DURATION_SECONDS, interval_sec=INTERVAL_SECONDS):
+        """
+        :param str output_path: Path of the file to write the collapsed stacks to.
+        :param float duration_sec: (Optional)
+        :param float interval_sec: (Optional)
+        """
+        super().__init__(name=PROFILER_THREAD_NAME)
+        self.daemon = True
+        self.output_path = output_path
+        self.duration_sec = duration_sec
+        self.interval_sec = interval_sec
+        self.stacks = collections.Counter()
+        self.num_samples = 0
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != self.ident:
+                self.stacks[names.get(ident, str(ident)) + ';' + collapse_stack(frame)] += 1
+        self.num_samples += 1
+
+    def run(self):
+        end_time = time.monotonic() + self.duration_sec
+        while time.monotonic() < end_time:
+            self.sample()
+            time.sleep(self.interval_sec)
+        try:
+            with open(self.output_path, 'w') as f:
+                for stack, count in self.stacks.most_common():
+                    f.write('%s %d\n' % (stack, count))
+            logger.info('Wrote %d samples of collapsed stacks to "%s".', self.num_samples, self.output_path)
+        except (IOError, OSError) as e:
+            logger.error('Cannot write profile to "%s": %s.', self.output_path, e)
+
+
+class StartupProfile:
+    """
+    Wall clock time of the phases of a startup. Each phase lasts from the end of the previous one.
+    """
+
+    def __init__(self, start_time=None):
+        """
+        :param float | None start_time: (Optional) time.perf_counter() value the first phase starts at. Defaults to now.
+        """
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self._last_time = self.start_time
+        self.phases = []
+
+    def mark(self, phase):
+        """
+        End a phase.
+        :param str phase: Name of the phase.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last_time))
+        self._last_time = now
+
+    @property
+    def total_sec(self):
+        return self._last_time - self.start_time
+
+    def format_report(self):
+        """
+        :return str: A table of the phases, with their durations and the time elapsed since the start.
+        """
+        lines = ['%-24s %10s %10s' % ('phase', 'ms', 'total ms')]
+        elapsed = 0
+        for phase, duration in self.phases:
+            elapsed += duration
+            lines.append('%-24s %10.1f %10.1f' % (phase, duration * 1000, elapsed * 1000))
+        return '\n'.join(lines)
+
+
+class DiagnosticsSignalHandler:
+    """
+    Handle SIGUSR1 and SIGUSR2. Output files are named after the time the signal arrived and put in output_dir.
+    """
+
+    def __init__(self, output_dir, profile_duration_sec=SamplingProfiler.DURATION_SECONDS):
+        """
+        :param str output_dir: Directory to write stack dumps and profiles to.
+        :param float profile_duration_sec: (Optional) How long a profile lasts.
+        """
+        self.output_dir = output_dir
+        self.profile_duration_sec = profile_duration_sec
+        self.profiler = None
+
+    def _get_output_path(self, prefix, ext):
+        return '%s/%s-%s-%d.%s' % (self.output_dir, prefix, time.strftime('%Y%m%d-%H%M%S'), os.getpid(), ext)
+
+    def dump_stacks(self, signum=None, frame=None):
+        path = self._get_output_path('stacks', 'txt')
+        try:
+            with open(path, 'w') as f:
+                f.write(format_thread_stacks())
+            logger.info('Dumped thread stacks to "%s".', path)
+        except (IOError, OSError) as e:
+            logger.error('Cannot dump thread stacks to "%s": %s.', path, e)
+        return path
+
+    def start_profile(self, signum=None, frame=None):
+        if self.profiler is not None and self.profiler.is_alive():
+            logger.info('A profile is already running.')
+            return None
+        self.profiler = SamplingProfiler(self._get_output_path('profile', 'collapsed'),
+                                         duration_sec=self.profile_duration_sec)
+        self.profiler.start()
+        logger.info('Started a %d-second profile.', self.profile_duration_sec)
+        return self.profiler
+
+    def install(self):
+        """
+        Register the handlers. Must be called from the main thread. No-op on platforms without SIGUSR1 and SIGUSR2.
+        """
+        if not hasattr(signal, 'SIGUSR1') or not hasattr(signal, 'SIGUSR2'):
+            return
+        signal.signal(signal.SIGUSR1, self.dump_stacks)
+        signal.signal(signal.SIGUSR2, self.start_profile)
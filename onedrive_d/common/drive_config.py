@@ -3,7 +3,6 @@ __author__ = 'xb'
 from copy import deepcopy
 
 from onedrive_d.common import logger_factory
-from onedrive_d.common import path_filter
 
 
 class DriveConfig:
@@ -12,6 +11,8 @@ class DriveConfig:
         'max_put_size_bytes': 524288,
         'local_root': None,
         'ignore_files': set(),
+        'weight': 1,
+        'max_concurrent_tasks': None,
     }
 
     logger = logger_factory.get_logger('DriveConfig')
@@ -64,6 +65,22 @@ class DriveConfig:
         """
         return self.data['local_root']
 
+    @property
+    def weight(self):
+        """
+        Share of the workers the drive gets relative to other drives with queued tasks.
+        :rtype: int | float
+        """
+        return self.data['weight']
+
+    @property
+    def max_concurrent_tasks(self):
+        """
+        Max number of tasks of the drive handled at the same time, or None for no limit.
+        :rtype: int | None
+        """
+        return self.data['max_concurrent_tasks']
+
     @property
     def ignore_files(self):
         """
@@ -75,6 +92,8 @@ class DriveConfig:
     @property
     def path_filter(self):
         if not hasattr(self, '_path_filter'):
+            # Imported on first use so that zgitignore is not loaded until the first sync.
+            from onedrive_d.common.path_filter import PathFilter
             rules = set()
             for path in self.ignore_files:
                 try:
@@ -82,12 +101,12 @@ class DriveConfig:
                         rules.update(f.read().splitlines())
                 except Exception as e:
                     self.logger.error('Failed to load ignore list "%s": %s', path, e)
-            self._path_filter = path_filter.PathFilter(rules)
+            self._path_filter = PathFilter(rules)
         return self._path_filter
 
     def dump(self, exact_dump=False):
         data = {}
-        for key in ['max_get_size_bytes', 'max_put_size_bytes', 'local_root']:
+        for key in ['max_get_size_bytes', 'max_put_size_bytes', 'local_root', 'weight', 'max_concurrent_tasks']:
             if exact_dump or getattr(self, key) != self.DEFAULT_VALUES[key]:
                 data[key] = getattr(self, key)
         ignore_files = [s for s in self.ignore_files if exact_dump or s not in self.DEFAULT_VALUES['ignore_files']]
@@ -0,0 +1,56 @@
+"""
+Make a local copy of a file as cheaply as the file system allows: share the extents with a reflink where supported
+(Btrfs, XFS, ...), copy inside the kernel with copy_file_range, and fall back to a plain user space copy.
+"""
+
+import fcntl
+import os
+import shutil
+
+# _IOW(0x94, 9, int) from linux/fs.h.
+FICLONE = 0x40049409
+
+
+class CloneMethods:
+    REFLINK = 'reflink'
+    COPY_FILE_RANGE = 'copy_file_range'
+    COPY = 'copy'
+
+
+def _reflink(src, dst):
+    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(src, dst):
+    size = os.fstat(src.fileno()).st_size
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+        if n == 0:
+            break
+        copied += n
+
+
+def clone_file(src_path, dst_path):
+    """
+    Copy the content of src_path to dst_path, which is created or truncated. Metadata is not copied.
+    :param str src_path:
+    :param str dst_path:
+    :return str: The method in CloneMethods that did the copy.
+    """
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        try:
+            _reflink(src, dst)
+            return CloneMethods.REFLINK
+        except OSError:
+            pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                _copy_file_range(src, dst)
+                return CloneMethods.COPY_FILE_RANGE
+            except OSError:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst)
+        return CloneMethods.COPY
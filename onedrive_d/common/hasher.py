@@ -1,15 +1,19 @@
+import binascii
 import hashlib
+import struct
 import zlib
 
 
-def hash_value(file_path, block_size=1048576, algorithm=hashlib.sha1()):
+def hash_value(file_path, block_size=1048576, algorithm=None):
     """
     Calculate the MD5 or SHA hash value of the data of the specified file.
     :param str file_path:
     :param int block_size:
-    :param algorithm: A hash function defined in hashlib.
+    :param algorithm: (Optional) A new hash object from hashlib. Defaults to SHA-1.
     :return str:
     """
+    if algorithm is None:
+        algorithm = hashlib.sha1()
     with open(file_path, 'rb') as f:
         while True:
             data = f.read(block_size)
@@ -24,7 +28,7 @@ def crc32_value(file_path, block_size=1048576):
     Calculate the CRC32 value of the data of the specified file.
     :param str file_path:
     :param int block_size:
-    :return int:
+    :return str: The CRC32 value in decimal digits.
     """
     crc = 0
     with open(file_path, 'rb') as f:
@@ -34,3 +38,14 @@ def crc32_value(file_path, block_size=1048576):
                 break
             crc = zlib.crc32(data, crc)
     return str(crc).upper()
+
+
+def crc32_hex_value(file_path, block_size=1048576):
+    """
+    Calculate the CRC32 value of the data of the specified file in the format of the crc32Hash property of OneDrive.
+    :param str file_path:
+    :param int block_size:
+    :return str: The bytes of the CRC32 value in little-endian order, in eight upper-case hexadecimal digits.
+    """
+    crc = int(crc32_value(file_path, block_size))
+    return binascii.hexlify(struct.pack('<I', crc)).decode('ascii').upper()
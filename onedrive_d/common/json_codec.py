@@ -0,0 +1,115 @@
+"""
+JSON encoding and decoding used for API responses and serialized objects. A faster third-party library is used when
+it is installed, otherwise the codec falls back to the standard json module.
+"""
+
+import json
+
+from onedrive_d.common import logger_factory
+
+
+class JsonBackend:
+    def __init__(self, name, loads, dumps):
+        """
+        :param str name: Name of the backend.
+        :param (str | bytes) -> object loads: Decode a JSON document.
+        :param (object) -> str dumps: Encode an object into a JSON string.
+        """
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _get_orjson_backend():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    return JsonBackend('orjson', orjson.loads, dumps)
+
+
+def _get_ujson_backend():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    return JsonBackend('ujson', ujson.loads, dumps)
+
+
+def _get_stdlib_backend():
+    return JsonBackend('json', json.loads, json.dumps)
+
+
+# In order of preference.
+BACKEND_FACTORIES = [('orjson', _get_orjson_backend), ('ujson', _get_ujson_backend), ('json', _get_stdlib_backend)]
+
+logger = logger_factory.get_logger(__name__)
+
+
+def get_available_backends():
+    """
+    :return list[str]: Names of the backends that can be loaded, in order of preference.
+    """
+    names = []
+    for name, factory in BACKEND_FACTORIES:
+        try:
+            factory()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def use_backend(name=None):
+    """
+    Switch the codec to a backend.
+    :param str | None name: (Optional) Name of the backend. If None, use the most preferred one that is installed.
+    :return JsonBackend: The backend now in use.
+    """
+    global _backend
+    for backend_name, factory in BACKEND_FACTORIES:
+        if name is None or name == backend_name:
+            try:
+                _backend = factory()
+                logger.debug('Using JSON backend "%s".', _backend.name)
+                return _backend
+            except ImportError:
+                if name is not None:
+                    raise
+    raise ValueError('Unknown JSON backend "%s".' % name)
+
+
+def get_backend():
+    """
+    :rtype: JsonBackend
+    """
+    return _backend
+
+
+def loads(s):
+    """
+    :param str | bytes s: A JSON document.
+    """
+    return _backend.loads(s)
+
+
+def dumps(obj):
+    """
+    :return str: The compact JSON representation of obj.
+    """
+    return _backend.dumps(obj)
+
+
+def load_response(response):
+    """
+    Decode the body of an HTTP response. Used in place of requests.Response.json(), which always goes through the
+    standard json module.
+    :param requests.Response response:
+    """
+    return _backend.loads(response.content)
+
+
+_backend = None
+use_backend()
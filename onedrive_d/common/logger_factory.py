@@ -4,7 +4,6 @@ Other classes use this class to generate logger.
 
 import atexit
 import logging
-import logging.handlers
 
 _instance = None
 
@@ -16,7 +15,8 @@ def init_logger(min_level=logging.WARNING, path=None, max_bytes=10 << 100):
     _instance.propagate = False
     _instance.setLevel(min_level)
     if path:
-        handler = logging.handlers.RotatingFileHandler(path, 'a', maxBytes=max_bytes)
+        from logging.handlers import RotatingFileHandler
+        handler = RotatingFileHandler(path, 'a', maxBytes=max_bytes)
         _instance.addHandler(handler)
     atexit.register(logging.shutdown)
 
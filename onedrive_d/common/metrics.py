@@ -0,0 +1,242 @@
+"""
+A small registry of counters, gauges and histograms, whose values are rendered in the Prometheus text exposition
+format and served by metrics_server over HTTP on a local address or on a Unix socket. Modules create their metrics at
+import time with counter(), gauge() and histogram(); updating a metric only takes a lock and an addition.
+"""
+
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join('%s="%s"' % (k, v) for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """
+    A metric and its children, one per combination of label values.
+    """
+
+    type = None
+
+    def __init__(self, name, description, label_names=()):
+        """
+        :param str name: Name of the metric.
+        :param str description: Help text of the metric.
+        :param (str) label_names: (Optional) Names of the labels of the metric.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def labels(self, **labels):
+        """
+        :return: The child of the metric for the given label values.
+        """
+        key = tuple(str(labels[n]) for n in self.label_names)
+        try:
+            return self._children[key]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(key, self._new_child())
+
+    def _default_child(self):
+        if len(self.label_names) > 0:
+            raise ValueError('Metric "%s" requires labels %s.' % (self.name, ', '.join(self.label_names)))
+        return self.labels()
+
+    def collect(self):
+        """
+        :return [str]: Sample lines of the metric.
+        """
+        lines = []
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.collect(self.name, self.label_names, key))
+        return lines
+
+    def render(self):
+        return '\n'.join(['# HELP %s %s' % (self.name, self.description), '# TYPE %s %s' % (self.name, self.type)] +
+                         self.collect())
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self.func = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, func):
+        """
+        Read the value from func at collection time instead.
+        :param () -> int | float func:
+        """
+        self.func = func
+
+    def get(self):
+        return self.value if self.func is None else self.func()
+
+    def collect(self, name, label_names, label_values):
+        return ['%s%s %s' % (name, _format_labels(label_names, label_values), _format_value(self.get()))]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child().dec(amount)
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def set_function(self, func):
+        self._default_child().set_function(func)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def collect(self, name, label_names, label_values):
+        lines = []
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (name, _format_labels(label_names, label_values,
+                                                                  ('le', _format_value(bound))), cumulative))
+        labels = _format_labels(label_names, label_values)
+        lines.append('%s_sum%s %s' % (name, labels, _format_value(total_sum)))
+        lines.append('%s_count%s %d' % (name, labels, cumulative))
+        return lines
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        :param [int | float] buckets: (Optional) Upper bounds of the buckets. An infinite bucket is always added.
+        """
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(b for b in buckets if b != float('inf'))) + (float('inf'),)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric to the registry. If a metric of the same name is registered, return that one instead.
+        :param Metric metric:
+        :rtype: Metric
+        """
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+            raise ValueError('Metric "%s" is registered with a different type or labels.' % metric.name)
+        return existing
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """
+        :return str: All metrics in Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return ''.join(m.render() + '\n' for m in metrics)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, description, label_names=(), registry=REGISTRY):
+    """
+    :rtype: Counter
+    """
+    return registry.register(Counter(name, description, label_names))
+
+
+def gauge(name, description, label_names=(), registry=REGISTRY):
+    """
+    :rtype: Gauge
+    """
+    return registry.register(Gauge(name, description, label_names))
+
+
+def histogram(name, description, label_names=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+    """
+    :rtype: Histogram
+    """
+    return registry.register(Histogram(name, description, label_names, buckets))
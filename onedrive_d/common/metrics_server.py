@@ -0,0 +1,69 @@
+"""
+Serve the values of a metrics registry in the Prometheus text exposition format over HTTP.
+"""
+
+import http.server
+import os
+import socketserver
+import threading
+
+from onedrive_d.common.metrics import CONTENT_TYPE
+from onedrive_d.common.metrics import REGISTRY
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are periodic and uninteresting; the address of a Unix socket client is not printable either.
+        pass
+
+
+class _TCPMetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """
+    Serve the metrics of a registry at /metrics in a daemon thread.
+    """
+
+    def __init__(self, address, registry=REGISTRY):
+        """
+        :param str address: "HOST:PORT" to listen on TCP, or a file system path to listen on a Unix socket.
+        :param Registry registry: (Optional)
+        """
+        self.address = address
+        if '/' in address:
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = _UnixMetricsServer(address, MetricsRequestHandler)
+        else:
+            host, port = address.rsplit(':', 1)
+            self._server = _TCPMetricsServer((host, int(port)), MetricsRequestHandler)
+        self._server.registry = registry
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True)
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,10 +1,10 @@
 """
-Monitor thread for network connectivity. It internally holds a queue for
-threads blocked because of network failure.
+Monitor thread for network connectivity. Threads blocked because of network failure
+wait until the monitor detects that the network is back, and are then resumed together.
+The monitor probes the test URI once per outage with exponential backoff, and any
+successful request reported by callers counts as evidence of connectivity.
 """
 
-import queue
-import time
 import threading
 
 import requests
@@ -16,36 +16,60 @@ class NetworkMonitor(threading.Thread):
     THREAD_NAME = "netmon"
     logger = logger_factory.get_logger(__name__)
 
-    def __init__(self, test_uri='https://onedrive.com', retry_delay_sec=30, proxies=None):
+    def __init__(self, test_uri='https://onedrive.com', retry_delay_sec=30, proxies=None, max_retry_delay_sec=300,
+                 probe_timeout_sec=10):
         """
         :param str test_uri: The url to use in testing internet connectivity.
-        :param int retry_delay_sec: The amount of seconds to wait before retry.
+        :param int retry_delay_sec: The amount of seconds to wait before the first retry.
         :param dict[str, str] proxies: A dict of protocol-url pairs.
+        :param int max_retry_delay_sec: (Optional) Upper bound of the retry delay, which doubles after each failure.
+        :param int probe_timeout_sec: (Optional) Timeout in seconds for a single connectivity probe.
         """
         super().__init__()
         self.name = NetworkMonitor.THREAD_NAME
         self.daemon = True
         self.test_uri = test_uri
         self.retry_delay = retry_delay_sec
+        self.max_retry_delay = max_retry_delay_sec
+        self.probe_timeout = probe_timeout_sec
         self.proxies = proxies
-        self.queue = queue.Queue()
-        self.conditions = {}
+        self._connected = threading.Event()
+        self._connected.set()
+        self._outage = threading.Condition()
         self.logger.info("Initialized.")
 
+    @property
+    def is_online(self):
+        """
+        :return True | False: False if an outage is detected and not yet recovered from.
+        """
+        return self._connected.is_set()
+
     def suspend_caller(self):
-        """Put the calling thread into suspension queue."""
-        me = threading.current_thread()
-        cond = self.conditions[me.ident] = threading.Condition()
-        self.queue.put(me)
+        """Suspend the calling thread until the network is back."""
+        with self._outage:
+            if self._connected.is_set():
+                self._connected.clear()
+                self.logger.info("Network failure detected.")
+                self._outage.notify()
         self.logger.info("Suspended due to network failure.")
-        cond.acquire()
-        # Put the caller thread to sleep
-        cond.wait()
-        # Thread is waken up by manager
-        cond.release()
-        del self.conditions[me.ident]
+        self._connected.wait()
         self.logger.info("Resumed.")
 
+    def report_success(self):
+        """
+        Called when a real request got a response from the server. If an outage is in effect, end it without
+        waiting for the next probe.
+        """
+        if not self._connected.is_set():
+            self._set_connected()
+
+    def _set_connected(self):
+        with self._outage:
+            if not self._connected.is_set():
+                self._connected.set()
+                self.logger.info("Network is back. Resume all suspended threads.")
+
     def is_connected(self):
         """
         Test if internet connection is OK by connecting to the test URI provided.
@@ -53,16 +77,22 @@ class NetworkMonitor(threading.Thread):
         :return: True if internet connection is on; False otherwise.
         """
         try:
-            requests.head(self.test_uri, proxies=self.proxies)
+            requests.head(self.test_uri, proxies=self.proxies, timeout=self.probe_timeout)
             return True
-        except requests.ConnectionError:
+        except requests.RequestException:
             return False
 
     def run(self):
         while True:
-            th = self.queue.get()  # blocking call
-            while not self.is_connected():
-                time.sleep(self.retry_delay)
-            self.conditions[th.ident].acquire()
-            self.conditions[th.ident].notify()
-            self.conditions[th.ident].release()
+            with self._outage:
+                while self._connected.is_set():
+                    self._outage.wait()
+            delay = self.retry_delay
+            while not self._connected.is_set():
+                if self.is_connected():
+                    self._set_connected()
+                    break
+                # Waking up early means a real request succeeded in the meantime.
+                if self._connected.wait(delay):
+                    break
+                delay = min(delay * 2, self.max_retry_delay)
@@ -1,5 +1,7 @@
 __author__ = 'xb'
 
+import re
+
 import zgitignore
 
 
@@ -7,14 +9,31 @@ class PathFilter(zgitignore.ZgitIgnore):
     """
     PathFilter parses a gitignore-like file to an ignore list, and then allows for other components to query if a
     specific path should be ignored.
+
+    The rules are compiled into one regex for files and one for directories, and answers are memoized, because the
+    filter is queried for every entry of every directory on each scan.
     """
 
+    # Number of memoized answers kept before the memo is cleared.
+    MAX_CACHE_SIZE = 65536
+
     def __init__(self, rules):
         """
         Initialize the filter with a list of (case-INsensitive) gitignore rules.
         :param [str] rules: List of gitignore rules.
         """
+        self._compiled = False
+        self._file_matcher = None
+        self._dir_matcher = None
+        self._subtree_rules = []
+        self._cache = {}
+        self._subtree_cache = {}
         super().__init__(rules, ignore_case=True)
+        self._compile()
+
+    def add_patterns(self, lines):
+        super().add_patterns(lines)
+        self._compile()
 
     def add_rules(self, rules):
         """
@@ -23,6 +42,56 @@ class PathFilter(zgitignore.ZgitIgnore):
         """
         self.add_patterns(rules)
 
+    def _compile(self):
+        """
+        Merge the rules into one alternation per entry type. The last matching rule decides whether a path is ignored,
+        and an alternation stops at the first alternative that matches, so the rules are put in reverse order and the
+        named group of each alternative tells which rule matched.
+        """
+        flags = re.DOTALL | (re.IGNORECASE if self.ignore_case else 0)
+        file_alts = []
+        dir_alts = []
+        for i in reversed(range(len(self.patterns))):
+            regex, dir_only, negated, compiled_pattern = self.patterns[i]
+            alt = '(?P<r%d>%s)' % (i, regex)
+            dir_alts.append(alt)
+            if not dir_only:
+                file_alts.append(alt)
+        try:
+            self._file_matcher = re.compile('|'.join(file_alts), flags) if file_alts else None
+            self._dir_matcher = re.compile('|'.join(dir_alts), flags) if dir_alts else None
+            self._compiled = True
+        except re.error:
+            # A custom regex ("{...}") that cannot be embedded, e.g., because of a numbered back reference. Fall back
+            # to trying the rules one by one.
+            self._compiled = False
+        # A rule ending in "**" ignores everything under the directories it matches with a trailing slash, unless a
+        # later negation could re-include something.
+        self._subtree_rules = []
+        for regex, dir_only, negated, compiled_pattern in reversed(self.patterns):
+            if negated:
+                break
+            if not dir_only and regex.endswith('.*$'):
+                self._subtree_rules.append(compiled_pattern)
+        self._cache.clear()
+        self._subtree_cache.clear()
+
+    def _match(self, path, is_dir):
+        """
+        :param str path: Normalized path.
+        :param True | False is_dir:
+        :return True | False:
+        """
+        if not self._compiled:
+            return self.is_ignored(path, is_directory=is_dir)
+        matcher = self._dir_matcher if is_dir else self._file_matcher
+        if matcher is None:
+            return False
+        m = matcher.match(path)
+        if m is None:
+            return False
+        return not self.patterns[int(m.lastgroup[1:])][2]
+
     def should_ignore(self, path, is_dir=False):
         """
         Determine if a path should be ignored.
@@ -32,4 +101,28 @@ class PathFilter(zgitignore.ZgitIgnore):
         """
         if path[-1] == '/':
             is_dir = True
-        return self.is_ignored(path, is_directory=is_dir)
+        path = zgitignore.normalize_path(path)
+        key = (path, is_dir)
+        ret = self._cache.get(key)
+        if ret is None:
+            if len(self._cache) >= self.MAX_CACHE_SIZE:
+                self._cache.clear()
+            ret = self._cache[key] = self._match(path, is_dir)
+        return ret
+
+    def is_subtree_ignored(self, path):
+        """
+        Determine if a folder and everything under it should be ignored, so that it need not be listed at all. As in
+        git, nothing under an ignored folder can be re-included.
+        :param str path: Path of the folder relative to repository root.
+        :return True | False:
+        """
+        path = zgitignore.normalize_path(path)
+        ret = self._subtree_cache.get(path)
+        if ret is None:
+            if len(self._subtree_cache) >= self.MAX_CACHE_SIZE:
+                self._subtree_cache.clear()
+            ret = self.should_ignore(path, is_dir=True) or \
+                any(p.match(path + '/') is not None for p in self._subtree_rules)
+            self._subtree_cache[path] = ret
+        return ret
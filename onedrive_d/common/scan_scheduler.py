@@ -0,0 +1,346 @@
+"""
+Schedule the scans that look for changes, directory by directory. A directory in which a scan found changes is scanned
+again after the shortest interval, and every scan that finds nothing doubles the interval of the directory up to the
+longest one, so busy directories are rescanned often while archive trees are left alone. A scan pass starts at the root
+of a drive and only descends into the directories that are due, or that have a due directory under them.
+"""
+
+import collections
+import os
+import threading
+import time
+import weakref
+
+from onedrive_d.common import logger_factory
+from onedrive_d.common import metrics
+
+SCAN_PASS_DURATION = metrics.histogram('onedrived_scan_pass_duration_seconds', 'Time a scan pass of a drive took.',
+                                       buckets=(1, 5, 10, 30, 60, 300, 900, 1800, 3600, 14400))
+DIRS_SCANNED = metrics.counter('onedrived_scan_dirs_total', 'Number of directories reached by scan passes.',
+                               ['decision'])
+
+
+class ScanDecisions:
+    SCANNED = 'scanned'
+    # Neither the directory nor anything under it is due.
+    SKIPPED = 'skipped'
+    # Due, but the scan budget is used up.
+    DEFERRED = 'deferred'
+
+
+def walk_dir_mtimes(local_root):
+    """
+    Walk the local tree of a drive. Only the local file system is read.
+    :param str local_root: Local root directory of the drive.
+    :return [(str, int)]: Path relative to the drive root and st_mtime_ns of every directory, the root included as ''.
+    """
+    ret = []
+    for dir_path, _, _ in os.walk(local_root):
+        try:
+            ret.append((dir_path[len(local_root):], os.stat(dir_path).st_mtime_ns))
+        except OSError:
+            pass
+    return ret
+
+
+class DirScanState:
+    """
+    Scan history of a directory. Times are time.monotonic() values.
+    """
+
+    def __init__(self):
+        # Interval after the last scan; 0 if the directory has not been scanned yet.
+        self.interval = 0
+        self.next_due = 0
+        # The earliest next_due of the directory and the directories under it.
+        self.subtree_due = 0
+        # st_mtime_ns of the local directory when it was last scanned, or None if unknown.
+        self.mtime_ns = None
+
+
+class ScanPass:
+    """
+    One pass over a drive. The pass is done when every SynchronizeDirTask of the pass was handled or dropped.
+    """
+
+    def __init__(self, scheduler, drive_key, generation, start_time):
+        self.scheduler = scheduler
+        self.drive_key = drive_key
+        self.generation = generation
+        self.start_time = start_time
+        self.end_time = None
+        self.dirs_pending = 0
+        self.decisions = collections.Counter()
+        self.changes = 0
+        # Directories to scan when reached in the rest of the pass, regardless of due times.
+        self.forced_paths = set()
+        self.rescan_started = False
+
+    @property
+    def duration_sec(self):
+        """
+        :return float | None: Duration of the pass, or None if it is not done.
+        """
+        return None if self.end_time is None else self.end_time - self.start_time
+
+    def track_dir_task(self, task):
+        """
+        Count a directory task of the pass until it is handled, or dropped from the task pool.
+        :param onedrive_d.common.tasks.SynchronizeDirTask task:
+        :return weakref.finalize: Call it when the task is handled or dropped. Calls after the first do nothing. It is
+        called when the task is garbage collected if it was not called before, which only serves as a fallback: a
+        reference held anywhere, e.g., by a traceback, would keep the pass running.
+        """
+        with self.scheduler.lock:
+            self.dirs_pending += 1
+        return weakref.finalize(task, self._on_dir_task_done)
+
+    def _on_dir_task_done(self):
+        with self.scheduler.lock:
+            self.dirs_pending -= 1
+            if self.dirs_pending > 0:
+                return
+        self.scheduler.end_pass(self)
+
+    def should_scan(self, path, now=None):
+        """
+        Called for a subdirectory found by the scan of its parent.
+        :param str path: Path of the directory relative to the drive root.
+        :param float | None now: (Optional)
+        :return True | False: True if the directory should be scanned in this pass.
+        """
+        scheduler = self.scheduler
+        if now is None:
+            now = time.monotonic()
+        with scheduler.lock:
+            states = scheduler.get_dir_states(self.drive_key)
+            if path in self.forced_paths:
+                # Counted against the budget, which may be overdrawn.
+                scheduler.take_token(now, force=True)
+                decision = ScanDecisions.SCANNED
+            else:
+                decision = scheduler.decide(states, path, now)
+            if decision == ScanDecisions.SCANNED:
+                # Counted by begin_scan().
+                return True
+            scheduler.propagate_due(states, path, states[path].subtree_due)
+            self.decisions[decision] += 1
+        DIRS_SCANNED.labels(decision=decision).inc()
+        return False
+
+    def rescan_changed(self, local_root, now=None):
+        """
+        Called when a local entry is found missing. The entry may have been moved to any directory of the drive, which
+        changes the modification time of that directory, so the local tree is walked for directories modified since
+        they were last scanned. Those directories, and the ones above them, are scanned when reached in the rest of
+        the pass regardless of due times, and are due for the next pass, which covers the ones this pass went past.
+        The tree is walked at most once per pass.
+        :param str local_root: Local root directory of the drive.
+        :param float | None now: (Optional)
+        """
+        scheduler = self.scheduler
+        with scheduler.lock:
+            if self.rescan_started:
+                return
+            self.rescan_started = True
+            scanned_mtimes = {path: state.mtime_ns for path, state in scheduler.get_dir_states(self.drive_key).items()}
+        changed = [path for path, mtime_ns in walk_dir_mtimes(local_root) if scanned_mtimes.get(path) != mtime_ns]
+        if now is None:
+            now = time.monotonic()
+        with scheduler.lock:
+            states = scheduler.get_dir_states(self.drive_key)
+            for path in changed:
+                state = states.get(path)
+                if state is not None:
+                    state.next_due = min(state.next_due, now)
+                    state.subtree_due = min(state.subtree_due, now)
+                    scheduler.propagate_due(states, path, state.subtree_due)
+                while path not in self.forced_paths:
+                    self.forced_paths.add(path)
+                    if path == '':
+                        break
+                    path = path.rsplit('/', 1)[0]
+
+    def begin_scan(self, path, mtime_ns=None):
+        """
+        Called before a directory of the pass is scanned. The directories under it report their due times while it is
+        being scanned.
+        :param str path: Path of the directory relative to the drive root.
+        :param int | None mtime_ns: (Optional) st_mtime_ns of the local directory.
+        """
+        with self.scheduler.lock:
+            state = self.scheduler.get_dir_states(self.drive_key).setdefault(path, DirScanState())
+            state.subtree_due = float('inf')
+            state.mtime_ns = mtime_ns
+            self.decisions[ScanDecisions.SCANNED] += 1
+        DIRS_SCANNED.labels(decision=ScanDecisions.SCANNED).inc()
+
+    def abort_scan(self, path, now=None):
+        """
+        Called when a directory of the pass could not be scanned, so that it is tried again in the next pass.
+        """
+        scheduler = self.scheduler
+        if now is None:
+            now = time.monotonic()
+        with scheduler.lock:
+            states = scheduler.get_dir_states(self.drive_key)
+            state = states.setdefault(path, DirScanState())
+            state.subtree_due = min(state.subtree_due, now)
+            scheduler.propagate_due(states, path, state.subtree_due)
+
+    def end_scan(self, path, num_changes, now=None):
+        """
+        Called after a directory of the pass was scanned.
+        :param str path: Path of the directory relative to the drive root.
+        :param int num_changes: Number of changes the scan found in the directory.
+        :param float | None now: (Optional)
+        """
+        scheduler = self.scheduler
+        if now is None:
+            now = time.monotonic()
+        with scheduler.lock:
+            states = scheduler.get_dir_states(self.drive_key)
+            state = states.setdefault(path, DirScanState())
+            if num_changes > 0 or state.interval == 0:
+                state.interval = scheduler.min_interval
+            else:
+                state.interval = min(state.interval * 2, scheduler.max_interval)
+            state.next_due = now + state.interval
+            state.subtree_due = min(state.subtree_due, state.next_due)
+            scheduler.propagate_due(states, path, state.subtree_due)
+            self.changes += num_changes
+
+
+class ScanScheduler:
+    """
+    Start scan passes of drives and decide which directories the passes scan. A new pass of a drive starts only after
+    the previous one is done, and passes are numbered by generation. The scan budget, if set, is the number of
+    directories that may be scanned per min_interval_sec across all drives; directories that are due when it is used
+    up are left for a later pass, while directories never scanned before are always scanned.
+    """
+
+    logger = logger_factory.get_logger('ScanScheduler')
+
+    MAX_INTERVAL_SECONDS = 86400
+    # Number of finished passes kept per drive.
+    HISTORY_SIZE = 16
+
+    def __init__(self, min_interval_sec, max_interval_sec=MAX_INTERVAL_SECONDS, budget=None):
+        """
+        :param float min_interval_sec: Interval to rescan a directory after changes were found in it.
+        :param float max_interval_sec: (Optional) Longest interval between scans of a directory.
+        :param int | None budget: (Optional) Max number of directories to scan per min_interval_sec. None for no limit.
+        """
+        self.min_interval = min_interval_sec
+        self.max_interval = max(min_interval_sec, max_interval_sec)
+        self.budget = budget
+        self.lock = threading.Lock()
+        self._tokens = budget
+        self._tokens_time = time.monotonic()
+        self._dir_states = {}
+        self._generations = collections.Counter()
+        self._running_passes = {}
+        self._history = collections.defaultdict(lambda: collections.deque(maxlen=self.HISTORY_SIZE))
+
+    def get_dir_states(self, drive_key):
+        """
+        Must be called with lock held.
+        :return dict[str, DirScanState]:
+        """
+        states = self._dir_states.get(drive_key)
+        if states is None:
+            states = self._dir_states[drive_key] = {}
+        return states
+
+    def take_token(self, now, force):
+        """
+        Must be called with lock held.
+        :param True | False force: Take a token even if none is left.
+        :return True | False: True if a token was taken.
+        """
+        if self.budget is None:
+            return True
+        elapsed = max(0, now - self._tokens_time)
+        self._tokens = min(self.budget, self._tokens + elapsed * self.budget / self.min_interval)
+        self._tokens_time = now
+        if self._tokens < 1 and not force:
+            return False
+        self._tokens -= 1
+        return True
+
+    def decide(self, states, path, now):
+        """
+        Must be called with lock held.
+        :return str: A value in ScanDecisions.
+        """
+        state = states.get(path)
+        if state is None:
+            self.take_token(now, force=True)
+            return ScanDecisions.SCANNED
+        if state.subtree_due > now:
+            return ScanDecisions.SKIPPED
+        if self.take_token(now, force=False):
+            return ScanDecisions.SCANNED
+        return ScanDecisions.DEFERRED
+
+    def propagate_due(self, states, path, due):
+        """
+        Lower the subtree due times of the ancestors of a directory to due. Must be called with lock held.
+        """
+        while path != '':
+            path = path.rsplit('/', 1)[0]
+            state = states.get(path)
+            # The subtree due time of a directory is never later than those of the directories under it.
+            if state is None or state.subtree_due <= due:
+                break
+            state.subtree_due = due
+
+    def start_pass(self, drive_key, now=None):
+        """
+        :param drive_key: Key of the drive.
+        :param float | None now: (Optional)
+        :return ScanPass | None: A new pass to scan the drive from its root, or None if the previous pass is not done or
+        nothing is due.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            if drive_key in self._running_passes:
+                return None
+            if self.decide(self.get_dir_states(drive_key), '', now) != ScanDecisions.SCANNED:
+                return None
+            self._generations[drive_key] += 1
+            scan_pass = ScanPass(self, drive_key, self._generations[drive_key], now)
+            self._running_passes[drive_key] = scan_pass
+        return scan_pass
+
+    def end_pass(self, scan_pass):
+        with self.lock:
+            scan_pass.end_time = time.monotonic()
+            if self._running_passes.get(scan_pass.drive_key) is scan_pass:
+                del self._running_passes[scan_pass.drive_key]
+            self._history[scan_pass.drive_key].append(scan_pass)
+        SCAN_PASS_DURATION.observe(scan_pass.duration_sec)
+        self.logger.info('Scan pass %d of drive %s took %.1f seconds: %d directories scanned, %d skipped, %d deferred, '
+                         '%d changes.', scan_pass.generation, scan_pass.drive_key, scan_pass.duration_sec,
+                         scan_pass.decisions[ScanDecisions.SCANNED], scan_pass.decisions[ScanDecisions.SKIPPED],
+                         scan_pass.decisions[ScanDecisions.DEFERRED], scan_pass.changes)
+
+    def is_pass_done(self, drive_key, generation):
+        """
+        :return True | False: True if the pass of the generation, and so every earlier pass, of the drive is done.
+        """
+        with self.lock:
+            history = self._history.get(drive_key)
+            return history is not None and len(history) > 0 and history[-1].generation >= generation
+
+    def get_running_pass(self, drive_key):
+        with self.lock:
+            return self._running_passes.get(drive_key)
+
+    def get_history(self, drive_key):
+        """
+        :return [ScanPass]: The last passes of the drive that are done, oldest first.
+        """
+        with self.lock:
+            return list(self._history.get(drive_key, ()))
@@ -0,0 +1,151 @@
+"""
+Run the daemon as several processes, one per drive, so that hashing, decoding and reconciliation of different drives
+use different cores instead of sharing the interpreter lock of one process. ProcessSupervisor keeps one child process
+per key running and restarts the ones that exit, waiting longer after each quick failure.
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+
+from onedrive_d.common import logger_factory
+
+
+def handle_stop_signals():
+    """
+    Called by a child process to leave stopping it to the supervisor. SIGINT is ignored, because Ctrl+C in a terminal
+    reaches the whole process group and the supervisor passes it on. SIGTERM raises KeyboardInterrupt, so that the
+    child exits the way the daemon does on Ctrl+C, but only once: signals that arrive while it cleans up are ignored.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _on_stop_signal)
+
+
+def _on_stop_signal(signum, frame):
+    signal.signal(signum, signal.SIG_IGN)
+    raise KeyboardInterrupt()
+
+
+class SupervisedProcess:
+    def __init__(self, key):
+        self.key = key
+        self.process = None
+        self.start_time = None
+        self.restart_delay = 0
+        # The time.monotonic() value after which an exited process is started again.
+        self.restart_time = None
+
+
+class ProcessSupervisor:
+    """
+    Keep one process running target(key, *args) for each key given to update(). Processes are started by the "spawn"
+    method, so that children do not inherit the threads and locks of the supervisor. A process that exits is started
+    again after a delay that doubles each time it exits within stable_run_sec of being started, up to
+    max_restart_delay_sec. A process whose key is no longer given is stopped.
+
+    Children are stopped with SIGTERM, once, and are killed if they do not exit in time. See handle_stop_signals().
+    """
+
+    logger = logger_factory.get_logger('ProcessSupervisor')
+
+    MIN_RESTART_DELAY_SECONDS = 1
+    MAX_RESTART_DELAY_SECONDS = 300
+    STABLE_RUN_SECONDS = 600
+    STOP_TIMEOUT_SECONDS = 30
+
+    def __init__(self, target, args=(), min_restart_delay_sec=MIN_RESTART_DELAY_SECONDS,
+                 max_restart_delay_sec=MAX_RESTART_DELAY_SECONDS, stable_run_sec=STABLE_RUN_SECONDS,
+                 stop_timeout_sec=STOP_TIMEOUT_SECONDS, context=None):
+        """
+        :param (object, ...) -> None target: A module-level function, so that it can be pickled.
+        :param tuple args: (Optional) Arguments passed to target after the key. Must be picklable.
+        :param float min_restart_delay_sec: (Optional)
+        :param float max_restart_delay_sec: (Optional)
+        :param float stable_run_sec: (Optional) A process that ran this long resets its restart delay when it exits.
+        :param float stop_timeout_sec: (Optional) How long to wait for a process to exit before it is killed.
+        :param multiprocessing.context.BaseContext | None context: (Optional) The context to create processes with.
+        """
+        self.target = target
+        self.args = args
+        self.min_restart_delay = min_restart_delay_sec
+        self.max_restart_delay = max_restart_delay_sec
+        self.stable_run = stable_run_sec
+        self.stop_timeout = stop_timeout_sec
+        self.context = multiprocessing.get_context('spawn') if context is None else context
+        self.children = {}
+
+    def _start(self, child, now):
+        child.process = self.context.Process(target=self.target, args=(child.key,) + tuple(self.args),
+                                             name='onedrived-%s' % str(child.key))
+        child.process.start()
+        child.start_time = now
+        child.restart_time = None
+        self.logger.info('Started process %d for %s.', child.process.pid, child.key)
+
+    def _on_exit(self, child, now):
+        exit_code = child.process.exitcode
+        child.process.join()
+        if now - child.start_time >= self.stable_run:
+            child.restart_delay = self.min_restart_delay
+        else:
+            child.restart_delay = min(max(child.restart_delay * 2, self.min_restart_delay), self.max_restart_delay)
+        child.restart_time = now + child.restart_delay
+        self.logger.warning('Process %d for %s exited with code %s. Restarting it in %.1f seconds.',
+                            child.process.pid, child.key, exit_code, child.restart_delay)
+
+    def update(self, keys, now=None):
+        """
+        Start processes for new keys, stop those of keys no longer given and restart those that exited and are due.
+        :param collections.Iterable keys:
+        :param float | None now: (Optional) The time.monotonic() value to compare restart times with.
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = set(keys)
+        for key in list(self.children):
+            if key not in keys:
+                self.stop(key)
+        for key in keys:
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = SupervisedProcess(key)
+                self._start(child, now)
+            elif child.restart_time is None:
+                if not child.process.is_alive():
+                    self._on_exit(child, now)
+            elif now >= child.restart_time:
+                self._start(child, now)
+
+    def stop(self, key):
+        """
+        Stop the process of a key and forget the key.
+        """
+        child = self.children.pop(key)
+        if child.restart_time is not None:
+            return
+        self._stop_processes([child.process])
+
+    def stop_all(self):
+        processes = [c.process for c in self.children.values() if c.restart_time is None]
+        self.children.clear()
+        self._stop_processes(processes)
+
+    def _stop_processes(self, processes):
+        for process in processes:
+            if process.is_alive():
+                try:
+                    os.kill(process.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        deadline = time.monotonic() + self.stop_timeout
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                # Children ignore a second SIGTERM, so terminate() would not do.
+                self.logger.warning('Process %d did not exit in time. Killing it.', process.pid)
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                process.join()
@@ -1,33 +1,200 @@
 __author__ = 'xb'
 
 import threading
+import time
 
 from onedrive_d.common import logger_factory
+from onedrive_d.common import metrics
+
+TASKS_HANDLED = metrics.counter('onedrived_tasks_handled_total', 'Number of tasks handled by workers.',
+                                ['lane', 'task'])
+TASK_DURATION = metrics.histogram('onedrived_task_duration_seconds', 'Time workers spent handling tasks.', ['lane'])
+BUSY_WORKERS = metrics.gauge('onedrived_busy_workers', 'Number of workers handling a task.', ['lane'])
+WORKERS = metrics.gauge('onedrived_workers', 'Number of workers of the lane.', ['lane'])
 
 
 class TaskConsumer(threading.Thread):
     terminate_sign = threading.Event()
     logger = logger_factory.get_logger('TaskConsumer')
 
-    def __init__(self, task_pool):
+    def __init__(self, task_pool, lane=None, worker_lane=None):
         """
         :param onedrive_d.store.task_pool.TaskPool task_pool:
+        :param str | None lane: (Optional) Only take tasks of this lane in TaskLanes. None for tasks of any lane.
+        :param onedrive_d.common.task_worker.WorkerLane | None worker_lane: (Optional) The worker lane the consumer
+        belongs to. If set, the consumer reports the tasks it handles and asks the lane whether to stop when idle.
         """
         super().__init__()
         self.daemon = True
         self.task_pool = task_pool
+        self.lane = lane
+        self.worker_lane = worker_lane
+        # Read by diagnostics to tell what the worker is busy with.
+        self.current_task = None
 
     def run(self):
         self.logger.debug('Started.')
+        semaphore = self.task_pool.get_semaphore(self.lane)
+        idle_timeout = None if self.worker_lane is None else self.worker_lane.idle_timeout_sec
         while True:
-            self.task_pool.semaphore.acquire()
+            has_task = semaphore.acquire(timeout=idle_timeout)
             if self.terminate_sign.is_set():
                 break
-            task = self.task_pool.pop_task()
+            if not has_task:
+                if self.worker_lane.retire_worker(self):
+                    break
+                continue
+            task = self.task_pool.pop_task(lane=self.lane)
+            if task is None:
+                # The task was removed from the pool before a worker got to it.
+                continue
             self.logger.debug('Acquired task of type "%s" on path "%s"',
                               task.__class__.__name__, task.local_parent_path + '/' + task.name)
-            task.handle()
+            lane = self.task_pool.get_task_lane(task)
+            busy_workers = BUSY_WORKERS.labels(lane=lane)
+            busy_workers.inc()
+            start_time = time.monotonic()
+            self.current_task = task
+            try:
+                task.handle()
+            finally:
+                self.current_task = None
+                elapsed_sec = time.monotonic() - start_time
+                busy_workers.dec()
+                self.task_pool.task_done(task)
+            TASKS_HANDLED.labels(lane=lane, task=task.__class__.__name__).inc()
+            TASK_DURATION.labels(lane=lane).observe(elapsed_sec)
+            if self.worker_lane is not None:
+                self.worker_lane.on_task_done(elapsed_sec)
         self.logger.debug('Stopped.')
 
 
 TaskConsumer.terminate_sign.clear()
+
+
+class WorkerLane:
+    """
+    The consumers of one lane of the task pool. The lane keeps between min_workers and max_workers consumers: adjust()
+    adds a consumer while tasks queue up, unless the last one added did not raise the number of tasks done per second,
+    which means the lane is bound by something else, like bandwidth. A consumer that stays idle for idle_timeout_sec
+    stops if the lane has more than min_workers consumers.
+    """
+
+    logger = logger_factory.get_logger('WorkerLane')
+
+    IDLE_TIMEOUT_SECONDS = 60
+    # A new consumer must raise the throughput by this ratio to be worth another one.
+    MIN_THROUGHPUT_GAIN = 0.1
+
+    def __init__(self, task_pool, lane, min_workers, max_workers, idle_timeout_sec=IDLE_TIMEOUT_SECONDS):
+        """
+        :param onedrive_d.store.task_pool.TaskPool task_pool:
+        :param str lane: A value in TaskLanes.
+        :param int min_workers:
+        :param int max_workers:
+        :param float idle_timeout_sec: (Optional)
+        """
+        self.task_pool = task_pool
+        self.lane = lane
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.idle_timeout_sec = idle_timeout_sec
+        self.workers = set()
+        self.tasks_done = 0
+        self.busy_sec = 0
+        self._lock = threading.Lock()
+        self._serial = 0
+        self._last_sample = (time.monotonic(), 0)
+        self._last_throughput = None
+        self._last_grown = False
+        self._max_useful_workers = None
+
+    @property
+    def num_workers(self):
+        with self._lock:
+            return len(self.workers)
+
+    def start(self):
+        for _ in range(self.min_workers - self.num_workers):
+            self.add_worker()
+
+    def add_worker(self):
+        with self._lock:
+            worker = TaskConsumer(self.task_pool, lane=self.lane, worker_lane=self)
+            worker.name = '%s-%d' % (self.lane, self._serial)
+            self._serial += 1
+            self.workers.add(worker)
+            WORKERS.labels(lane=self.lane).set(len(self.workers))
+        worker.start()
+        return worker
+
+    def retire_worker(self, worker):
+        """
+        Called by an idle consumer.
+        :param onedrive_d.common.task_worker.TaskConsumer worker:
+        :return True | False: True if the consumer should stop.
+        """
+        with self._lock:
+            if len(self.workers) <= self.min_workers:
+                return False
+            self.workers.discard(worker)
+            WORKERS.labels(lane=self.lane).set(len(self.workers))
+        self.logger.debug('Lane "%s" retired idle worker "%s".', self.lane, worker.name)
+        return True
+
+    def on_task_done(self, elapsed_sec):
+        with self._lock:
+            self.tasks_done += 1
+            self.busy_sec += elapsed_sec
+
+    def adjust(self, now=None):
+        """
+        Sample the throughput of the lane since the last call and add a consumer if the lane needs one.
+        :param float | None now: (Optional) The time.monotonic() value of the sample.
+        :return True | False: True if a consumer was added.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            last_time, last_done = self._last_sample
+            throughput = (self.tasks_done - last_done) / max(now - last_time, 1e-6)
+            self._last_sample = (now, self.tasks_done)
+            num_workers = len(self.workers)
+        queue_length = self.task_pool.get_queue_length(self.lane)
+        if queue_length == 0:
+            # A drained queue says nothing about the ceiling of the next burst.
+            self._max_useful_workers = None
+        elif self._last_grown and self._last_throughput and \
+                throughput < self._last_throughput * (1 + self.MIN_THROUGHPUT_GAIN):
+            self._max_useful_workers = num_workers - 1
+        self._last_throughput = throughput
+        limit = self.max_workers if self._max_useful_workers is None else self._max_useful_workers
+        self._last_grown = queue_length > num_workers and num_workers < limit
+        if self._last_grown:
+            self.add_worker()
+            self.logger.debug('Lane "%s" has %d queued tasks and %.2f tasks/s. Added a worker.', self.lane,
+                              queue_length, throughput)
+        return self._last_grown
+
+
+class WorkerLaneScaler(threading.Thread):
+    """
+    Periodically adjust the size of worker lanes until TaskConsumer.terminate_sign is set.
+    """
+
+    ADJUST_INTERVAL_SECONDS = 5
+
+    def __init__(self, worker_lanes, interval_sec=ADJUST_INTERVAL_SECONDS):
+        """
+        :param [onedrive_d.common.task_worker.WorkerLane] worker_lanes:
+        :param float interval_sec: (Optional)
+        """
+        super().__init__(name='WorkerLaneScaler')
+        self.daemon = True
+        self.worker_lanes = worker_lanes
+        self.interval_sec = interval_sec
+
+    def run(self):
+        while not TaskConsumer.terminate_sign.wait(self.interval_sec):
+            for worker_lane in self.worker_lanes:
+                worker_lane.adjust()
@@ -1,26 +1,45 @@
 __author__ = 'xb'
 
 import os
-from time import sleep
-
-from send2trash import send2trash
+import stat
+import time
 
 from onedrive_d import mkdir
 from onedrive_d import datetime_to_timestamp
 from onedrive_d import timestamp_to_datetime
-from onedrive_d import compare_timestamps
+from onedrive_d import compare_timestamps_ns
+from onedrive_d import datetime_to_ns
+from onedrive_d import ns_to_datetime
 from onedrive_d import OS_HOSTNAME
 from onedrive_d.api import errors
 from onedrive_d.api import facets
 from onedrive_d.api import options
 from onedrive_d.api import resources
+from onedrive_d.api.items import OneDriveItemTypes
+from onedrive_d.common import file_clone
 from onedrive_d.common import hasher
 from onedrive_d.common import logger_factory
 from onedrive_d.store.items_db import ItemRecordStatuses
+from onedrive_d.store.task_pool import TaskLanes
+
+# Records in these statuses describe content that is in place both locally and remotely.
+SETTLED_RECORD_STATUSES = {ItemRecordStatuses.OK, ItemRecordStatuses.DOWNLOADED, ItemRecordStatuses.UPLOADED}
+
+# Files of at least this many bytes are transferred in the large transfer lane.
+LARGE_TRANSFER_MIN_SIZE = 8388608
+
+
+def get_transfer_lane(size):
+    """
+    :param int size: Size of the file to transfer.
+    :return str: The lane in TaskLanes for the transfer.
+    """
+    return TaskLanes.LARGE_TRANSFER if size >= LARGE_TRANSFER_MIN_SIZE else TaskLanes.SMALL_TRANSFER
 
 
 class TaskMixin:
     logger = logger_factory.get_logger('Tasks')
+    lane = TaskLanes.METADATA
 
     def __init__(self, task_base=None, drive=None, items_store=None, task_pool=None):
         self.drive = drive if task_base is None else task_base.drive
@@ -51,6 +70,22 @@ class TaskMixin:
     def task_pool(self, p):
         self._task_pool = p
 
+    def on_dropped(self):
+        """
+        Called by the task pool when it drops the task without handing it to a worker.
+        """
+        pass
+
+    def stat_local(self, path):
+        """
+        :param str path: Path to a local entry.
+        :return os.stat_result | None: Stat of the entry, or None if it cannot be stat'ed.
+        """
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
 
 class NameReferenceMixin:
     @property
@@ -113,19 +148,55 @@ class LocalParentPathMixin(TaskMixin, ParentPathReferenceMixin):
 
 
 class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
-    def __init__(self, task_base, local_parent_path, name):
+    def __init__(self, task_base, local_parent_path, name, scan_pass=None):
+        """
+        :param onedrive_d.common.tasks.TaskMixin task_base:
+        :param str local_parent_path:
+        :param str name:
+        :param onedrive_d.common.scan_scheduler.ScanPass | None scan_pass: (Optional) The scan pass the task belongs
+        to, by default that of task_base if any. Without a pass, every subdirectory is scanned.
+        """
         super().__init__(task_base)
         self.local_parent_path = local_parent_path
         self.name = name
-        if name is not None or name == '':
+        self.scan_pass = scan_pass if scan_pass is not None else getattr(task_base, 'scan_pass', None)
+        self.num_changes = 0
+        self._scan_done = None if self.scan_pass is None else self.scan_pass.track_dir_task(self)
+        if name is None or name == '':
             append_name = ''
             self.item_path = None
         else:
             append_name = '/' + name
             self.item_path = self.parent_path + append_name
         self.local_path = self.local_parent_path + append_name
+        self.local_relative_path = self.local_relative_parent_path + append_name
         self.repo_relative_parent_path = '/' + self.local_relative_parent_path + append_name
 
+    def is_ignored(self, path_filter, name, is_folder):
+        """
+        :param onedrive_d.common.path_filter.PathFilter path_filter:
+        :param str name: Name of an entry in the directory.
+        :param True | False is_folder:
+        :return True | False: True if the entry is ignored. A folder is also ignored if everything under it is, so
+        that it is not listed at all.
+        """
+        path = self.repo_relative_parent_path + '/' + name
+        if is_folder:
+            return path_filter.is_subtree_ignored(path)
+        return path_filter.should_ignore(path)
+
+    def add_change_task(self, task):
+        """
+        Queue a task that carries out a change found by the scan.
+        :param onedrive_d.common.tasks.TaskMixin task:
+        """
+        self.num_changes += 1
+        self.task_pool.add_task(task)
+
+    def on_dropped(self):
+        if self._scan_done is not None:
+            self._scan_done()
+
     def list_items(self, path_filter):
         """
         List all entry names under the directory to sync without those to be ignored.
@@ -136,9 +207,9 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
         ent_count = {}
         for ent in os.listdir(self.local_path):
             ent_path = self.local_path + '/' + ent
-            is_folder = os.path.isfile(ent_path)
+            is_folder = os.path.isdir(ent_path)
             filename, ext = os.path.splitext(ent)
-            if path_filter.should_ignore(self.repo_relative_parent_path + '/' + ent, is_folder) or ext == '.!od':
+            if self.is_ignored(path_filter, ent, is_folder) or ext == '.!od':
                 continue
             ent_lower = ent.lower()
             if ent_lower in ent_count:
@@ -178,17 +249,17 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
                 self.logger.debug('Creating directory "%s" as it does not exist locally and has no previous '
                                   'record.', item_path)
                 mkdir(item_path)
+                self.num_changes += 1
                 parent_path = self.drive.drive_path + '/root:' if self.item_path is None else self.item_path
-                self.items_store.update_item(item, parent_path=parent_path)
-                self.task_pool.add_task(SynchronizeDirTask(self, self.local_relative_parent_path + '/' +
-                                                           self.name, item.name))
+                self.items_store.update_item(item, parent_path=parent_path, local_stat=self.stat_local(item_path))
+                self.task_pool.add_task(SynchronizeDirTask(self, self.local_relative_path, item.name))
             except (IOError, OSError) as e:
                 self.logger.error('Failed to create directory "%s": %s.', item_path, e)
         else:
             # Just download the item.
             self.logger.debug('Downloading "%s" as it does not exist locally and has no record in database.',
                               item_path)
-            self.task_pool.add_task(DownloadFileTask(self, item))
+            self.add_change_task(DownloadFileTask(self, item))
 
     def handle_item_missing(self, item, record, item_path):
         """
@@ -200,15 +271,15 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
         :return:
         """
         if item.c_tag == record.c_tag and item.e_tag == record.e_tag:
-            # The item did not change remotely, so we assume the local entry was deleted but the database and remote
-            # repository were not updated. Update them accordingly.
+            # The item did not change remotely, so we assume the local entry was moved or deleted but the database
+            # and remote repository were not updated. Remove the remote item unless the entry shows up elsewhere.
             self.logger.debug('Local item "%s" does not exist. Remote item matches database record. Remove remote '
-                              'item.', item_path)
-            try:
-                self.drive.delete_item(item_id=item.id)
-                self.items_store.delete_item(item_id=item.id)
-            except errors.OneDriveError as e:
-                self.logger.error('An error occurred deleting item "%s": %s.', item.id, e)
+                              'item unless it was moved.', item_path)
+            if self.scan_pass is not None:
+                # Directories not due would be skipped, so a move into them would only be seen as a removal.
+                self.scan_pass.rescan_changed(self.drive.config.local_root)
+            self.add_change_task(MoveFromTask(self, self.local_relative_path, item.name,
+                                              is_folder=item.is_folder, item_id=item.id, scan_pass=self.scan_pass))
         else:
             # The item was changed since the last update of the record. Download the item back to local repository.
             self.handle_item_creation(item, item_path)
@@ -228,20 +299,25 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
         self.handle_item_creation(item, item_path)
 
     def stat_file(self, item_path):
-        return os.path.getsize(item_path), os.path.getmtime(item_path)
+        """
+        :param str item_path:
+        :return (int, int): Size of the file and its last modification time as UNIX timestamp in nanoseconds.
+        """
+        st = os.stat(item_path)
+        return st.st_size, st.st_mtime_ns
 
     def check_file_hash(self, item, item_path, file_mtime):
         file_props = item.file_props
         hash_props = file_props.hashes if file_props is not None else None
         if hash_props is not None:
-            if hash_props.crc32 is not None and hash_props.crc32 == hasher.crc32_value(item_path) or \
+            if hash_props.crc32 is not None and hash_props.crc32 == hasher.crc32_hex_value(item_path) or \
                                     hash_props.sha1 is not None and hash_props.sha1 == hasher.hash_value(item_path):
                 # The remote and local files have identical content, update remote timestamps
                 # and update local record. No changes on the local file.
                 self.logger.debug('Item "%s" has same hash value for remote and local content.')
-                self.task_pool.add_task(
-                    UpdateItemInfoTask(self, self.local_relative_parent_path + '/' + self.name, item.name,
-                                       timestamp_to_datetime(file_mtime)))
+                self.add_change_task(
+                    UpdateItemInfoTask(self, self.local_relative_path, item.name,
+                                       ns_to_datetime(file_mtime)))
                 return True
         return False
 
@@ -260,11 +336,12 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
                     self.move_and_create_file(item, item_path)
                     return
                 file_size, file_mtime = self.stat_file(item_path)
-                if file_size == item.size and compare_timestamps(
-                        datetime_to_timestamp(item.modified_time), file_mtime) == 0:
+                if file_size == item.size and compare_timestamps_ns(
+                        datetime_to_ns(item.modified_time), file_mtime) == 0:
                     # If local file and remote file match in terms of mtime and file size, then we assume two files
                     # are identical and just update the record.
-                    self.items_store.update_item(item)
+                    self.items_store.update_item(item, local_stat=self.stat_local(item_path))
+                    self.num_changes += 1
                 else:
                     # When the two key properties do not match, we want to use file hashes to determine if they are
                     # identical or not.
@@ -289,8 +366,9 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
         try:
             if item.is_folder:
                 if os.path.isdir(item_path):
-                    self.task_pool.add_task(SynchronizeDirTask(self, self.local_relative_parent_path + '/' +
-                                                               self.name, item.name))
+                    if self.scan_pass is None or \
+                            self.scan_pass.should_scan(self.local_relative_path + '/' + item.name):
+                        self.task_pool.add_task(SynchronizeDirTask(self, self.local_relative_path, item.name))
                 else:
                     self.move_and_create_dir(item, item_path)
             else:
@@ -298,18 +376,16 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
                     self.move_and_create_file(item, item_path)
                     return
                 file_size, file_mtime = self.stat_file(item_path)
+                record_mtime = record.modified_time_ns
                 if record.item_id == item.id and record.e_tag == item.e_tag:
                     # The remote item did not change since last update of record.
-                    if file_size != record.size or compare_timestamps(
-                            file_mtime, datetime_to_timestamp(record.modified_time)) != 0:
-                        self.task_pool.add_task(UploadFileTask(self, self.local_relative_parent_path + '/' +
-                                                               self.name, item.name,
-                                                               options.NameConflictBehavior.REPLACE))
-                elif record.size == file_size and compare_timestamps(
-                        datetime_to_timestamp(record.modified_time), file_mtime) == 0 and record.modified_time < \
-                        item.modified_time:
+                    if file_size != record.size or compare_timestamps_ns(file_mtime, record_mtime) != 0:
+                        self.add_change_task(UploadFileTask(self, self.local_relative_path, item.name,
+                                                            options.NameConflictBehavior.REPLACE))
+                elif record.size == file_size and compare_timestamps_ns(record_mtime, file_mtime) == 0 and \
+                        record_mtime < datetime_to_ns(item.modified_time):
                     # Local item did not change since last update of record, but item was updated remotely.
-                    self.task_pool.add_task(DownloadFileTask(self, item))
+                    self.add_change_task(DownloadFileTask(self, item))
                 elif self.check_file_hash(item, item_path, file_mtime):
                     # Both remote item and local item were changed since last update of record, but file hash
                     # still matches. Just update the record.
@@ -351,11 +427,43 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
             self.handle_record_missing(item, item_path)
         else:
             # Local record exists and file exists
-            self.handle_normal_item(item, self._get_first_value(q), item_path)
+            record = self._get_first_value(q)
+            if record.inode is None:
+                local_stat = self.stat_local(item_path)
+                if local_stat is not None:
+                    self.items_store.update_local_stat(item.id, local_stat)
+            self.handle_normal_item(item, record, item_path)
+
+    def find_moved_item(self, item_path, local_stat):
+        """
+        Find the record of an item whose local entry was moved to item_path, by the inode of the entry. The entry
+        recorded for the item must be gone from its old path.
+        :param str item_path: Local path the entry is now at.
+        :param os.stat_result local_stat: Stat of the entry.
+        :return onedrive_d.store.items_db.ItemRecord | None:
+        """
+        is_dir = stat.S_ISDIR(local_stat.st_mode)
+        for record in self.items_store.get_items_by_inode(local_stat.st_ino, local_stat.st_dev).values():
+            old_path = self.drive.config.local_root + record.local_path
+            if old_path != item_path and is_dir == (record.type == OneDriveItemTypes.FOLDER) and \
+                    not os.path.lexists(old_path):
+                return record
+        return None
 
     def analyze_untouched_local_item(self, name):
         item_path = self.local_path + '/' + name
+        # An entry that is only local is a change whether or not it is handled yet.
+        self.num_changes += 1
         try:
+            record = self.find_moved_item(item_path, os.stat(item_path))
+            if record is not None:
+                # Move the remote item along instead of removing it and uploading the entry again.
+                self.logger.info('Local item "%s" was moved to "%s".', record.local_path, item_path)
+                move_from_task = MoveFromTask(self, record.local_path.rsplit('/', 1)[0], record.item_name,
+                                              is_folder=record.type == OneDriveItemTypes.FOLDER,
+                                              item_id=record.item_id)
+                self.add_change_task(MoveItemTask(move_from_task, self.local_relative_path, name))
+                return
             # TODO: finish this stub
             if os.path.isdir(item_path):
                 pass
@@ -365,25 +473,47 @@ class SynchronizeDirTask(NameReferenceMixin, LocalParentPathMixin):
             self.logger.error('An error occurred synchronizing "%s": %s.', item_path, e)
 
     def handle(self):
+        if self.scan_pass is None:
+            self.scan()
+            return
+        scanned = False
+        try:
+            mtime_ns = os.stat(self.local_path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        self.scan_pass.begin_scan(self.local_relative_path, mtime_ns)
+        try:
+            scanned = self.scan()
+        finally:
+            if scanned:
+                self.scan_pass.end_scan(self.local_relative_path, self.num_changes)
+            else:
+                self.scan_pass.abort_scan(self.local_relative_path)
+            self._scan_done()
+
+    def scan(self):
+        """
+        :return True | False: False if the directory could not be listed.
+        """
         if not os.path.isdir(self.local_path):
             self.logger.error('Cannot sync path "%s" because it is not a directory.', self.local_path)
-            return
+            return False
         path_filter = self.drive.config.path_filter
         try:
             all_local_items = self.list_items(path_filter)
             all_remote_items = self.drive.get_children(item_path=self.item_path)
         except (IOError, OSError) as e:
             self.logger.error('An error occurred synchronizing "%s": %s.', self.local_path, e)
-            return
-        while all_remote_items.has_next:
-            remote_item_list = all_remote_items.get_next()
+            return False
+        for remote_item_list in all_remote_items.iter_pages():
             for item in remote_item_list:
                 item_path = self.local_path + '/' + item.name
-                if not path_filter.should_ignore(self.repo_relative_parent_path + '/' + item.name) and not \
+                if not self.is_ignored(path_filter, item.name, item.is_folder) and not \
                         self.task_pool.has_pending_task(item_path):
                     self.analyze_item(item, item_path, all_local_items, path_filter)
         for local_item_name in all_local_items:
             self.analyze_untouched_local_item(local_item_name)
+        return True
 
 
 class CreateDirTask(NameReferenceMixin, LocalParentPathMixin):
@@ -403,7 +533,8 @@ class CreateDirTask(NameReferenceMixin, LocalParentPathMixin):
             self.parent_path = new_item.parent_reference.path
             if new_item.name != self.name:
                 os.rename(self.local_parent_path + '/' + self.name, self.local_parent_path + '/' + new_item.name)
-            self.items_store.update_item(new_item, ItemRecordStatuses.OK)
+            self.items_store.update_item(new_item, ItemRecordStatuses.OK,
+                                         local_stat=self.stat_local(self.local_parent_path + '/' + new_item.name))
             self.logger.info('Created remote directory: %s/%s. Item ID: %s.', self.parent_path, new_item.name,
                              new_item.id)
             sync_task = SynchronizeDirTask(self, local_parent_path=self.local_relative_parent_path, name=self.name)
@@ -438,36 +569,147 @@ class DownloadFileTask(NameReferenceMixin, ItemReferenceMixin, LocalParentPathMi
         self.name = item.name
         self.parent_path = item.parent_reference.path
 
+    @property
+    def lane(self):
+        return get_transfer_lane(self.item.size)
+
     def get_temp_filename(self):
         return '.' + self.item.name + '.!od'
 
+    def find_local_copies(self, local_item_path):
+        """
+        Find local files of recorded items, in the item storages of all drives, whose content hashes match the item.
+        In multi-process mode, only the drives of the current process are searched.
+        :param str local_item_path: Local path the item is going to be saved to.
+        :return [str]: Paths of candidate local files.
+        """
+        file_props = self.item.file_props
+        hashes = file_props.hashes if file_props is not None else None
+        if hashes is None or hashes.crc32 is None and hashes.sha1 is None:
+            return []
+        if self.items_store.manager is not None:
+            matches = self.items_store.manager.get_items_by_hash(crc32_hash=hashes.crc32, sha1_hash=hashes.sha1)
+        else:
+            matches = [(self.drive, r) for r in self.items_store.get_items_by_hash(
+                crc32_hash=hashes.crc32, sha1_hash=hashes.sha1).values()]
+        paths = []
+        for drive, record in matches:
+            path = drive.config.local_root + record.local_path
+            if record.size == self.item.size and record.status in SETTLED_RECORD_STATUSES and \
+                    path != local_item_path and path not in paths:
+                paths.append(path)
+        return paths
+
+    def verify_content(self, path):
+        """
+        :param str path: Path to a local file.
+        :return True | False: True if the digest of the file matches that of the item.
+        """
+        hashes = self.item.file_props.hashes
+        if hashes.sha1 is not None:
+            return hasher.hash_value(path) == hashes.sha1
+        return hasher.crc32_hex_value(path) == hashes.crc32
+
+    def clone_local_copy(self, local_temp_path, local_item_path):
+        """
+        Materialize the item from a local file with identical content instead of downloading it.
+        :param str local_temp_path: Path to write the content to.
+        :param str local_item_path: Local path the item is going to be saved to.
+        :return True | False: True if local_temp_path now holds the verified content of the item.
+        """
+        for path in self.find_local_copies(local_item_path):
+            try:
+                if os.stat(path).st_size != self.item.size:
+                    continue
+                method = file_clone.clone_file(path, local_temp_path)
+                if self.verify_content(local_temp_path):
+                    self.logger.info('Cloned "%s" from local file "%s" by %s instead of downloading it.',
+                                     local_item_path, path, method)
+                    return True
+            except (IOError, OSError) as e:
+                self.logger.warning('Failed to clone "%s" from local file "%s": %s.', local_item_path, path, e)
+        return False
+
     def handle(self):
         local_temp_path = self.local_parent_path + '/' + self.get_temp_filename()
         local_item_path = self.local_parent_path + '/' + self.item.name
         try:
-            with open(local_temp_path, 'wb') as f:
-                self.drive.download_file(file=f, size=self.item.size, item_id=self.item.id)
+            if not self.clone_local_copy(local_temp_path, local_item_path):
+                with open(local_temp_path, 'wb') as f:
+                    self.drive.download_file(file=f, size=self.item.size, item_id=self.item.id)
             if os.path.exists(local_item_path):
+                # Only needed when a download replaces a local file, so it is not imported at startup.
+                from send2trash import send2trash
                 send2trash(local_item_path)
             os.rename(local_temp_path, local_item_path)
             t = datetime_to_timestamp(self.item.modified_time)
             os.utime(local_item_path, (t, t))
-            self.items_store.update_item(self.item, ItemRecordStatuses.DOWNLOADED)
+            self.items_store.update_item(self.item, ItemRecordStatuses.DOWNLOADED,
+                                         local_stat=self.stat_local(local_item_path))
         except Exception as e:
             self.logger.error('Error occurred downloading to file "%s": %s.', local_item_path, e)
 
 
 class UploadFileTask(NameReferenceMixin, LocalParentPathMixin):
-    def __init__(self, task_base, local_parent_path, name, conflict_behavior=options.NameConflictBehavior.RENAME):
+    # Smaller files are uploaded directly because a server-side copy costs more round trips than the upload.
+    DEDUPE_MIN_SIZE = 1048576
+
+    def __init__(self, task_base, local_parent_path, name, conflict_behavior=options.NameConflictBehavior.RENAME,
+                 dedupe=True):
+        """
+        :param str local_parent_path: Local parent path relative to drive's root directory.
+        :param str name: Name of the file to upload.
+        :param str conflict_behavior: (Optional) What to do if the remote item already exists.
+        :param True | False dedupe: (Optional) If True, copy a remote file with identical content on the server
+        instead of uploading the data.
+        """
         super().__init__(task_base=task_base)
         self.local_parent_path = local_parent_path
         self.name = name
         self.conflict_behavior = conflict_behavior
+        self.dedupe = dedupe
+        # Size the file here rather than when the task is queued, which happens with the lock of the task pool held.
+        self.lane = self.get_lane()
+
+    def get_lane(self):
+        """
+        :return str: The lane in TaskLanes for the upload, by the size of the local file.
+        """
+        try:
+            return get_transfer_lane(os.path.getsize(self.local_parent_path + '/' + self.name))
+        except (OSError, IOError):
+            # The task will fail fast, so it does not take a large transfer slot.
+            return TaskLanes.SMALL_TRANSFER
+
+    def find_remote_copy(self, local_item_path, size):
+        """
+        Look up the items database for a remote file whose content is identical to the local file.
+        :param str local_item_path:
+        :param int size: Size of the local file.
+        :return onedrive_d.store.items_db.ItemRecord | None:
+        """
+        sha1_hash = hasher.hash_value(local_item_path)
+        for record in self.items_store.get_items_by_hash(sha1_hash=sha1_hash).values():
+            if record.sha1_hash == sha1_hash and record.size == size and record.status in \
+                    SETTLED_RECORD_STATUSES and (record.parent_path, record.item_name) != \
+                    (self.parent_path, self.name):
+                return record
+        return None
 
     def handle(self):
         local_item_path = self.local_parent_path + '/' + self.name
         try:
             size = os.path.getsize(local_item_path)
+            # A replacing upload targets an existing remote item, which a copy cannot overwrite.
+            if self.dedupe and size >= self.DEDUPE_MIN_SIZE and \
+                    self.conflict_behavior != options.NameConflictBehavior.REPLACE:
+                record = self.find_remote_copy(local_item_path, size)
+                if record is not None:
+                    self.logger.info('Copying remote item "%s" to "%s" instead of uploading the same content.',
+                                     record.parent_path + '/' + record.item_name, local_item_path)
+                    self.task_pool.add_task(CopyItemTask(self, record.item_id, self.local_relative_parent_path,
+                                                         self.name))
+                    return
             with open(local_item_path, 'rb') as f:
                 item = self.drive.upload_file(
                     filename=self.name, data=f, size=size, parent_path=self.parent_path,
@@ -475,27 +717,72 @@ class UploadFileTask(NameReferenceMixin, LocalParentPathMixin):
                 modified_time = timestamp_to_datetime(os.path.getmtime(local_item_path))
                 fs_info = facets.FileSystemInfoFacet(modified_time=modified_time)
                 item = self.drive.update_item(item_id=item.id, new_file_system_info=fs_info)
-                self.items_store.update_item(item, ItemRecordStatuses.OK)
+                self.items_store.update_item(item, ItemRecordStatuses.OK, local_stat=self.stat_local(local_item_path))
         except Exception as e:
             self.logger.error('Error occurred when uploading "%s": %s.', local_item_path, e)
 
 
 class MoveFromTask(NameReferenceMixin, LocalParentPathMixin):
     """
-    A transient task that will become either RemoveItemTask or MoveItemTask.
+    A transient task that will become either RemoveItemTask or MoveItemTask. The local entry may show up at another
+    path later in the scan, so the removal is held off for a window, during which the task goes back to the pool
+    instead of blocking a worker. If the task was created by a scan pass, the removal is also held off until the next
+    pass, which scans the directories modified since their last scan, is done.
     """
 
-    def __init__(self, task_base, local_parent_path, name, is_folder=False):
+    MOVE_WINDOW_SECONDS = 30
+
+    def __init__(self, task_base, local_parent_path, name, is_folder=False, item_id=None,
+                 window_sec=MOVE_WINDOW_SECONDS, scan_pass=None):
+        """
+        :param str local_parent_path: Local parent path, relative to drive's root directory, the entry was at.
+        :param str name: Name of the entry.
+        :param True | False is_folder: (Optional) True to indicate that the entry is a directory.
+        :param str | None item_id: (Optional) ID of the remote item synced with the entry.
+        :param float window_sec: (Optional) Seconds to wait for the entry to show up elsewhere before removal.
+        :param onedrive_d.common.scan_scheduler.ScanPass | None scan_pass: (Optional) The pass that found the entry
+        missing.
+        """
         super().__init__(task_base=task_base)
         self.local_parent_path = local_parent_path
         self.name = name
         self.is_resolved = False
         self.is_folder = is_folder
+        self.item_id = item_id
+        self.window = window_sec
+        self.remove_after = time.monotonic() + window_sec
+        self.scan_pass = scan_pass
+
+    def is_next_pass_done(self):
+        """
+        :return True | False: True if the pass after the one that found the entry missing is done, or if there is no
+        such pass to wait for.
+        """
+        if self.scan_pass is None:
+            return True
+        return self.scan_pass.scheduler.is_pass_done(self.scan_pass.drive_key, self.scan_pass.generation + 1)
+
+    def is_moved(self):
+        """
+        :return True | False: True if the record of the item shows it is no longer at the path of the task.
+        """
+        if self.item_id is None:
+            return False
+        for record in self.items_store.get_items_by_id(item_id=self.item_id).values():
+            return (record.parent_path, record.item_name) != (self.parent_path, self.name)
+        return False
 
     def handle(self):
         path = self.local_parent_path + '/' + self.name
         try:
-            if self.is_resolved or os.path.exists(path):
+            if self.is_resolved or os.path.exists(path) or self.is_moved():
+                return
+            delay_sec = self.remove_after - time.monotonic()
+            if delay_sec <= 0 and not self.is_next_pass_done():
+                delay_sec = self.window
+            if delay_sec > 0:
+                # Look again once the window is over.
+                self.task_pool.add_task(self, delay_sec=delay_sec)
                 return
             RemoveItemTask(self, local_parent_path=self.local_relative_parent_path, name=self.name,
                            is_folder=self.is_folder).handle()
@@ -512,6 +799,7 @@ class MoveItemTask(NameReferenceMixin, LocalParentPathMixin):
         """
         super().__init__(move_from_task)
         move_from_task.is_resolved = True
+        self.item_id = move_from_task.item_id
         self.old_parent_path = move_from_task.parent_path
         self.old_name = move_from_task.name
         self.local_parent_path = local_parent_path
@@ -519,11 +807,15 @@ class MoveItemTask(NameReferenceMixin, LocalParentPathMixin):
 
     def handle(self):
         try:
-            sleep(seconds=2)
             new_parent_reference = resources.ItemReference.build(path=self.parent_path)
-            item = self.drive.update_item(item_path=self.old_parent_path + '/' + self.old_name, new_name=self.name,
-                                          new_parent_reference=new_parent_reference)
-            self.items_store.update_item(item, ItemRecordStatuses.OK)
+            if self.item_id is not None:
+                item = self.drive.update_item(item_id=self.item_id, new_name=self.name,
+                                              new_parent_reference=new_parent_reference)
+            else:
+                item = self.drive.update_item(item_path=self.old_parent_path + '/' + self.old_name,
+                                              new_name=self.name, new_parent_reference=new_parent_reference)
+            self.items_store.update_item(item, ItemRecordStatuses.OK,
+                                         local_stat=self.stat_local(self.local_parent_path + '/' + self.name))
         except Exception as e:
             self.logger.error('Error occurred when moving to "%s": %s.', self.local_parent_path + '/' + self.name, e)
 
@@ -536,22 +828,36 @@ class CopyItemTask(NameReferenceMixin, LocalParentPathMixin):
         self.name = new_name
 
     def handle(self):
-        dest_reference = resources.ItemReference.build(path=self.local_parent_path)
+        dest_reference = resources.ItemReference.build(path=self.parent_path)
+        path = self.local_parent_path + '/' + self.name
         try:
             async_status = self.drive.copy_item(dest_reference=dest_reference, item_id=self.from_item_id,
-                                                new_item_name=self.name)
-            self.task_pool.add_task(CopyItemStatusMonitorTask(self, async_status, self.local_relative_parent_path,
-                                                              self.name))
+                                                new_name=self.name)
+            monitor_task = CopyItemStatusMonitorTask(self, async_status, self.local_relative_parent_path, self.name)
+            self.task_pool.add_task(monitor_task, delay_sec=monitor_task.poll_delay_sec)
         except Exception as e:
-            self.logger.error('Error occurred when moving to "%s": %s.', self.local_parent_path + '/' + self.name, e)
+            self.logger.error('Error occurred when copying to "%s": %s.', path, e)
+            if os.path.isfile(path):
+                self.logger.info('Fall back to uploading "%s".', path)
+                self.task_pool.add_task(UploadFileTask(self, local_parent_path=self.local_relative_parent_path,
+                                                       name=self.name, dedupe=False))
 
 
 class CopyItemStatusMonitorTask(NameReferenceMixin, LocalParentPathMixin):
+    """
+    Poll the status of a server-side copy. While the copy is in progress the task is put back to the pool with a delay
+    that doubles after each poll, up to POLL_MAX_DELAY_SECONDS.
+    """
+
+    POLL_INITIAL_DELAY_SECONDS = 1
+    POLL_MAX_DELAY_SECONDS = 60
+
     def __init__(self, task_base, async_copy_status, local_parent_path, name):
         super().__init__(task_base)
         self.async_copy_status = async_copy_status
         self.local_parent_path = local_parent_path
         self.name = name
+        self.poll_delay_sec = self.POLL_INITIAL_DELAY_SECONDS
 
     def handle(self):
         path = self.local_parent_path + '/' + self.name
@@ -562,14 +868,19 @@ class CopyItemStatusMonitorTask(NameReferenceMixin, LocalParentPathMixin):
                 if os.path.exists(path):
                     self.logger.info('Server failed to copy item "%s". Fall back to uploading.', path)
                     self.task_pool.add_task(UploadFileTask(self, local_parent_path=self.local_relative_parent_path,
-                                                           name=self.name))
+                                                           name=self.name, dedupe=False))
             elif self.async_copy_status.status == options.AsyncOperationStatuses.COMPLETED:
-                # If completed, update the item.
-                item = self.async_copy_status.get_completed_item()
-                self.items_store.update_item(item, ItemRecordStatuses.OK)
+                # If completed, update the item. The copy carries the timestamps of its source, so set them to
+                # those of the local file.
+                item = self.async_copy_status.get_item()
+                self.items_store.update_item(item, ItemRecordStatuses.OK, local_stat=self.stat_local(path))
+                if os.path.isfile(path):
+                    self.task_pool.add_task(UpdateItemInfoTask(self, self.local_relative_parent_path, self.name,
+                                                               ns_to_datetime(os.stat(path).st_mtime_ns)))
             else:
-                # Put the task back to task pool.
-                self.task_pool.add_task(self)
+                # Put the task back to task pool and poll again later.
+                self.task_pool.add_task(self, delay_sec=self.poll_delay_sec)
+                self.poll_delay_sec = min(self.poll_delay_sec * 2, self.POLL_MAX_DELAY_SECONDS)
         except errors.OneDriveError as e:
             self.logger.error('Error occurred when polling copy to "%s": %s.', path, e)
 
@@ -1,8 +1,8 @@
 __author__ = 'xb'
 
-import json
-
+from onedrive_d.common import json_codec
 from onedrive_d.common.drive_config import DriveConfig
+from onedrive_d.store.task_pool import TaskLanes
 
 
 class UserConfig:
@@ -10,9 +10,17 @@ class UserConfig:
     Global settings for a user.
     """
 
+    DEFAULT_WORKER_LANES = {
+        TaskLanes.METADATA: {'min_workers': 1, 'max_workers': 4},
+        TaskLanes.SMALL_TRANSFER: {'min_workers': 1, 'max_workers': 4},
+        TaskLanes.LARGE_TRANSFER: {'min_workers': 1, 'max_workers': 2},
+    }
+
     DEFAULT_CONFIG = {
-        'num_consumers': 4,
+        'worker_lanes': DEFAULT_WORKER_LANES,
         'deep_sync_interval_seconds': 300,
+        'max_rescan_interval_seconds': 86400,
+        'scan_budget': None,
         'http_retry_after_seconds': 30,
         'default_drive_config': DriveConfig.default_config(),
         'proxies': dict()
@@ -26,8 +34,16 @@ class UserConfig:
         for k in self.DEFAULT_CONFIG:
             if k not in data:
                 data[k] = self.DEFAULT_CONFIG[k]
-        self.num_consumers = data['num_consumers']
+        # Lanes missing from the data, or from configs dumped before lanes existed, use default sizes.
+        worker_lanes = {lane: dict(sizes) for lane, sizes in self.DEFAULT_WORKER_LANES.items()}
+        for lane, sizes in data['worker_lanes'].items():
+            if lane in worker_lanes:
+                worker_lanes[lane].update(sizes)
+        data['worker_lanes'] = worker_lanes
+        self.worker_lanes = worker_lanes
         self.deep_sync_interval_seconds = data['deep_sync_interval_seconds']
+        self.max_rescan_interval_seconds = data['max_rescan_interval_seconds']
+        self.scan_budget = data['scan_budget']
         self.http_retry_after_seconds = data['http_retry_after_seconds']
         self.default_drive_config = data['default_drive_config']
         self.proxies = data['proxies']
@@ -40,16 +56,18 @@ class UserConfig:
             if len(self.proxies) == 0 or self.proxies['https'] == '':
                 self.proxies = None
         data = {
-            'num_consumers': self.num_consumers,
+            'worker_lanes': self.worker_lanes,
             'deep_sync_interval_seconds': self.deep_sync_interval_seconds,
+            'max_rescan_interval_seconds': self.max_rescan_interval_seconds,
+            'scan_budget': self.scan_budget,
             'http_retry_after_seconds': self.http_retry_after_seconds,
             'default_drive_config': self.default_drive_config.dump(exact_dump=True),
             'proxies': self.proxies
         }
-        return json.dumps(data)
+        return json_codec.dumps(data)
 
     @classmethod
     def load(cls, s):
-        data = json.loads(s)
+        data = json_codec.loads(s)
         data['default_drive_config'] = DriveConfig.load(data['default_drive_config'])
         return UserConfig(data)
@@ -1,15 +1,28 @@
+CREATE TABLE IF NOT EXISTS dirs (
+  dir_id        INTEGER PRIMARY KEY,
+  parent_dir_id INTEGER NOT NULL,
+  dir_name      TEXT NOT NULL,
+  UNIQUE (parent_dir_id, dir_name)
+);
 CREATE TABLE IF NOT EXISTS items (
-  item_id       TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+  node_id       INTEGER PRIMARY KEY,
+  item_id       TEXT UNIQUE ON CONFLICT REPLACE,
+  dir_id        INTEGER,
   type          TEXT,
   item_name     TEXT,
   parent_id     TEXT,
-  parent_path   TEXT,
   etag          TEXT,
   ctag          TEXT,
   size          INT,
-  created_time  TEXT,
-  modified_time TEXT,
+  created_time  INTEGER,
+  modified_time INTEGER,
   status        TEXT,
   crc32_hash    TEXT,
-  sha1_hash     TEXT
-);
\ No newline at end of file
+  sha1_hash     TEXT,
+  inode         INTEGER,
+  device        INTEGER
+);
+CREATE INDEX IF NOT EXISTS items_dir_name ON items (dir_id, item_name);
+CREATE INDEX IF NOT EXISTS items_crc32_hash ON items (crc32_hash);
+CREATE INDEX IF NOT EXISTS items_sha1_hash ON items (sha1_hash);
+CREATE INDEX IF NOT EXISTS items_inode ON items (inode, device);
@@ -0,0 +1,30 @@
+DROP INDEX IF EXISTS items_parent_path_name;
+DROP INDEX IF EXISTS items_parent_id;
+DROP INDEX IF EXISTS items_crc32_hash;
+DROP INDEX IF EXISTS items_sha1_hash;
+ALTER TABLE items RENAME TO items_v1;
+CREATE TABLE dirs (
+  dir_id        INTEGER PRIMARY KEY,
+  parent_dir_id INTEGER NOT NULL,
+  dir_name      TEXT NOT NULL,
+  UNIQUE (parent_dir_id, dir_name)
+);
+CREATE TABLE items (
+  node_id       INTEGER PRIMARY KEY,
+  item_id       TEXT UNIQUE ON CONFLICT REPLACE,
+  dir_id        INTEGER,
+  type          TEXT,
+  item_name     TEXT,
+  parent_id     TEXT,
+  etag          TEXT,
+  ctag          TEXT,
+  size          INT,
+  created_time  TEXT,
+  modified_time TEXT,
+  status        TEXT,
+  crc32_hash    TEXT,
+  sha1_hash     TEXT
+);
+CREATE INDEX items_dir_name ON items (dir_id, item_name);
+CREATE INDEX items_crc32_hash ON items (crc32_hash);
+CREATE INDEX items_sha1_hash ON items (sha1_hash);
@@ -0,0 +1,3 @@
+ALTER TABLE items ADD COLUMN inode INTEGER;
+ALTER TABLE items ADD COLUMN device INTEGER;
+CREATE INDEX items_inode ON items (inode, device);
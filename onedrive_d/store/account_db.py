@@ -1,28 +1,115 @@
 __author__ = 'xb'
 
 import atexit
+import contextlib
+import fcntl
 import sqlite3
 
 from onedrive_d import get_content
 from onedrive_d.api import accounts
 from onedrive_d.api import resources
+from onedrive_d.common import json_codec
 from onedrive_d.common import logger_factory
 
 
+class TokenStore:
+    """
+    Share the tokens of accounts between the processes that load the same account database. OneDrive replaces the
+    refresh token at every renewal, so a process must neither renew with a refresh token another process has used up,
+    nor write back tokens older than those in the database. Renewals hold an exclusive lock on a file next to the
+    database, take the tokens from the database if another process renewed them meanwhile, and save renewed tokens
+    right away.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param str db_path: Path to account database.
+        """
+        self.db_path = db_path
+        self.lock_path = db_path + '.lock'
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Hold the lock shared by all processes, and all threads, using the database.
+        """
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _execute(self, sql, params):
+        # Renewals run in worker threads, which cannot use the connection of AccountStorage.
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def get_newer_session(self, account):
+        """
+        :param onedrive_d.api.accounts.PersonalAccount account:
+        :return (dict[str, str], float) | None: Session info and expiration time of the account in the database, or
+        None if they are not newer than those of the account.
+        """
+        rows = self._execute('SELECT account_dump FROM accounts WHERE account_id=? AND account_type=?',
+                             (account.profile.user_id, account.TYPE))
+        if len(rows) == 0:
+            return None
+        data = json_codec.loads(rows[0][0])
+        if data['expires_at'] <= account.expires_at:
+            return None
+        return data['session_info'], data['expires_at']
+
+    def reload_tokens(self, account):
+        """
+        Called with lock held before the tokens of the account are renewed.
+        :param onedrive_d.api.accounts.PersonalAccount account:
+        :return True | False: True if the account now uses newer tokens another process saved.
+        """
+        newer_session = self.get_newer_session(account)
+        if newer_session is None:
+            return False
+        session_info, account.expires_at = newer_session
+        account.load_session(session_info)
+        return True
+
+    def save_tokens(self, account):
+        """
+        Called with lock held after the tokens of the account were renewed.
+        :param onedrive_d.api.accounts.PersonalAccount account:
+        """
+        self._execute('UPDATE accounts SET account_dump=? WHERE account_id=? AND account_type=?',
+                      (account.dump(), account.profile.user_id, account.TYPE))
+
+
 class AccountStorage:
     """
-    A SQLite-based storage layer for account and drive objects.
+    A SQLite-based storage layer for account and drive objects. An account is loaded once; the loaded object, whose
+    tokens are renewed in memory, is returned by every later call and written back on close.
     """
 
     logger = logger_factory.get_logger('AccountStorage')
 
-    def __init__(self, db_path, personal_client=None, business_client=None):
+    def __init__(self, db_path, personal_client=None, business_client=None, account_keys=None, token_store=None):
+        """
+        :param str db_path: Path to account database.
+        :param onedrive_d.api.clients.PersonalClient personal_client: (Optional)
+        :param onedrive_d.api.clients.BusinessClient business_client: (Optional)
+        :param set[(str, str)] | None account_keys: (Optional) Only load the accounts of these (account_id,
+        account_type) keys, so that a process serving some drives does not write back the tokens of other accounts.
+        :param TokenStore | None token_store: (Optional) Share the tokens of loaded accounts with other processes.
+        """
         self._conn = sqlite3.connect(db_path, isolation_level=None)
         self._cursor = self._conn.cursor()
         self._cursor.execute(get_content('onedrive_accounts.sql'))
         self._conn.commit()
         self.personal_client = personal_client
         self.business_client = business_client
+        self.account_keys = account_keys
+        self.token_store = token_store
         self._all_accounts = {}
         atexit.register(self.close)
 
@@ -43,6 +130,7 @@ class AccountStorage:
             return
         try:
             account = account_cls.load(client, account_dump)
+            account.token_store = self.token_store
             container[(account_id, account_type)] = account
         except ValueError as e:
             self.logger.warning('Failed to deserialize account %s: %s', account_id, e)
@@ -59,6 +147,9 @@ class AccountStorage:
         q = self._cursor.execute('SELECT account_id, account_type, account_dump, profile_dump FROM accounts')
         for row in q.fetchall():
             account_id, account_type, account_dump, profile_dump = row
+            if (account_id, account_type) in self._all_accounts or \
+                    (self.account_keys is not None and (account_id, account_type) not in self.account_keys):
+                continue
             self.deserialize_account_row(account_id, account_type, account_dump, profile_dump, self._all_accounts)
         return self._all_accounts
 
@@ -86,12 +177,22 @@ class AccountStorage:
         del self._all_accounts[key]
         self._cursor.execute('DELETE FROM accounts WHERE account_id=? AND account_type=?', key)
 
-    def close(self):
-        # Write all data back to database
-        self.logger.info('Writing account information back to storage...')
+    def write_back(self):
         for account_key, account in self._all_accounts.items():
+            if self.token_store is not None and self.token_store.get_newer_session(account) is not None:
+                # Another process renewed the tokens after this one did.
+                continue
             self.insert_record(account)
         self._conn.commit()
+
+    def close(self):
+        # Write all data back to database
+        self.logger.info('Writing account information back to storage...')
+        if self.token_store is None:
+            self.write_back()
+        else:
+            with self.token_store.lock():
+                self.write_back()
         # Close database connection
         self.logger.info('Closing account storage...')
         self._cursor.close()
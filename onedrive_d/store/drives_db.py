@@ -9,6 +9,11 @@ from onedrive_d.common import logger_factory
 
 
 class DriveStorage:
+    """
+    A SQLite-based storage layer for drive objects. A drive is loaded once and the same object is returned by every
+    later call to get_all_drives, so that item storages, locks and tasks keyed on it stay shared.
+    """
+
     logger = logger_factory.get_logger('DriveStorage')
 
     def __init__(self, db_path, account_store):
@@ -21,6 +26,7 @@ class DriveStorage:
         self._cursor.execute(get_content('onedrive_drives.sql'))
         self._conn.commit()
         self._all_drives = {}
+        self._drive_dumps = {}
         self._drive_roots = {}
         self.account_store = account_store
         atexit.register(self.close)
@@ -31,6 +37,12 @@ class DriveStorage:
 
     def assemble_drive_record(self, row, container):
         drive_id, account_id, account_type, drive_dump = row
+        key = self.get_key(drive_id, account_id, account_type)
+        if key in container:
+            if self._drive_dumps.get(key) != drive_dump:
+                self.reload_drive_config(container[key], drive_dump)
+                self._drive_dumps[key] = drive_dump
+            return
         try:
             drive_root = self.get_drive_root(account_id, account_type)
         except KeyError:
@@ -40,9 +52,27 @@ class DriveStorage:
         try:
             drive = drives.DriveObject.load(drive_root, account_id, account_type, drive_dump)
             container[self.get_key(drive.drive_id, account_id, account_type)] = drive
+            self._drive_dumps[key] = drive_dump
         except ValueError as e:
             self.logger.warning('Cannot load drive %s from database: %s', drive_id, e)
 
+    def reload_drive_config(self, drive, drive_dump):
+        """
+        Apply a record that changed since the drive was loaded to the loaded drive object, keeping its identity.
+        :param onedrive_d.api.drives.DriveObject drive:
+        :param str drive_dump:
+        """
+        try:
+            new_drive = drives.DriveObject.load(drive.root, drive.root.account.profile.user_id,
+                                                drive.root.account.TYPE, drive_dump)
+        except ValueError as e:
+            self.logger.warning('Cannot reload drive %s from database: %s', drive.drive_id, e)
+            return
+        # noinspection PyProtectedMember
+        drive._data = new_drive._data
+        drive.config = new_drive.config
+        drive.root.add_cached_drive(drive.root.account.profile.user_id, drive.root.account.TYPE, drive)
+
     def get_drive_root(self, account_id, account_type):
         key = (account_id, account_type)
         if key not in self._drive_roots:
@@ -52,10 +82,25 @@ class DriveStorage:
     def get_all_drives(self):
         self._conn.commit()
         q = self._cursor.execute('SELECT drive_id, account_id, account_type, drive_dump FROM drives')
+        keys = set()
         for row in q.fetchall():
+            keys.add(self.get_key(*row[:3]))
             self.assemble_drive_record(row, self._all_drives)
+        # Forget drives whose records were deleted by another process.
+        for key in list(self._all_drives):
+            if key not in keys:
+                del self._all_drives[key]
+                self._drive_dumps.pop(key, None)
         return self._all_drives
 
+    def get_all_drive_keys(self):
+        """
+        :return [(str, str, str)]: Keys of all drive records, without loading the drives or their accounts.
+        """
+        self._conn.commit()
+        q = self._cursor.execute('SELECT drive_id, account_id, account_type FROM drives')
+        return [self.get_key(*row) for row in q.fetchall()]
+
     def add_record(self, drive):
         account = drive.root.account
         params = (drive.drive_id, account.profile.user_id, account.TYPE, drive.config.local_root, drive.dump())
@@ -65,7 +110,8 @@ class DriveStorage:
 
     def delete_record(self, drive):
         key = self.get_key(drive.drive_id, drive.root.account.profile.user_id, drive.root.account.TYPE)
-        del self._all_drives[key]
+        self._all_drives.pop(key, None)
+        self._drive_dumps.pop(key, None)
         self._cursor.execute('DELETE FROM drives WHERE drive_id=? AND account_id=? AND account_type=?', key)
         self._conn.commit()
 
@@ -1,13 +1,23 @@
 __author__ = 'xb'
 
 import atexit
+import contextlib
 import sqlite3
+import threading
+import time
 
 from onedrive_d import get_content
-from onedrive_d import datetime_to_str, str_to_datetime
+from onedrive_d import datetime_to_ns, ns_to_datetime, str_to_datetime
 from onedrive_d.common import logger_factory
+from onedrive_d.common import metrics
 from onedrive_d.vendor import rwlock
 
+COMMIT_DURATION = metrics.histogram('onedrived_items_db_commit_duration_seconds',
+                                    'Time spent committing batches of item record mutations.')
+COMMIT_BATCH_SIZE = metrics.histogram('onedrived_items_db_commit_batch_size',
+                                      'Number of item record mutations per commit.',
+                                      buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
 
 def create_item_db_name(drive):
     account = drive.root.account
@@ -22,27 +32,95 @@ class ItemRecordStatuses:
 
 
 class ItemRecord:
+    """
+    A row of the items table. Timestamps are kept as UNIX timestamps in nanoseconds and only converted to datetime
+    objects when asked for. inode and device identify the local file or directory last synced with the item, and are
+    None if unknown.
+    """
+
+    __slots__ = ('item_id', 'type', 'item_name', 'parent_id', 'parent_path', 'e_tag', 'c_tag', 'size',
+                 'created_time_ns', 'modified_time_ns', 'status', 'crc32_hash', 'sha1_hash', 'inode', 'device')
+
     def __init__(self, row):
         self.item_id, self.type, self.item_name, self.parent_id, self.parent_path, self.e_tag, self.c_tag, self.size, \
-        self.created_time, self.modified_time, self.status, self.crc32_hash, self.sha1_hash = row
-        self.created_time = str_to_datetime(self.created_time)
-        self.modified_time = str_to_datetime(self.modified_time)
-        self.local_path = self.parent_path.split(':', 1)[1] + '/' + self.item_name
+        self.created_time_ns, self.modified_time_ns, self.status, self.crc32_hash, self.sha1_hash, self.inode, \
+        self.device = row
+
+    @property
+    def created_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        return ns_to_datetime(self.created_time_ns)
+
+    @property
+    def modified_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        return ns_to_datetime(self.modified_time_ns)
+
+    @property
+    def local_path(self):
+        """
+        :return str: Path of the item relative to drive's local root.
+        """
+        return self.parent_path.split(':', 1)[1] + '/' + self.item_name
 
 
 class ItemStorageManager:
+    """
+    Owns one item storage per drive. Storages are keyed on the identity of the drive rather than on the drive object,
+    so a drive loaded again from the database gets the existing storage (and its connection and lock) back.
+    """
+
     def __init__(self, item_storage_dir):
         self.item_storage_dir = item_storage_dir
         self.item_storages = {}
 
+    @staticmethod
+    def get_drive_key(drive):
+        """
+        :param onedrive_d.api.drives.DriveObject drive:
+        :return (str, str, str): Drive ID, account ID and account type, as keyed by the drive storage.
+        """
+        account = drive.root.account
+        return drive.drive_id, account.profile.user_id, account.TYPE
+
+    def flush_all(self):
+        """
+        Commit the pending writes of all item storages.
+        """
+        for storage in self.item_storages.values():
+            storage.flush()
+
     def get_item_storage(self, drive):
-        if drive not in self.item_storages:
+        key = self.get_drive_key(drive)
+        storage = self.item_storages.get(key)
+        if storage is None:
             if self.item_storage_dir == ':memory:':
                 db_path = ':memory:'
             else:
                 db_path = self.item_storage_dir + '/' + create_item_db_name(drive)
-            self.item_storages[drive] = ItemStorage(db_path, drive)
-        return self.item_storages[drive]
+            storage = self.item_storages[key] = ItemStorage(db_path, drive)
+            storage.manager = self
+        elif getattr(drive, 'storage_lock', None) is not storage.lock:
+            drive.storage_lock = storage.lock
+        return storage
+
+    def get_items_by_hash(self, crc32_hash=None, sha1_hash=None):
+        """
+        Find records whose hash values match either parameter in the item storages of all drives.
+        :param str crc32_hash: CRC32 hash of the target item.
+        :param str sha1_hash: SHA-1 hash of the target item.
+        :return [(onedrive_d.api.drives.DriveObject, onedrive_d.store.items_db.ItemRecord)]: Qualified records and
+        the drives they belong to.
+        """
+        ret = []
+        for storage in list(self.item_storages.values()):
+            for record in storage.get_items_by_hash(crc32_hash=crc32_hash, sha1_hash=sha1_hash).values():
+                ret.append((storage.drive, record))
+        return ret
 
 
 class ItemStorage:
@@ -52,28 +130,285 @@ class ItemStorage:
 
     logger = logger_factory.get_logger('ItemStorage')
 
-    def __init__(self, db_path, drive):
+    # Bump the version and add a data/onedrive_items_migrate_<version>.sql script (and optionally a
+    # _migrate_data_to_<version> method) when the schema changes.
+    SCHEMA_VERSION = 4
+    CONNECTION_PRAGMAS = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA cache_size=-8192',
+        'PRAGMA busy_timeout=5000'
+    ]
+    CACHED_STATEMENTS = 256
+    ROOT_PARENT_DIR_ID = 0
+    SELECT_ITEM_SQL = 'SELECT item_id, type, item_name, parent_id, dir_id, etag, ctag, size, created_time, ' \
+                      'modified_time, status, crc32_hash, sha1_hash, inode, device FROM items WHERE '
+    INSERT_ITEM_SQL = 'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, dir_id, etag, ctag, size, ' \
+                      'created_time, modified_time, status, crc32_hash, sha1_hash) ' \
+                      'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    # Unless a new local stat is given, keep the inode and device already recorded for the item.
+    UPDATE_ITEM_SQL = 'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, dir_id, etag, ctag, size, ' \
+                      'created_time, modified_time, status, crc32_hash, sha1_hash, inode, device) ' \
+                      'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ' \
+                      'COALESCE(?, (SELECT inode FROM items WHERE item_id=?)), ' \
+                      'COALESCE(?, (SELECT device FROM items WHERE item_id=?)))'
+    COMMIT_INTERVAL_SECONDS = 0.01
+    MAX_BATCH_SIZE = 256
+
+    def __init__(self, db_path, drive, commit_interval_sec=COMMIT_INTERVAL_SECONDS, max_batch_size=MAX_BATCH_SIZE):
         """
+        Record mutations are written behind: they run inside an open transaction on the storage's connection, and the
+        transaction is committed after commit_interval_sec or after max_batch_size mutations, whichever comes first.
+        Because readers share the same connection, they always see the pending mutations. Each mutation runs in a
+        savepoint of its own, so one that fails is rolled back without affecting the others in the batch.
         :param str db_path: A unique path for the database to store items for the target drive.
         :param onedrive_d.api.drives.DriveObject drive: The underlying drive object.
+        :param float commit_interval_sec: (Optional) Max amount of seconds a mutation stays uncommitted.
+        :param int max_batch_size: (Optional) Max number of mutations to group into one transaction.
         """
         if not hasattr(drive, 'storage_lock'):
             drive.storage_lock = rwlock.RWLock()
         self.lock = drive.storage_lock
-        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False,
+                                     cached_statements=self.CACHED_STATEMENTS)
         self.drive = drive
+        self.manager = None
+        self._dir_ids = {}
+        self._dir_paths = {}
         self._cursor = self._conn.cursor()
-        self._cursor.execute(get_content('onedrive_items.sql'))
-        self._conn.commit()
+        for pragma in self.CONNECTION_PRAGMAS:
+            self._cursor.execute(pragma)
+        self.upgrade_schema()
+        self.commit_interval = commit_interval_sec
+        self.max_batch_size = max_batch_size
+        self._pending_writes = 0
+        # The time.monotonic() value by which the pending writes are to be committed, or None if none is pending.
+        self._flush_due = None
+        self._flush_cond = threading.Condition()
+        self._flusher = None
+        self._closed = False
         atexit.register(self.close)
 
+    def get_schema_version(self):
+        """
+        :return int: Schema version of the database. 0 for databases created before versioning was introduced.
+        """
+        return self._conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def upgrade_schema(self):
+        """
+        Create the schema for a new database, or run the migration scripts needed to bring an existing database up to
+        SCHEMA_VERSION. Each migration runs in its own transaction together with the version bump.
+        """
+        version = self.get_schema_version()
+        is_new = self._conn.execute(
+            'SELECT name FROM sqlite_master WHERE type=\'table\' AND name=\'items\'').fetchone() is None
+        if is_new:
+            scripts = [(self.SCHEMA_VERSION, get_content('onedrive_items.sql'))]
+        else:
+            scripts = [(v, get_content('onedrive_items_migrate_%d.sql' % v))
+                       for v in range(version + 1, self.SCHEMA_VERSION + 1)]
+        for v, script in scripts:
+            self._cursor.executescript('BEGIN;\n' + script)
+            if not is_new:
+                self.logger.info('Migrating item database of drive %s to schema version %d.', self.drive.drive_id, v)
+                # Some migrations need to transform data in ways SQL scripts cannot express.
+                migrate_data = getattr(self, '_migrate_data_to_%d' % v, None)
+                if migrate_data is not None:
+                    migrate_data()
+            self._cursor.execute('PRAGMA user_version=%d' % v)
+            self._cursor.execute('COMMIT')
+
+    def _migrate_data_to_2(self):
+        """
+        Move records from the path-based table to the tree-structured tables.
+        """
+        q = self._conn.execute('SELECT item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
+                               'created_time, modified_time, status, crc32_hash, sha1_hash FROM items_v1')
+        for row in q.fetchall():
+            row = row[:4] + (self._get_dir_id(row[4], create=True),) + row[5:]
+            self._cursor.execute(self.INSERT_ITEM_SQL, row)
+        self._cursor.execute('DROP TABLE items_v1')
+
+    def _migrate_data_to_3(self):
+        """
+        Convert ISO-8601 timestamp strings to UNIX timestamps in nanoseconds.
+        """
+        q = self._conn.execute('SELECT item_id, type, item_name, parent_id, dir_id, etag, ctag, size, '
+                               'created_time, modified_time, status, crc32_hash, sha1_hash FROM items_v2')
+        for row in q.fetchall():
+            timestamps = tuple(None if t is None else datetime_to_ns(str_to_datetime(t)) for t in row[8:10])
+            self._cursor.execute(self.INSERT_ITEM_SQL, row[:8] + timestamps + row[10:])
+        self._cursor.execute('DROP TABLE items_v2')
+
     def close(self):
-        self._cursor.close()
-        self._conn.close()
+        self.lock.writer_acquire()
+        if not self._closed:
+            self._commit()
+            self._closed = True
+            self._cursor.close()
+            self._conn.close()
+            with self._flush_cond:
+                self._flush_cond.notify()
+        self.lock.writer_release()
+
+    @contextlib.contextmanager
+    def _mutation(self):
+        """
+        Run the body as a single mutation of the pending batch: if it raises, everything it wrote is undone and the
+        rest of the batch is kept. Must be used with writer lock held.
+        """
+        # A batch whose first mutation failed is left open with no write counted.
+        if not self._conn.in_transaction:
+            self._cursor.execute('BEGIN')
+        self._cursor.execute('SAVEPOINT mutation')
+        try:
+            yield
+        except BaseException:
+            if self._conn.in_transaction:
+                self._cursor.execute('ROLLBACK TO mutation')
+                self._cursor.execute('RELEASE mutation')
+            else:
+                # SQLite rolled back the whole transaction on the error.
+                self._pending_writes = 0
+            # The cached paths may name directory nodes that were just rolled back.
+            self._invalidate_dir_cache()
+            raise
+        self._cursor.execute('RELEASE mutation')
+        self._end_write()
+
+    def _end_write(self):
+        """
+        Must be called with writer lock held after a mutation.
+        """
+        self._pending_writes += 1
+        if self._pending_writes >= self.max_batch_size:
+            self._commit()
+            return
+        with self._flush_cond:
+            if self._flush_due is None:
+                self._flush_due = time.monotonic() + self.commit_interval
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run_flusher, name='ItemStorageFlusher', daemon=True)
+                    self._flusher.start()
+                self._flush_cond.notify()
+
+    def _run_flusher(self):
+        """
+        Body of the thread that commits pending writes once they are due. One thread serves the storage for its life.
+        """
+        while True:
+            with self._flush_cond:
+                if self._closed:
+                    return
+                if self._flush_due is None:
+                    self._flush_cond.wait()
+                    continue
+                timeout = self._flush_due - time.monotonic()
+                if timeout > 0:
+                    self._flush_cond.wait(timeout)
+                    continue
+            self.flush()
+
+    def _commit(self):
+        """
+        Must be called with writer lock held.
+        """
+        with self._flush_cond:
+            self._flush_due = None
+        if self._pending_writes > 0:
+            start_time = time.monotonic()
+            self._cursor.execute('COMMIT')
+            COMMIT_DURATION.observe(time.monotonic() - start_time)
+            COMMIT_BATCH_SIZE.observe(self._pending_writes)
+            self._pending_writes = 0
+
+    @property
+    def pending_writes(self):
+        """
+        :return int: Number of mutations not yet committed.
+        """
+        return self._pending_writes
+
+    def flush(self):
+        """
+        Commit all pending mutations.
+        """
+        self.lock.writer_acquire()
+        if not self._closed:
+            self._commit()
+        self.lock.writer_release()
 
     def local_path_to_remote_path(self, local_path):
         return self.drive.drive_path + '/root:' + local_path
 
+    def _get_dir_id(self, path, create=False):
+        """
+        Translate a remote directory path to the ID of its node in the directory tree. The node of the drive root is
+        named after the part of the path before the first ':', e.g., "/drive/root:".
+        Must be called with lock held (writer lock if create is True).
+        :param str | None path: Path like "/drive/root:/foo/bar".
+        :param True | False create: If True, create the missing nodes along the path.
+        :return int | None: ID of the directory node, or None if the path is not recorded.
+        """
+        if path is None:
+            return None
+        if path in self._dir_ids:
+            return self._dir_ids[path]
+        root, sep, rest = path.partition(':')
+        names = [root + sep] + rest.split('/')[1:]
+        dir_id = self.ROOT_PARENT_DIR_ID
+        for name in names:
+            row = self._conn.execute('SELECT dir_id FROM dirs WHERE parent_dir_id=? AND dir_name=?',
+                                     (dir_id, name)).fetchone()
+            if row is not None:
+                dir_id = row[0]
+            elif create:
+                dir_id = self._cursor.execute('INSERT INTO dirs (parent_dir_id, dir_name) VALUES (?, ?)',
+                                              (dir_id, name)).lastrowid
+            else:
+                return None
+        self._dir_ids[path] = dir_id
+        self._dir_paths[dir_id] = path
+        return dir_id
+
+    def _get_dir_path(self, dir_id):
+        """
+        Derive the remote path of a directory node by walking up the tree. Must be called with lock held.
+        :param int | None dir_id: ID of the directory node.
+        :return str | None:
+        """
+        if dir_id is None:
+            return None
+        if dir_id in self._dir_paths:
+            return self._dir_paths[dir_id]
+        names = []
+        node = dir_id
+        while node != self.ROOT_PARENT_DIR_ID:
+            node, name = self._conn.execute('SELECT parent_dir_id, dir_name FROM dirs WHERE dir_id=?',
+                                            (node,)).fetchone()
+            names.append(name)
+        path = '/'.join(reversed(names))
+        self._dir_ids[path] = dir_id
+        self._dir_paths[dir_id] = path
+        return path
+
+    def _invalidate_dir_cache(self):
+        """
+        Called after nodes in the directory tree are moved or deleted, which changes paths of whole subtrees.
+        """
+        self._dir_ids.clear()
+        self._dir_paths.clear()
+
+    def _get_subdir_id(self, dir_id, name):
+        """
+        :return int | None: ID of the node of directory "name" under node dir_id.
+        """
+        row = self._conn.execute('SELECT dir_id FROM dirs WHERE parent_dir_id=? AND dir_name=?',
+                                 (dir_id, name)).fetchone()
+        return None if row is None else row[0]
+
     def get_items_by_id(self, item_id=None, parent_path=None, item_name=None, local_parent_path=None):
         """
         FInd all qualified records from database by ID or path.
@@ -98,18 +433,31 @@ class ItemStorage:
         args = {'crc32_hash': crc32_hash, 'sha1_hash': sha1_hash}
         return self.get_items(args, 'OR')
 
-    @staticmethod
-    def _get_where_clause(args, relation='AND'):
+    def get_items_by_inode(self, inode, device):
+        """
+        Find the records of items last synced with the local file or directory of the given inode.
+        :param int inode:
+        :param int device:
+        :return dict[str, onedrive_d.store.items_db.ItemRecord]: All qualified records index by item ID.
         """
-        Form a where clause in SQL query and the tuples for the filler values.
+        return self.get_items({'inode': inode, 'device': device})
+
+    def _get_where_clause(self, args, relation='AND'):
+        """
+        Form a where clause in SQL query and the tuples for the filler values. A parent_path criterion is translated
+        to the node of the parent directory. Must be called with lock held.
         :param dict[str, str | int]] args: Keys are where conditions and values are the filler values.
         :param str relation: Either 'AND' or 'OR'.
-        :return (str, ()):
+        :return (str, ()) | (None, None): None if the criteria refer to a directory that is not recorded.
         """
         keys = []
         values = []
         for k, v in args.items():
             if v is not None:
+                if k == 'parent_path':
+                    k, v = 'dir_id', self._get_dir_id(v)
+                    if v is None:
+                        return None, None
                 keys.append(k + '=?')
                 values.append(v)
         relation = ' ' + relation + ' '
@@ -121,47 +469,88 @@ class ItemStorage:
         :param str relation: Relation of the criteria.
         :return dict[str, onedrive_d.store.items_db.ItemRecord]: All matching rows in the form of ItemRecord.
         """
-        where, values = self._get_where_clause(args, relation)
         ret = {}
         self.lock.reader_acquire()
-        q = self._conn.execute('SELECT item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
-                                 'created_time, modified_time, status, crc32_hash, sha1_hash FROM items WHERE ' +
-                                 where, values)
-        for row in q.fetchall():
-            item = ItemRecord(row)
-            ret[item.item_id] = item
+        where, values = self._get_where_clause(args, relation)
+        if where is not None:
+            q = self._conn.execute(self.SELECT_ITEM_SQL + where, values)
+            for row in q.fetchall():
+                item = ItemRecord(row[:4] + (self._get_dir_path(row[4]),) + row[5:])
+                ret[item.item_id] = item
         self.lock.reader_release()
         return ret
 
-    def update_item(self, item, status=ItemRecordStatuses.OK, parent_path=None):
+    def update_item(self, item, status=ItemRecordStatuses.OK, parent_path=None, local_stat=None):
         """
+        Insert or update the record of an item. If a recorded folder is renamed or moved, its node in the directory
+        tree is moved with it, so that records of its descendants follow without being rewritten.
         :param onedrive_d.api.items.OneDriveItem item:
         :param str status:
+        :param os.stat_result | None local_stat: (Optional) Stat of the local entry synced with the item. If None,
+        keep the inode and device previously recorded.
         :return:
         """
-        if item.is_folder:
+        # The server omits hashes for some files, e.g., empty ones.
+        hashes = None if item.is_folder else item.file_props.hashes
+        if hashes is None:
             crc32_hash = None
             sha1_hash = None
         else:
-            file_facet = item.file_props
-            crc32_hash = file_facet.hashes.crc32
-            sha1_hash = file_facet.hashes.sha1
+            crc32_hash = hashes.crc32
+            sha1_hash = hashes.sha1
         parent_ref = item.parent_reference
         try:
             parent_path = parent_ref.path
         except:
             pass
-        created_time_str = datetime_to_str(item.created_time)
-        modified_time_str = datetime_to_str(item.modified_time)
+        created_time = datetime_to_ns(item.created_time)
+        modified_time = datetime_to_ns(item.modified_time)
+        inode, device = (None, None) if local_stat is None else (local_stat.st_ino, local_stat.st_dev)
         self.lock.writer_acquire()
-        self._cursor.execute(
-            'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, parent_path, etag, '
-            'ctag, size, created_time, modified_time, status, crc32_hash, sha1_hash)'
-            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (item.id, item.type, item.name, parent_ref.id, parent_path, item.e_tag, item.c_tag,
-             item.size, created_time_str, modified_time_str, status, crc32_hash, sha1_hash))
-        self._conn.commit()
-        self.lock.writer_release()
+        try:
+            if parent_path is None:
+                self.logger.warning('Item %s was not recorded because the path of its parent is unknown.', item.id)
+                return
+            with self._mutation():
+                dir_id = self._get_dir_id(parent_path, create=True)
+                if item.is_folder:
+                    self._move_dir_node(item.id, dir_id, item.name)
+                self._cursor.execute(self.UPDATE_ITEM_SQL, (
+                    item.id, item.type, item.name, parent_ref.id, dir_id, item.e_tag, item.c_tag, item.size,
+                    created_time, modified_time, status, crc32_hash, sha1_hash, inode, item.id, device, item.id))
+        finally:
+            self.lock.writer_release()
+
+    def update_local_stat(self, item_id, local_stat):
+        """
+        Record the inode and device of the local entry synced with an item.
+        :param str item_id:
+        :param os.stat_result local_stat:
+        """
+        self.lock.writer_acquire()
+        try:
+            with self._mutation():
+                self._cursor.execute('UPDATE items SET inode=?, device=? WHERE item_id=?',
+                                     (local_stat.st_ino, local_stat.st_dev, item_id))
+        finally:
+            self.lock.writer_release()
+
+    def _move_dir_node(self, item_id, new_dir_id, new_name):
+        """
+        If the folder item was recorded at a different location, move its directory node. Must be called with writer
+        lock held.
+        """
+        row = self._conn.execute('SELECT dir_id, item_name FROM items WHERE item_id=?', (item_id,)).fetchone()
+        if row is None or row == (new_dir_id, new_name) or row[0] is None:
+            return
+        node = self._get_subdir_id(row[0], row[1])
+        if node is None:
+            return
+        if self._get_subdir_id(new_dir_id, new_name) is not None:
+            self.logger.warning('Cannot move directory node of item %s because destination is occupied.', item_id)
+            return
+        self._cursor.execute('UPDATE dirs SET parent_dir_id=?, dir_name=? WHERE dir_id=?', (new_dir_id, new_name, node))
+        self._invalidate_dir_cache()
 
     def delete_item(self, item_id=None, parent_path=None, item_name=None, local_parent_path=None, is_folder=False):
         """
@@ -174,21 +563,37 @@ class ItemStorage:
         """
         if local_parent_path is not None:
             parent_path = self.local_path_to_remote_path(local_parent_path)
-        where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
         self.lock.writer_acquire()
-        if is_folder:
-            # Translate ID reference to path and name reference.
-            q = self._cursor.execute('SELECT item_id, parent_path, item_name FROM items WHERE ' + where, values)
-            row = q.fetchone()
-            if row is None:
-                self.logger.warning('The folder to delete does not exist: %s, %s', where, str(values))
-            else:
-                item_id, parent_path, item_name = row
-                self._cursor.execute('DELETE FROM items WHERE parent_id=? OR parent_path LIKE ?',
-                                     (item_id, parent_path + '/' + item_name + '/%'))
-        self._cursor.execute('DELETE FROM items WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.writer_release()
+        try:
+            where, values = self._get_where_clause(
+                {'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
+            if where is None:
+                return
+            with self._mutation():
+                if is_folder:
+                    # Translate ID reference to the node of the folder in directory tree.
+                    row = self._conn.execute('SELECT dir_id, item_name FROM items WHERE ' + where, values).fetchone()
+                    if row is None:
+                        self.logger.warning('The folder to delete does not exist: %s, %s', where, str(values))
+                    else:
+                        node = self._get_subdir_id(*row)
+                        if node is not None:
+                            self._delete_subtree(node)
+                self._cursor.execute('DELETE FROM items WHERE ' + where, values)
+        finally:
+            self.lock.writer_release()
+
+    def _delete_subtree(self, node):
+        """
+        Delete the directory node, all nodes under it, and records of all items in them. Must be called with writer
+        lock held.
+        :param int node: ID of the directory node.
+        """
+        subtree = 'WITH RECURSIVE subtree(dir_id) AS (SELECT ? UNION ALL SELECT dirs.dir_id FROM dirs, subtree ' \
+                  'WHERE dirs.parent_dir_id=subtree.dir_id) '
+        self._cursor.execute(subtree + 'DELETE FROM items WHERE dir_id IN subtree', (node,))
+        self._cursor.execute(subtree + 'DELETE FROM dirs WHERE dir_id IN subtree', (node,))
+        self._invalidate_dir_cache()
 
     def update_status(self, status, item_id=None, parent_path=None, item_name=None, local_parent_path=None):
         """
@@ -200,9 +605,12 @@ class ItemStorage:
         """
         if local_parent_path is not None:
             parent_path = self.local_path_to_remote_path(local_parent_path)
-        where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
-        values = (status,) + values
         self.lock.writer_acquire()
-        self._cursor.execute('UPDATE items SET status=? WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.writer_release()
+        try:
+            where, values = self._get_where_clause(
+                {'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
+            if where is not None:
+                with self._mutation():
+                    self._cursor.execute('UPDATE items SET status=? WHERE ' + where, (status,) + values)
+        finally:
+            self.lock.writer_release()
@@ -1,19 +1,55 @@
 __author__ = 'xb'
 
+import collections
+import heapq
+import itertools
 import threading
+import time
 
 from onedrive_d.common import logger_factory
+from onedrive_d.common import metrics
 from onedrive_d.vendor import rwlock
 
 
+class TaskLanes:
+    """
+    Queues of the task pool. Each lane is served by its own workers so that long transfers do not hold up the
+    metadata work that discovers them.
+    """
+    METADATA = 'metadata'
+    SMALL_TRANSFER = 'small_transfer'
+    LARGE_TRANSFER = 'large_transfer'
+    ALL = (METADATA, SMALL_TRANSFER, LARGE_TRANSFER)
+
+
+QUEUE_LENGTH = metrics.gauge('onedrived_task_queue_length', 'Number of tasks ready for workers.', ['lane'])
+DELAYED_TASKS = metrics.gauge('onedrived_delayed_tasks', 'Number of tasks waiting for their delay to pass.')
+TASKS_QUEUED = metrics.counter('onedrived_tasks_queued_total', 'Number of tasks put in the queues.', ['lane'])
+
+
 class TaskPool:
     """
-    An in-memory, singleton storage for Tasks based on hash maps.
+    An in-memory, singleton storage for Tasks based on hash maps. Tasks are queued by their lane attribute (see
+    TaskLanes; METADATA if not set). A task can be added with a delay, in which case it is kept in a heap ordered by
+    due time and handed to workers by a timer thread once the delay is over.
+
+    Each queued task releases both the semaphore of its lane and the semaphore shared by all lanes, so a consumer
+    may find that another consumer took the task it was woken for and must tolerate pop_task() returning None.
+
+    Within a lane, each drive has its own FIFO, and the drives with queued tasks share the workers of the lane by the
+    weight in their DriveConfig. Each drive has a virtual time that advances by 1 / weight per task taken, and the drive
+    with the smallest virtual time goes next (stride scheduling, a smooth weighted round-robin). A drive that had no
+    queued task resumes at the virtual time of the lane, so it neither banks credit while idle nor waits behind the
+    backlog of a drive in the middle of a large sync. A drive with max_concurrent_tasks set gets no task while that
+    many of its tasks are being handled; consumers report handled tasks with task_done().
     """
 
     logger = logger_factory.get_logger('TaskPool')
     _instance = None
 
+    # Lower bound of drive weights, so that a zero or negative weight cannot stall the virtual time of a lane.
+    MIN_WEIGHT = 0.01
+
     @classmethod
     def get_instance(cls):
         if cls._instance is None:
@@ -23,8 +59,26 @@ class TaskPool:
         return cls._instance
 
     def __init__(self):
-        self._all_tasks = []
+        # Each lane maps drive keys to FIFOs of (sequence number, task). The sequence number keeps the order across
+        # drives and lanes. Drives without queued tasks are removed from the map.
+        self._lane_tasks = {lane: {} for lane in TaskLanes.ALL}
+        self._lane_lengths = {lane: 0 for lane in TaskLanes.ALL}
+        self._lane_semaphores = {lane: threading.Semaphore(0) for lane in TaskLanes.ALL}
+        self._queue_seq = itertools.count()
+        # Virtual time of each lane and of each drive in it.
+        self._lane_vtimes = {lane: 0.0 for lane in TaskLanes.ALL}
+        self._drive_vtimes = {lane: {} for lane in TaskLanes.ALL}
+        # Number of tasks of each drive taken and not yet done.
+        self._running_tasks = collections.Counter()
+        # Wake-ups consumed by pop_task() while every queued task was held back by a concurrency cap, by the lane
+        # argument of the call. They are given back when a task is done.
+        self._parked_wakeups = collections.Counter()
         self._tasks_by_path = {}
+        # Heap of (due time, sequence number, task). The sequence number keeps tasks due at the same time in order.
+        self._delayed_tasks = []
+        self._delayed_seq = itertools.count()
+        self._timer_cond = threading.Condition()
+        self._timer = None
 
     def _add_to_list(self, key, table, value):
         """
@@ -46,38 +100,273 @@ class TaskPool:
         """
         return task.local_parent_path + '/' + task.name
 
-    def add_task(self, task):
+    def get_task_lane(self, task):
+        """
+        :param onedrive_d.common.tasks.TaskMixin task:
+        :return str: A value in TaskLanes.
+        """
+        return getattr(task, 'lane', TaskLanes.METADATA)
+
+    def get_task_drive_key(self, task):
+        """
+        :param onedrive_d.common.tasks.TaskMixin task:
+        :return str | None: ID of the drive the task works on, which names its queue in the lane.
+        """
+        drive = getattr(task, 'drive', None)
+        return None if drive is None else drive.drive_id
+
+    def get_task_weight(self, task):
+        drive = getattr(task, 'drive', None)
+        if drive is None:
+            return 1
+        return max(drive.config.weight, self.MIN_WEIGHT)
+
+    def _is_held(self, key, task):
+        """
+        :return True | False: True if the drive of the task is at its concurrency cap.
+        """
+        drive = getattr(task, 'drive', None)
+        max_tasks = None if drive is None else drive.config.max_concurrent_tasks
+        return max_tasks is not None and self._running_tasks[key] >= max_tasks
+
+    def _enqueue(self, task):
+        """
+        Put a task at the end of the queue of its drive in its lane. Must be called with writer lock held.
+        :return str: Lane of the task.
+        """
+        lane = self.get_task_lane(task)
+        key = self.get_task_drive_key(task)
+        queues = self._lane_tasks[lane]
+        queue = queues.get(key)
+        if queue is None:
+            queue = queues[key] = collections.deque()
+            drive_vtimes = self._drive_vtimes[lane]
+            drive_vtimes[key] = max(drive_vtimes.get(key, 0.0), self._lane_vtimes[lane])
+        queue.append((next(self._queue_seq), task))
+        self._lane_lengths[lane] += 1
+        QUEUE_LENGTH.labels(lane=lane).set(self._lane_lengths[lane])
+        TASKS_QUEUED.labels(lane=lane).inc()
+        return lane
+
+    def _pick(self, lane):
+        """
+        Find the drive whose task goes next in the lane. Must be called with writer lock held.
+        :return (float, int, str | None) | None: Virtual time of the drive, sequence number of its oldest task and the
+        drive key, or None if no drive in the lane may get a task.
+        """
+        ret = None
+        drive_vtimes = self._drive_vtimes[lane]
+        for key, queue in self._lane_tasks[lane].items():
+            seq, task = queue[0]
+            if not self._is_held(key, task):
+                # Sequence numbers are unique, so keys are never compared.
+                candidate = (drive_vtimes[key], seq, key)
+                if ret is None or candidate < ret:
+                    ret = candidate
+        return ret
+
+    def _take(self, lane, key, entry=None):
+        """
+        Remove a task from the queue of a drive and charge the drive for it. Must be called with writer lock held.
+        :param str lane:
+        :param str | None key:
+        :param (int, onedrive_d.common.tasks.TaskMixin) | None entry: (Optional) The entry to take. The oldest one by
+        default, in which case the virtual time of the lane moves to that of the drive.
+        :return onedrive_d.common.tasks.TaskMixin:
+        """
+        queues = self._lane_tasks[lane]
+        queue = queues[key]
+        drive_vtimes = self._drive_vtimes[lane]
+        if entry is None:
+            entry = queue.popleft()
+            self._lane_vtimes[lane] = drive_vtimes[key]
+        else:
+            queue.remove(entry)
+        if len(queue) == 0:
+            del queues[key]
+        task = entry[1]
+        drive_vtimes[key] += 1 / self.get_task_weight(task)
+        self._lane_lengths[lane] -= 1
+        self._running_tasks[key] += 1
+        return task
+
+    def _notify(self, lane):
+        self._lane_semaphores[lane].release()
+        self._semaphore.release()
+
+    def add_task(self, task, delay_sec=0):
+        """
+        Add a task to the pool.
+        :param onedrive_d.common.tasks.LocalParentPathMixin task:
+        :param float delay_sec: (Optional) If positive, workers will not get the task before this many seconds pass.
+        """
+        if delay_sec > 0:
+            self._add_delayed_task(task, time.monotonic() + delay_sec)
+            return
         self.logger.debug('Try acquiring writer lock...')
         self._lock.writer_acquire()
-        self._all_tasks.append(task)
+        lane = self._enqueue(task)
         self._add_to_list(self.get_task_path(task), self._tasks_by_path, task)
         self.logger.debug('Added task "%s" on path "%s".', task.__class__.__name__,
                           task.local_parent_path + '/' + task.name)
         self._lock.writer_release()
         self.logger.debug('Writer lock released.')
-        self._semaphore.release()
+        self._notify(lane)
+
+    def _add_delayed_task(self, task, due_time):
+        self._lock.writer_acquire()
+        # The task is pending on its path from now on, but only joins the queue when due.
+        self._add_to_list(self.get_task_path(task), self._tasks_by_path, task)
+        self._lock.writer_release()
+        with self._timer_cond:
+            heapq.heappush(self._delayed_tasks, (due_time, next(self._delayed_seq), task))
+            DELAYED_TASKS.set(len(self._delayed_tasks))
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name='TaskPoolTimer', daemon=True)
+                self._timer.start()
+            self._timer_cond.notify()
+        self.logger.debug('Scheduled task "%s" on path "%s" in %.1f seconds.', task.__class__.__name__,
+                          self.get_task_path(task), due_time - time.monotonic())
+
+    def _run_timer(self):
+        while True:
+            with self._timer_cond:
+                timeout = self.get_next_due_time()
+                if timeout is not None:
+                    timeout -= time.monotonic()
+                if timeout is None or timeout > 0:
+                    self._timer_cond.wait(timeout)
+                    continue
+            self.release_due_tasks()
+
+    def get_next_due_time(self):
+        """
+        :return float | None: The time.monotonic() value at which the next delayed task is due, or None if no task is
+        delayed.
+        """
+        with self._timer_cond:
+            if len(self._delayed_tasks) == 0:
+                return None
+            return self._delayed_tasks[0][0]
+
+    def release_due_tasks(self, now=None):
+        """
+        Move the delayed tasks that are due to the queue for workers.
+        :param float | None now: (Optional) The time.monotonic() value to compare due times with.
+        :return int: Number of tasks released.
+        """
+        if now is None:
+            now = time.monotonic()
+        due_tasks = []
+        with self._timer_cond:
+            while len(self._delayed_tasks) > 0 and self._delayed_tasks[0][0] <= now:
+                due_tasks.append(heapq.heappop(self._delayed_tasks)[2])
+            DELAYED_TASKS.set(len(self._delayed_tasks))
+        count = 0
+        for task in due_tasks:
+            self._lock.writer_acquire()
+            # Skip tasks that were removed while waiting.
+            lane = None
+            if task in self._tasks_by_path.get(self.get_task_path(task), ()):
+                lane = self._enqueue(task)
+            self._lock.writer_release()
+            if lane is not None:
+                count += 1
+                self._notify(lane)
+        return count
 
     @property
     def semaphore(self):
+        """
+        :return threading.Semaphore: The semaphore released for every task queued in any lane.
+        """
         return self._semaphore
 
-    def pop_task(self, task_class=None):
+    def get_semaphore(self, lane=None):
+        """
+        :param str | None lane: (Optional) A value in TaskLanes. None for all lanes.
+        :rtype: threading.Semaphore
+        """
+        if lane is None:
+            return self._semaphore
+        return self._lane_semaphores[lane]
+
+    def get_queue_length(self, lane=None):
+        """
+        :param str | None lane: (Optional) A value in TaskLanes. None for all lanes.
+        :return int: Number of tasks ready for workers, not counting delayed ones.
+        """
+        self._lock.reader_acquire()
+        if lane is None:
+            ret = sum(self._lane_lengths.values())
+        else:
+            ret = self._lane_lengths[lane]
+        self._lock.reader_release()
+        return ret
+
+    def pop_task(self, task_class=None, lane=None):
+        """
+        Take the next task of the drive whose turn it is. Across lanes, the pick of the lane queued first goes.
+        :param type | None task_class: (Optional) Take the oldest task of this class instead.
+        :param str | None lane: (Optional) Only take a task from this lane in TaskLanes.
+        :return onedrive_d.common.tasks.TaskMixin | None:
+        """
         self._lock.writer_acquire()
         ret = None
-        if len(self._all_tasks) > 0:
-            if task_class is None:
-                ret = self._all_tasks.pop(0)
-            else:
-                for t in self._all_tasks:
-                    if isinstance(t, task_class):
-                        ret = t
-                        self._all_tasks.remove(t)
-                        break
+        lanes = TaskLanes.ALL if lane is None else (lane,)
+        if task_class is None:
+            picks = [(p[1], l, p[2]) for l in lanes for p in (self._pick(l),) if p is not None]
+            if len(picks) > 0:
+                _, pick_lane, key = min(picks, key=lambda p: p[0])
+                ret = self._take(pick_lane, key)
+            elif any(self._lane_lengths[l] > 0 for l in lanes):
+                self._parked_wakeups[lane] += 1
+        else:
+            found = None
+            for l in lanes:
+                for key, queue in self._lane_tasks[l].items():
+                    # The first match in a FIFO is the oldest one of the drive.
+                    for entry in queue:
+                        if isinstance(entry[1], task_class):
+                            if not self._is_held(key, entry[1]) and (found is None or entry[0] < found[0][0]):
+                                found = (entry, l, key)
+                            break
+            if found is not None:
+                entry, found_lane, key = found
+                ret = self._take(found_lane, key, entry)
         if ret is not None:
             self._tasks_by_path[self.get_task_path(ret)].remove(ret)
+            self._update_queue_length()
         self._lock.writer_release()
         return ret
 
+    def task_done(self, task):
+        """
+        Called by consumers after handling a task taken by pop_task(), so that a drive at its concurrency cap can get
+        its next task.
+        :param onedrive_d.common.tasks.TaskMixin task:
+        """
+        key = self.get_task_drive_key(task)
+        self._lock.writer_acquire()
+        if self._running_tasks[key] > 1:
+            self._running_tasks[key] -= 1
+        else:
+            del self._running_tasks[key]
+        parked_wakeups = self._parked_wakeups
+        self._parked_wakeups = collections.Counter()
+        self._lock.writer_release()
+        for lane, count in parked_wakeups.items():
+            semaphore = self.get_semaphore(lane)
+            for _ in range(count):
+                semaphore.release()
+
+    def _update_queue_length(self):
+        """
+        Must be called with writer lock held.
+        """
+        for lane, length in self._lane_lengths.items():
+            QUEUE_LENGTH.labels(lane=lane).set(length)
+
     def has_pending_task(self, local_path):
         self._lock.reader_acquire()
         ret = local_path in self._tasks_by_path and len(self._tasks_by_path[local_path]) > 0
@@ -88,9 +377,24 @@ class TaskPool:
     def remove_children_tasks(self, local_parent_path):
         local_parent_path += '/'
         self._lock.writer_acquire()
-        for t in self._all_tasks:
-            task_path = self.get_task_path(t)
+        removed = set()
+        dropped_tasks = []
+        for task_path, path_tasks in self._tasks_by_path.items():
             if task_path.startswith(local_parent_path):
-                self._all_tasks.remove(t)
-                self._tasks_by_path[task_path].remove(t)
+                # Delayed tasks are not in the queues yet and are dropped when they are due.
+                removed.update(id(t) for t in path_tasks)
+                dropped_tasks.extend(path_tasks)
+                del path_tasks[:]
+        if len(removed) > 0:
+            for lane, queues in self._lane_tasks.items():
+                for key in list(queues):
+                    queue = collections.deque(e for e in queues[key] if id(e[1]) not in removed)
+                    if len(queue) > 0:
+                        queues[key] = queue
+                    else:
+                        del queues[key]
+                self._lane_lengths[lane] = sum(len(q) for q in queues.values())
+            self._update_queue_length()
         self._lock.writer_release()
+        for task in dropped_tasks:
+            task.on_dropped()
@@ -1,12 +1,18 @@
 import io
 import unittest
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 import requests_mock
 
 from requests import codes
 
 from onedrive_d import str_to_datetime
 from onedrive_d.api import drives
+from onedrive_d.api import errors
 from onedrive_d.api import facets
 from onedrive_d.api import items
 from onedrive_d.api import options
@@ -44,7 +50,14 @@ class TestDriveObject(unittest.TestCase):
             root_item = self.drive.get_root_dir(list_children=True)
             self.assertIsInstance(root_item, items.OneDriveItem)
 
-    def use_item_collection(self, method_name, url, params):
+    @staticmethod
+    def read_pages(collection):
+        while collection.has_next:
+            yield collection.get_next()
+
+    def use_item_collection(self, method_name, url, params, read_pages=None):
+        if read_pages is None:
+            read_pages = self.read_pages
         item_set = get_data('item_collection.json')['value']
         item_names = [i['name'] for i in item_set]
         next_link = 'https://get_children'
@@ -60,8 +73,7 @@ class TestDriveObject(unittest.TestCase):
             mock.get(next_link, json=callback)
             collection = getattr(self.drive, method_name)(**params)
             received_names = []
-            while collection.has_next:
-                page = collection.get_next()
+            for page in read_pages(collection):
                 for i in page:
                     received_names.append(i.name)
             self.assertListEqual(item_names, received_names)
@@ -71,6 +83,33 @@ class TestDriveObject(unittest.TestCase):
                                  self.drive.get_item_uri(None, 'foo/bar') + ':/children',
                                  {'item_path': 'foo/bar'})
 
+    def test_get_children_prefetch(self):
+        for look_ahead in (0, 1, 2):
+            self.use_item_collection('get_children',
+                                     self.drive.get_item_uri(None, 'foo/bar') + ':/children',
+                                     {'item_path': 'foo/bar'},
+                                     lambda c: c.iter_pages(look_ahead=look_ahead))
+
+    def test_prefetch_error(self):
+        next_link = 'https://get_children'
+        with requests_mock.Mocker() as mock:
+            mock.get(self.drive.get_item_uri(None, 'foo') + ':/children',
+                     json={'value': [], '@odata.nextLink': next_link})
+            mock.get(next_link, status_code=codes.forbidden,
+                     json={'error': {'code': 'accessDenied', 'message': 'Denied.'}})
+            pages = self.drive.get_children(item_path='foo').iter_pages()
+            self.assertListEqual([], next(pages))
+            self.assertRaises(errors.OneDriveError, next, pages)
+
+    def test_single_page_without_prefetch(self):
+        with requests_mock.Mocker() as mock_request, mock.patch.object(items.threading, 'Thread') as mock_thread:
+            mock_request.get(self.drive.get_item_uri(None, 'foo') + ':/children',
+                             json={'value': [get_data('folder_item.json')]})
+            pages = list(self.drive.get_children(item_path='foo').iter_pages())
+            self.assertEqual(1, len(pages))
+            self.assertEqual(1, len(pages[0]))
+            self.assertFalse(mock_thread.called)
+
     def test_search(self):
         self.use_item_collection('search',
                                  self.drive.get_item_uri(None, 'foo/bar') + '/view.search?q=try&select=name,size',
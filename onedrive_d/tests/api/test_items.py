@@ -105,6 +105,14 @@ class TestOneDriveItem(unittest.TestCase):
         for prop, t in all_facets:
             self.assert_prop(prop, t)
 
+    def test_facets_are_cached(self):
+        self.assertIs(self.item.photo_props, self.item.photo_props)
+        self.assertIsNone(self.item.folder_props)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.item, '__dict__'))
+        self.assertFalse(hasattr(self.item.file_props, '__dict__'))
+
 
 class TestOneDriveItemTimestamps(unittest.TestCase):
 
@@ -128,5 +136,11 @@ class TestOneDriveItemTimestamps(unittest.TestCase):
         self.assert_timestamps(self.data['fileSystemInfo'], item)
         self.assert_timestamps(self.data['fileSystemInfo'], item.fs_info)
 
+    def test_lazy_fs_info(self):
+        self.data['fileSystemInfo'] = {'createdDateTime': 'invalid', 'lastModifiedDateTime': 'invalid'}
+        item = items.OneDriveItem(get_sample_drive_object(), self.data)
+        self.assertEqual(items.OneDriveItemTypes.IMAGE, item.type)
+        self.assertIsInstance(item.fs_info, facets.FileSystemInfoFacet)
+
 if __name__ == '__main__':
     unittest.main()
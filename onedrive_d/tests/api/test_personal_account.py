@@ -1,5 +1,6 @@
 import json
 import re
+import threading
 import time
 import unittest
 
@@ -120,6 +121,19 @@ class TestPersonalAccount(unittest.TestCase):
             self.assert_new_tokens(account)
             self.assertGreater(account.expires_at, old_expire_at)
 
+    @requests_mock.Mocker()
+    def test_renew_session_single_flight(self, mock):
+        expired_token = self.account.access_token
+        mock.post(self.account.client.OAUTH_TOKEN_URI, json=self.new_data, status_code=requests.codes.ok)
+        threads = [threading.Thread(target=self.account.renew_tokens, kwargs={'expired_token': expired_token})
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=1)
+        self.assertEqual(1, mock.call_count)
+        self.assert_new_tokens(self.account)
+
     @requests_mock.Mocker()
     def test_renew_session_failure(self, mock):
         mock.post(self.account.client.OAUTH_TOKEN_URI, json=get_data('error_type1.json'),
@@ -163,5 +177,86 @@ class TestPersonalAccount(unittest.TestCase):
         self.assertRaises(ValueError, accounts.PersonalAccount.load, None, json.dumps(dp))
 
 
+class TestTokenRefresher(unittest.TestCase):
+    new_data = get_data('personal_access_token_alt.json')
+
+    def setUp(self):
+        self.account = get_sample_account()
+        self.refresher = accounts.TokenRefresher(renew_ahead_sec=60, retry_delay_sec=60)
+
+    def test_get_next_renewal(self):
+        self.assertEqual((None, None), self.refresher.get_next_renewal())
+        other_account = get_sample_account()
+        other_account.expires_at = self.account.expires_at - 100
+        self.refresher.add_account(self.account)
+        self.refresher.add_account(other_account)
+        account, renew_at = self.refresher.get_next_renewal()
+        self.assertIs(other_account, account)
+        self.assertEqual(other_account.expires_at - 60, renew_at)
+        self.refresher.remove_account(other_account)
+        self.assertIs(self.account, self.refresher.get_next_renewal()[0])
+
+    @requests_mock.Mocker()
+    def test_renew_before_expiration(self, mock):
+        renewed = threading.Event()
+
+        def callback(request, context):
+            renewed.set()
+            context.status_code = requests.codes.ok
+            return self.new_data
+
+        mock.post(self.account.client.OAUTH_TOKEN_URI, json=callback)
+        self.account.expires_at = time.time() + 30
+        self.refresher.add_account(self.account)
+        self.refresher.start()
+        self.assertTrue(renewed.wait(timeout=2))
+        self.refresher.stop()
+        self.refresher.join(timeout=1)
+        self.assertFalse(self.refresher.is_alive())
+        self.assertEqual(1, mock.call_count)
+        self.assertEqual(self.new_data['access_token'], self.account.access_token)
+
+    @requests_mock.Mocker()
+    def test_renew_failure(self, mock):
+        mock.post(self.account.client.OAUTH_TOKEN_URI, json=get_data('error_type1.json'),
+                  status_code=requests.codes.bad)
+        old_token = self.account.access_token
+        self.assertFalse(self.refresher.renew(self.account))
+        self.assertEqual(old_token, self.account.access_token)
+
+    def test_get_retry_delay(self):
+        refresher = accounts.TokenRefresher(retry_delay_sec=60, max_retry_delay_sec=300)
+        self.assertEqual([60, 60, 120, 240, 300, 300], [refresher.get_retry_delay(i) for i in range(6)])
+
+    @requests_mock.Mocker()
+    def test_survive_unexpected_error(self, mock):
+        """
+        An error other than OneDriveError while renewing must not stop the refresher, which retries with backoff.
+        """
+        attempts = []
+        renewed = threading.Event()
+
+        def callback(request, context):
+            attempts.append(time.time())
+            context.status_code = requests.codes.ok
+            if len(attempts) == 1:
+                # Not JSON, so decoding the response fails.
+                return '<html>'
+            renewed.set()
+            return json.dumps(self.new_data)
+
+        self.refresher = accounts.TokenRefresher(renew_ahead_sec=60, retry_delay_sec=0.1)
+        mock.post(self.account.client.OAUTH_TOKEN_URI, text=callback)
+        self.account.expires_at = time.time() + 30
+        self.refresher.add_account(self.account)
+        self.refresher.start()
+        self.assertTrue(renewed.wait(timeout=2))
+        self.refresher.stop()
+        self.refresher.join(timeout=1)
+        self.assertFalse(self.refresher.is_alive())
+        self.assertEqual(2, len(attempts))
+        self.assertEqual(self.new_data['access_token'], self.account.access_token)
+
+
 if __name__ == '__main__':
     unittest.main()
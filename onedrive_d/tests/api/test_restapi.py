@@ -1,6 +1,8 @@
 __author__ = 'xb'
 
 from urllib.parse import parse_qs
+import threading
+import time
 import unittest
 
 try:
@@ -41,7 +43,9 @@ class TestManagedRESTClient(unittest.TestCase):
         self.assertEqual('good', request.text)
         if retry_after_seconds is None:
             retry_after_seconds = restapi.ManagedRESTClient.AUTO_RETRY_SECONDS
-        mock_sleep.assert_called_once_with(retry_after_seconds)
+        self.assertEqual(1, mock_sleep.call_count)
+        # Throttled requests wait out the pause in the governor, which deducts the time already elapsed.
+        self.assertAlmostEqual(retry_after_seconds, mock_sleep.call_args[0][0], delta=1)
 
     def test_auto_recover_responses(self):
         """
@@ -99,5 +103,86 @@ class TestManagedRESTClient(unittest.TestCase):
         mock_request.get('https://test_url', json=callback)
         self.assertRaises(errors.OneDriveTokenExpiredError, rest_client.get, url='https://test_url', auto_renew=False)
 
+    @patch('time.sleep', autospec=True)
+    @Mocker()
+    def test_connection_error_without_net_mon(self, mock_sleep, mock_request):
+        """
+        Without a network monitor, a request that fails to connect is retried after a pause.
+        """
+        mock_request.get('https://test_url', [{'exc': requests.ConnectionError}, {'text': 'good'}])
+        rest_client = restapi.ManagedRESTClient(session=requests.Session(), net_mon=None, account=None)
+        self.assertEqual('good', rest_client.get('https://test_url').text)
+        mock_sleep.assert_called_once_with(restapi.ManagedRESTClient.AUTO_RETRY_SECONDS)
+
+class TestConcurrencyGovernor(unittest.TestCase):
+    def setUp(self):
+        self.governor = restapi.ConcurrencyGovernor(min_limit=1, max_limit=8)
+
+    def test_bad_bounds(self):
+        self.assertRaises(ValueError, restapi.ConcurrencyGovernor, min_limit=0)
+        self.assertRaises(ValueError, restapi.ConcurrencyGovernor, min_limit=4, max_limit=2)
+
+    def test_multiplicative_decrease(self):
+        self.assertEqual(8, self.governor.limit)
+        self.governor.on_throttled(0)
+        self.assertEqual(4, self.governor.limit)
+        for i in range(10):
+            self.governor.on_throttled(0)
+        self.assertEqual(1, self.governor.limit)
+
+    def test_additive_increase(self):
+        self.governor.on_throttled(0)
+        self.governor.on_throttled(0)
+        self.assertEqual(2, self.governor.limit)
+        # About one window of successes raises the limit by one.
+        for i in range(3):
+            self.governor.on_success()
+        self.assertEqual(3, self.governor.limit)
+        for i in range(100):
+            self.governor.on_success()
+        self.assertEqual(8, self.governor.limit)
+
+    def test_acquire_release(self):
+        for i in range(self.governor.limit):
+            self.governor.acquire()
+        self.assertEqual(8, self.governor.in_flight)
+        t = threading.Thread(target=self.governor.acquire)
+        t.start()
+        t.join(timeout=0.1)
+        self.assertTrue(t.is_alive())
+        self.governor.release()
+        t.join(timeout=1)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(8, self.governor.in_flight)
+
+    @patch('time.sleep', autospec=True)
+    def test_pause_all_callers(self, mock_sleep):
+        self.governor.on_throttled(60)
+        self.assertGreater(self.governor.resume_at, time.time() + 59)
+        self.governor.acquire()
+        self.governor.acquire()
+        self.assertEqual(2, mock_sleep.call_count)
+        for c in mock_sleep.call_args_list:
+            self.assertAlmostEqual(60, c[0][0], delta=1)
+
+    @Mocker()
+    def test_throttle_shared_by_callers(self, mock_request):
+        uri = 'https://foo/bar'
+        governor = restapi.ConcurrencyGovernor(max_limit=4)
+        clients = [restapi.ManagedRESTClient(session=requests.Session(), net_mon=None, account=None,
+                                             governor=governor) for i in range(2)]
+        status_codes = [requests.codes.too_many, requests.codes.ok]
+
+        def callback(req, context):
+            context.status_code = status_codes.pop(0)
+            context.headers['Retry-After'] = '0'
+            return ''
+
+        mock_request.get(uri, text=callback)
+        clients[0].get(uri)
+        self.assertEqual(2, governor.limit)
+        self.assertEqual(0, governor.in_flight)
+
+
 if __name__ == '__main__':
     unittest.main()
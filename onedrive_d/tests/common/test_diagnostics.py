@@ -0,0 +1,79 @@
+__author__ = 'xb'
+
+import glob
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+
+from onedrive_d.common import diagnostics
+from onedrive_d.common import tasks
+from onedrive_d.common.task_worker import TaskConsumer
+from onedrive_d.tests.common.test_tasks import BaseTestCase
+
+
+def idle_in_test(event):
+    event.wait(10)
+
+
+class TestDiagnostics(BaseTestCase, unittest.TestCase):
+    def setUp(self):
+        self.setup_objects()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.stop_event = threading.Event()
+        self.addCleanup(self.stop_event.set)
+        self.thread = threading.Thread(target=idle_in_test, args=(self.stop_event,), name='IdleThread', daemon=True)
+        self.thread.start()
+
+    def test_format_thread_stacks(self):
+        worker = TaskConsumer(self.task_pool)
+        worker.current_task = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='bar')
+        self.assertEqual('%s (CreateDirTask on "/foo/bar")' % worker.name, diagnostics.describe_thread(worker))
+        text = diagnostics.format_thread_stacks()
+        self.assertIn('Thread IdleThread:', text)
+        self.assertIn('idle_in_test', text)
+
+    def test_sampling_profiler(self):
+        path = self.output_dir + '/profile.collapsed'
+        profiler = diagnostics.SamplingProfiler(path, duration_sec=0.05, interval_sec=0.005)
+        profiler.start()
+        profiler.join(timeout=5)
+        self.assertGreater(profiler.num_samples, 0)
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+        idle_lines = [l for l in lines if l.startswith('IdleThread;')]
+        self.assertEqual(1, len(idle_lines))
+        stack, count = idle_lines[0].rsplit(' ', 1)
+        self.assertIn(';idle_in_test (test_diagnostics.py:', stack)
+        self.assertEqual(profiler.num_samples, int(count))
+        self.assertFalse(any(l.startswith(diagnostics.PROFILER_THREAD_NAME) for l in lines))
+
+    def test_startup_profile(self):
+        profile = diagnostics.StartupProfile(start_time=0)
+        profile.mark('imports')
+        profile.mark('workers')
+        self.assertEqual(['imports', 'workers'], [p for p, _ in profile.phases])
+        self.assertAlmostEqual(profile.total_sec, sum(d for _, d in profile.phases))
+        lines = profile.format_report().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[2].startswith('workers '))
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), 'Requires SIGUSR1.')
+    def test_signal_handler(self):
+        handler = diagnostics.DiagnosticsSignalHandler(self.output_dir, profile_duration_sec=0.05)
+        old_handlers = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGUSR2)
+        self.addCleanup(signal.signal, signal.SIGUSR1, old_handlers[0])
+        self.addCleanup(signal.signal, signal.SIGUSR2, old_handlers[1])
+        handler.install()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertEqual(1, len(glob.glob(self.output_dir + '/stacks-*.txt')))
+        os.kill(os.getpid(), signal.SIGUSR2)
+        handler.profiler.join(timeout=5)
+        self.assertEqual(1, len(glob.glob(self.output_dir + '/profile-*.collapsed')))
+
+
+if __name__ == '__main__':
+    unittest.main()
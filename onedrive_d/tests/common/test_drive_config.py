@@ -25,6 +25,12 @@ class TestDriveConfig(unittest.TestCase):
         conf = drive_config.DriveConfig(self.data)
         self.assertEqual(drive_config.DriveConfig.DEFAULT_VALUES['max_get_size_bytes'], conf.max_get_size_bytes)
 
+    def test_scheduling_defaults(self):
+        conf = drive_config.DriveConfig({})
+        self.assertEqual(1, conf.weight)
+        self.assertIsNone(conf.max_concurrent_tasks)
+        self.assertNotIn('weight', conf.dump())
+
     def test_serialize(self):
         dump = self.conf.dump()
         new_conf = drive_config.DriveConfig(dump)
@@ -0,0 +1,48 @@
+__author__ = 'xb'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except:
+    import mock
+
+from onedrive_d.common import file_clone
+
+
+class TestFileClone(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_path = self.tmp_dir + '/src'
+        self.dst_path = self.tmp_dir + '/dst'
+        self.data = os.urandom(65536 + 17)
+        with open(self.src_path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_cloned(self):
+        with open(self.dst_path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_clone(self):
+        with open(self.dst_path, 'wb') as f:
+            f.write(b'old content that is longer than nothing')
+        method = file_clone.clone_file(self.src_path, self.dst_path)
+        self.assertIn(method, (file_clone.CloneMethods.REFLINK, file_clone.CloneMethods.COPY_FILE_RANGE,
+                               file_clone.CloneMethods.COPY))
+        self.assert_cloned()
+
+    @mock.patch('onedrive_d.common.file_clone._reflink', side_effect=OSError)
+    @mock.patch('onedrive_d.common.file_clone._copy_file_range', side_effect=OSError)
+    def test_fallback_copy(self, *mocks):
+        self.assertEqual(file_clone.CloneMethods.COPY, file_clone.clone_file(self.src_path, self.dst_path))
+        self.assert_cloned()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,10 @@ class TestHasher(unittest.TestCase):
     def test_crc32(self):
         self.assert_func(hasher.crc32_value, {}, '62177901')
 
+    def test_crc32_hex(self):
+        # CRC32 of the data is 0x03B4C26D, whose bytes the API lists in little-endian order.
+        self.assert_func(hasher.crc32_hex_value, {}, '6DC2B403')
+
     def test_sha1(self):
         self.assert_func(hasher.hash_value, {}, '430CE34D020724ED75A196DFC2AD67C77772D169')
 
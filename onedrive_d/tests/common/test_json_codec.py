@@ -0,0 +1,44 @@
+__author__ = 'xb'
+
+import unittest
+
+import requests
+
+from onedrive_d.common import json_codec
+from onedrive_d.tests import get_data
+
+
+class TestJsonCodec(unittest.TestCase):
+    def setUp(self):
+        self.data = get_data('item_collection.json')
+        self.data['value'][0]['name'] = 'Ünïcode / name'
+
+    def tearDown(self):
+        json_codec.use_backend()
+
+    def test_stdlib_always_available(self):
+        self.assertIn('json', json_codec.get_available_backends())
+
+    def test_prefers_fastest_backend(self):
+        self.assertEqual(json_codec.get_available_backends()[0], json_codec.get_backend().name)
+
+    def test_round_trip(self):
+        for name in json_codec.get_available_backends():
+            json_codec.use_backend(name)
+            s = json_codec.dumps(self.data)
+            self.assertIsInstance(s, str, name)
+            self.assertDictEqual(self.data, json_codec.loads(s), name)
+
+    def test_load_response(self):
+        response = requests.Response()
+        response._content = json_codec.dumps(self.data).encode('utf-8')
+        for name in json_codec.get_available_backends():
+            json_codec.use_backend(name)
+            self.assertDictEqual(self.data, json_codec.load_response(response), name)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, json_codec.use_backend, 'foo')
+
+
+if __name__ == '__main__':
+    unittest.main()
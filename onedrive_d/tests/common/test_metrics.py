@@ -0,0 +1,100 @@
+__author__ = 'xb'
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+import urllib.request
+
+from onedrive_d.api import restapi
+from onedrive_d.common import metrics
+from onedrive_d.common import metrics_server
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        c = metrics.counter('test_requests_total', 'Requests.', ['method'], registry=self.registry)
+        c.labels(method='get').inc()
+        c.labels(method='get').inc(2)
+        c.labels(method='put').inc()
+        self.assertEqual('# HELP test_requests_total Requests.\n'
+                         '# TYPE test_requests_total counter\n'
+                         'test_requests_total{method="get"} 3\n'
+                         'test_requests_total{method="put"} 1\n', self.registry.render())
+
+    def test_gauge(self):
+        g = metrics.gauge('test_queue', 'Queue.', registry=self.registry)
+        g.inc(5)
+        g.dec()
+        self.assertIn('test_queue 4\n', self.registry.render())
+        g.set_function(lambda: 1.5)
+        self.assertIn('test_queue 1.5\n', self.registry.render())
+
+    def test_histogram(self):
+        h = metrics.histogram('test_latency', 'Latency.', buckets=(0.1, 1), registry=self.registry)
+        for v in (0.05, 0.5, 5):
+            h.observe(v)
+        text = self.registry.render()
+        self.assertIn('test_latency_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_latency_bucket{le="1"} 2\n', text)
+        self.assertIn('test_latency_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('test_latency_sum 5.55\n', text)
+        self.assertIn('test_latency_count 3\n', text)
+
+    def test_label_escape(self):
+        c = metrics.counter('test_total', 'Test.', ['path'], registry=self.registry)
+        c.labels(path='a"b\\c').inc()
+        self.assertIn('test_total{path="a\\"b\\\\c"} 1\n', self.registry.render())
+
+    def test_register_twice(self):
+        a = metrics.counter('test_total', 'Test.', registry=self.registry)
+        self.assertIs(a, metrics.counter('test_total', 'Test.', registry=self.registry))
+        self.assertRaises(ValueError, metrics.gauge, 'test_total', 'Test.', registry=self.registry)
+
+    def test_missing_labels(self):
+        c = metrics.counter('test_total', 'Test.', ['method'], registry=self.registry)
+        self.assertRaises(ValueError, c.inc)
+
+    def test_tcp_server(self):
+        metrics.counter('test_total', 'Test.', registry=self.registry).inc()
+        server = metrics_server.MetricsServer('127.0.0.1:0', registry=self.registry)
+        server.start()
+        self.addCleanup(server.stop)
+        host, port = server.server_address
+        with urllib.request.urlopen('http://%s:%d/metrics' % (host, port), timeout=5) as response:
+            self.assertEqual(metrics.CONTENT_TYPE, response.headers['Content-Type'])
+            self.assertIn('test_total 1\n', response.read().decode('utf-8'))
+
+    def test_unix_server(self):
+        metrics.counter('test_total', 'Test.', registry=self.registry).inc()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'metrics.sock')
+        server = metrics_server.MetricsServer(path, registry=self.registry)
+        server.start()
+        self.addCleanup(server.stop)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+            response = b''
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                response += data
+        self.assertTrue(response.startswith(b'HTTP/1.0 200'))
+        self.assertIn(b'test_total 1\n', response)
+
+    def test_endpoint_label(self):
+        self.assertEqual('api.onedrive.com/v1.0/drive/items/{id}/children',
+                         restapi.get_endpoint_label('https://api.onedrive.com/v1.0/drive/items/ABC!103/children?a=b'))
+        self.assertEqual('api.onedrive.com/v1.0/drive/root:/{path}:/content',
+                         restapi.get_endpoint_label('https://api.onedrive.com/v1.0/drive/root:/a/b.txt:/content'))
+
+
+if __name__ == '__main__':
+    unittest.main()
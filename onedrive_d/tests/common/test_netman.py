@@ -3,11 +3,6 @@ __author__ = 'xb'
 import threading
 import unittest
 
-try:
-    from unittest.mock import patch
-except ImportError:
-    from mock import patch
-
 import requests
 import requests_mock
 
@@ -30,13 +25,11 @@ class TestNetworkMonitor(unittest.TestCase):
         callback.counter = max_counter
         return callback
 
-    @patch('time.sleep', autospec=True)
-    def test_suspension(self, mock_request, mock_sleep):
+    def test_suspension(self, mock_request):
         """
         :param requests_mock.Mocker mock_request:
-        :param unittest.mock.patch mock_sleep:
         """
-        netmon = netman.NetworkMonitor()
+        netmon = netman.NetworkMonitor(retry_delay_sec=0.01)
         mock_request.head(netmon.test_uri, text=self.get_callback(2))
         mock_request.post(self.test_url, text=self.get_callback(1))
         netmon.start()
@@ -44,8 +37,50 @@ class TestNetworkMonitor(unittest.TestCase):
         t = threading.Thread(target=rest_cli.post, kwargs={'url': self.test_url})
         t.start()
         t.join(timeout=2)
-        self.assertEqual(2, mock_sleep.call_count)
-        mock_sleep.assert_called_with(netmon.retry_delay)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(netmon.is_online)
+
+    def test_broadcast_wakeup(self, mock_request):
+        """
+        One probe sequence per outage, after which all suspended threads resume together.
+        """
+        netmon = netman.NetworkMonitor(retry_delay_sec=0.01)
+        callback = self.get_callback(2)
+        mock_request.head(netmon.test_uri, text=callback)
+        threads = [threading.Thread(target=netmon.suspend_caller) for i in range(5)]
+        for t in threads:
+            t.start()
+        netmon.start()
+        for t in threads:
+            t.join(timeout=2)
+            self.assertFalse(t.is_alive())
+        self.assertEqual(-1, callback.counter)
+        self.assertEqual(3, mock_request.call_count)
+
+    def test_passive_recovery(self, mock_request):
+        """
+        A successful real request ends the outage even if probes keep failing.
+        """
+        netmon = netman.NetworkMonitor(retry_delay_sec=60)
+        mock_request.head(netmon.test_uri, exc=requests.ConnectionError)
+        t = threading.Thread(target=netmon.suspend_caller)
+        t.start()
+        netmon.start()
+        t.join(timeout=0.1)
+        self.assertTrue(t.is_alive())
+        self.assertFalse(netmon.is_online)
+        netmon.report_success()
+        t.join(timeout=1)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(netmon.is_online)
+        self.assertEqual(1, mock_request.call_count)
+
+    def test_no_probe_when_healthy(self, mock_request):
+        netmon = netman.NetworkMonitor()
+        netmon.start()
+        netmon.report_success()
+        self.assertTrue(netmon.is_online)
+        self.assertEqual(0, mock_request.call_count)
 
 
 if __name__ == '__main__':
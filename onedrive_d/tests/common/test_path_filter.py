@@ -2,6 +2,8 @@ __author__ = 'xb'
 
 import unittest
 
+import zgitignore
+
 from onedrive_d.common import path_filter
 from onedrive_d.tests import get_content
 
@@ -77,6 +79,31 @@ class TestPathFilter(unittest.TestCase):
         ]
         self.assert_cases(cases)
 
+    def test_same_as_rule_by_rule(self):
+        reference = zgitignore.ZgitIgnore(self.rules, ignore_case=True)
+        for path in ['/foo', '/a/foo', '/bar', '/bar/baz', '/x.swp', '/a/b/.ignore', '/Build', '/a/build/c',
+                     '/path/to/ignore/file.txt', '/path-ignored/a/b', '/path-ignored/content', '/#a#',
+                     '/Documents/a/b/resume.txt', '/documents/resume.txt', '/plain.txt']:
+            for is_dir in (False, True):
+                self.assertEqual(reference.is_ignored(path, is_directory=is_dir),
+                                 self.filter.should_ignore(path, is_dir), path)
+
+    def test_subtree_ignored(self):
+        self.assertTrue(self.filter.is_subtree_ignored('/bar'))
+        self.assertTrue(self.filter.is_subtree_ignored('/a/build'))
+        self.assertFalse(self.filter.is_subtree_ignored('/a'))
+        # A later negation may re-include something under it.
+        self.assertFalse(self.filter.is_subtree_ignored('/path-ignored'))
+        self.filter.add_rules(['cache/**'])
+        self.assertTrue(self.filter.is_subtree_ignored('/cache'))
+        self.assertFalse(self.filter.should_ignore('/cache', True))
+
+    def test_uncompilable_rule(self):
+        # The back reference cannot be embedded in the merged regex, so rules are tried one by one.
+        f = path_filter.PathFilter(['a{(x)\\\\1}'])
+        self.assertTrue(f.should_ignore('/axx'))
+        self.assertFalse(f.should_ignore('/axy'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,160 @@
+__author__ = 'xb'
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+from onedrive_d.common import scan_scheduler
+from onedrive_d.tests.mocks import mock_logger
+
+mock_logger.mock_loggers()
+
+
+class DirTask:
+    pass
+
+
+class TestScanScheduler(unittest.TestCase):
+    tree = {'': ['/a', '/b'], '/b': ['/b/c']}
+
+    def setUp(self):
+        self.scheduler = scan_scheduler.ScanScheduler(min_interval_sec=10, max_interval_sec=40)
+        # st_mtime_ns of the local directories, by path.
+        self.mtimes = {}
+
+    def run_pass(self, scan_pass, changes, now):
+        """
+        Scan the tree the way SynchronizeDirTask does: a directory decides which of its subdirectories to scan, and
+        they are scanned after it.
+        :return [str]: Paths scanned.
+        """
+        queue = collections.deque()
+        dir_tasks = []
+
+        def add_dir_task(path):
+            dir_task = DirTask()
+            dir_tasks.append(dir_task)
+            queue.append((path, scan_pass.track_dir_task(dir_task)))
+
+        add_dir_task('')
+        scanned = []
+        while len(queue) > 0:
+            path, done = queue.popleft()
+            scan_pass.begin_scan(path, self.mtimes.get(path))
+            for child in self.tree.get(path, ()):
+                if scan_pass.should_scan(child, now=now):
+                    add_dir_task(child)
+            scan_pass.end_scan(path, changes.get(path, 0), now=now)
+            scanned.append(path)
+            done()
+        return scanned
+
+    def test_passes_do_not_overlap(self):
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        self.assertEqual(1, scan_pass.generation)
+        dir_task = DirTask()
+        scan_pass.track_dir_task(dir_task)
+        self.assertIsNone(self.scheduler.start_pass('drive', now=100))
+        self.assertIsNotNone(self.scheduler.start_pass('other_drive', now=100))
+        # A task dropped from the task pool also ends the pass.
+        del dir_task
+        self.assertIsNone(self.scheduler.get_running_pass('drive'))
+        history = self.scheduler.get_history('drive')
+        self.assertEqual([scan_pass], history)
+        self.assertIsNotNone(history[0].duration_sec)
+        self.assertEqual(2, self.scheduler.start_pass('drive', now=100).generation)
+
+    def test_adaptive_intervals(self):
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {}, now=0))
+        self.assertIsNone(self.scheduler.start_pass('drive', now=5))
+        # Changes are found in /a and /b/c only.
+        scan_pass = self.scheduler.start_pass('drive', now=10)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {'/a': 1, '/b/c': 1}, now=10))
+        # /a and /b/c are due after 10 seconds; the others back off to 20 seconds. /b is scanned only to reach /b/c.
+        self.assertIsNone(self.scheduler.start_pass('drive', now=19))
+        scan_pass = self.scheduler.start_pass('drive', now=20)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {}, now=20))
+        # Now /a and /b/c are due at 40, / at 60 and /b at 60.
+        scan_pass = self.scheduler.start_pass('drive', now=40)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {}, now=40))
+        # /a and /b/c back off to 40 seconds (due at 80), / and /b to the max of 40 seconds (due at 80).
+        self.assertIsNone(self.scheduler.start_pass('drive', now=79))
+        scan_pass = self.scheduler.start_pass('drive', now=80)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {'/a': 1}, now=80))
+        scan_pass = self.scheduler.start_pass('drive', now=90)
+        self.assertEqual(['', '/a'], self.run_pass(scan_pass, {}, now=90))
+        self.assertEqual(2, scan_pass.decisions[scan_scheduler.ScanDecisions.SCANNED])
+        self.assertEqual(1, scan_pass.decisions[scan_scheduler.ScanDecisions.SKIPPED])
+
+    def test_scan_budget(self):
+        self.scheduler = scan_scheduler.ScanScheduler(min_interval_sec=10, max_interval_sec=40, budget=2)
+        # Directories never scanned are scanned regardless of the budget.
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {}, now=0))
+        # The budget is 2 directories per 10 seconds and is 2 directories short.
+        self.assertIsNone(self.scheduler.start_pass('drive', now=10))
+        scan_pass = self.scheduler.start_pass('drive', now=20)
+        self.assertEqual(['', '/a'], self.run_pass(scan_pass, {}, now=20))
+        self.assertEqual(1, scan_pass.decisions[scan_scheduler.ScanDecisions.DEFERRED])
+        # The deferred directory is due, so the next pass starts as soon as the budget allows.
+        scan_pass = self.scheduler.start_pass('drive', now=30)
+        self.assertIsNotNone(scan_pass)
+
+    def test_explicit_done(self):
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        dir_task = DirTask()
+        done = scan_pass.track_dir_task(dir_task)
+        # A task still referenced, e.g., by a traceback, does not keep the pass running once it is marked done.
+        done()
+        self.assertIsNone(self.scheduler.get_running_pass('drive'))
+        self.assertTrue(self.scheduler.is_pass_done('drive', 1))
+        self.assertFalse(self.scheduler.is_pass_done('drive', 2))
+        done()
+        self.assertEqual(1, len(self.scheduler.get_history('drive')))
+
+    def test_rescan_changed(self):
+        self.tree = {'': ['/a', '/b', '/d'], '/b': ['/b/c']}
+        local_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_root)
+        for path in ['/a', '/b/c', '/d']:
+            os.makedirs(local_root + path)
+        self.mtimes = dict(scan_scheduler.walk_dir_mtimes(local_root))
+        self.assertEqual({'', '/a', '/b', '/b/c', '/d'}, set(self.mtimes))
+        # The scans see /b/c as it was before an entry was moved into it.
+        self.mtimes['/b/c'] -= 1
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        self.run_pass(scan_pass, {}, now=0)
+        scan_pass = self.scheduler.start_pass('drive', now=10)
+        self.run_pass(scan_pass, {'/a': 1}, now=10)
+        # Only /a is due at 20.
+        scan_pass = self.scheduler.start_pass('drive', now=20)
+        self.assertFalse(scan_pass.should_scan('/b', now=20))
+        self.assertFalse(scan_pass.should_scan('/d', now=20))
+        scan_pass.rescan_changed(local_root, now=20)
+        # Only the modified directory and the ones leading to it are scanned.
+        self.assertTrue(scan_pass.should_scan('/b', now=20))
+        self.assertTrue(scan_pass.should_scan('/b/c', now=20))
+        self.assertFalse(scan_pass.should_scan('/d', now=20))
+        # Directories skipped before are due for the next pass, which leaves out the unmodified ones.
+        self.scheduler.end_pass(scan_pass)
+        scan_pass = self.scheduler.start_pass('drive', now=20)
+        self.assertEqual(['', '/a', '/b', '/b/c'], self.run_pass(scan_pass, {}, now=20))
+
+    def test_abort_scan(self):
+        scan_pass = self.scheduler.start_pass('drive', now=0)
+        self.run_pass(scan_pass, {}, now=0)
+        scan_pass = self.scheduler.start_pass('drive', now=10)
+        dir_task = DirTask()
+        done = scan_pass.track_dir_task(dir_task)
+        scan_pass.begin_scan('')
+        scan_pass.abort_scan('', now=10)
+        done()
+        # The root is retried in the next pass instead of waiting for a longer interval.
+        self.assertIsNotNone(self.scheduler.start_pass('drive', now=11))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+__author__ = 'xb'
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from onedrive_d.api import items
+from onedrive_d.cli import cli_main
+from onedrive_d.common import supervisor
+from onedrive_d.common import user_config
+from onedrive_d.store import items_db
+from onedrive_d.tests import get_data
+from onedrive_d.tests.api import drive_factory
+from onedrive_d.tests.mocks import mock_logger
+
+mock_logger.mock_loggers()
+
+
+def exit_with(key, exit_code):
+    raise SystemExit(exit_code)
+
+
+def sleep_forever(key):
+    while True:
+        time.sleep(1)
+
+
+def run_drive_worker_with_pending_write(drive_key, args, item_storage_dir, ready, flushing):
+    """
+    Run the entry of a drive process, whose item storage has a write pending when the process is asked to stop, and
+    whose flush takes long enough for signals to arrive in the middle of it.
+    """
+
+    def start_sync(startup):
+        drive = drive_factory.get_sample_drive_object()
+        cli_main.user_conf = user_config.UserConfig(user_config.UserConfig.DEFAULT_CONFIG)
+        cli_main.item_store_mgr = items_db.ItemStorageManager(item_storage_dir)
+        storage = cli_main.item_store_mgr.get_item_storage(drive)
+        storage.commit_interval = 3600
+        storage.update_item(items.OneDriveItem(drive, get_data('image_item.json')))
+        flush_all = cli_main.item_store_mgr.flush_all
+
+        def slow_flush_all():
+            flushing.set()
+            time.sleep(0.5)
+            flush_all()
+
+        cli_main.item_store_mgr.flush_all = slow_flush_all
+        ready.set()
+
+    cli_main.start_sync = start_sync
+    cli_main.add_new_accounts = lambda: None
+    cli_main.add_initial_tasks = lambda: None
+    cli_main.run_drive_worker(drive_key, args)
+
+
+class TestProcessSupervisor(unittest.TestCase):
+    def wait_for_exit(self, process_supervisor, key):
+        process = process_supervisor.children[key].process
+        process.join(timeout=30)
+        self.assertFalse(process.is_alive())
+
+    def test_restart_with_backoff(self):
+        process_supervisor = supervisor.ProcessSupervisor(exit_with, args=(3,), min_restart_delay_sec=10)
+        self.addCleanup(process_supervisor.stop_all)
+        process_supervisor.update(['a'], now=0)
+        child = process_supervisor.children['a']
+        first_process = child.process
+        self.wait_for_exit(process_supervisor, 'a')
+        process_supervisor.update(['a'], now=1)
+        self.assertEqual(3, first_process.exitcode)
+        self.assertEqual(11, child.restart_time)
+        process_supervisor.update(['a'], now=5)
+        self.assertIs(first_process, child.process)
+        process_supervisor.update(['a'], now=11)
+        self.assertIsNot(first_process, child.process)
+        self.wait_for_exit(process_supervisor, 'a')
+        # The process failed again soon after it was started, so it waits twice as long.
+        process_supervisor.update(['a'], now=12)
+        self.assertEqual(32, child.restart_time)
+
+    def test_stop_removed_key(self):
+        process_supervisor = supervisor.ProcessSupervisor(sleep_forever, stop_timeout_sec=30)
+        self.addCleanup(process_supervisor.stop_all)
+        process_supervisor.update(['a', 'b'])
+        process = process_supervisor.children['a'].process
+        process_supervisor.update(['b'])
+        self.assertNotIn('a', process_supervisor.children)
+        self.assertFalse(process.is_alive())
+        self.assertTrue(process_supervisor.children['b'].process.is_alive())
+
+    def test_stop_drive_worker_with_pending_write(self):
+        item_storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, item_storage_dir)
+        context = multiprocessing.get_context('spawn')
+        ready = context.Event()
+        flushing = context.Event()
+        log_path = os.path.join(item_storage_dir, 'onedrived.log')
+        with open(log_path + '.drive_id', 'w') as f:
+            f.write('Log of the process before.\n')
+        args = argparse.Namespace(log_level='CRITICAL', log_file=log_path, profile_startup=False)
+        process_supervisor = supervisor.ProcessSupervisor(run_drive_worker_with_pending_write,
+                                                          args=(args, item_storage_dir, ready, flushing))
+        self.addCleanup(process_supervisor.stop_all)
+        drive_key = ('drive_id', 'account_id', 'personal')
+        process_supervisor.update([drive_key])
+        self.assertTrue(ready.wait(timeout=60))
+        process = process_supervisor.children[drive_key].process
+        # Ctrl+C in a terminal reaches the drive process too, which leaves it to the supervisor.
+        os.kill(process.pid, signal.SIGINT)
+        time.sleep(0.5)
+        self.assertTrue(process.is_alive())
+
+        def interrupt_again():
+            if flushing.wait(timeout=30):
+                os.kill(process.pid, signal.SIGINT)
+                os.kill(process.pid, signal.SIGTERM)
+
+        interrupter = threading.Thread(target=interrupt_again)
+        interrupter.start()
+        process_supervisor.stop_all()
+        interrupter.join()
+        # Signals during the flush neither interrupt it nor change the exit code.
+        self.assertEqual(0, process.exitcode)
+        # The log left by an earlier process of the drive is kept.
+        with open(log_path + '.drive_id') as f:
+            self.assertTrue(f.read().startswith('Log of the process before.'))
+        db_names = os.listdir(item_storage_dir)
+        db_path = os.path.join(item_storage_dir, [n for n in db_names if n.endswith('.db')][0])
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(1, conn.execute('SELECT COUNT(*) FROM items').fetchone()[0])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
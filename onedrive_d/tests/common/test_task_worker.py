@@ -2,8 +2,14 @@ __author__ = 'xb'
 
 import unittest
 
-from onedrive_d.common.task_worker import TaskConsumer
+try:
+    from unittest import mock
+except:
+    import mock
+
+from onedrive_d.common.task_worker import TaskConsumer, WorkerLane
 from onedrive_d.common import tasks
+from onedrive_d.store.task_pool import TaskLanes
 from onedrive_d.tests.common.test_tasks import BaseTestCase
 
 
@@ -16,10 +22,76 @@ class TestTaskConsumer(BaseTestCase, unittest.TestCase):
     def test_exit(self):
         consumer = TaskConsumer(self.task_pool)
         consumer.start()
+        self.addCleanup(TaskConsumer.terminate_sign.clear)
         TaskConsumer.terminate_sign.set()
         self.task_pool.semaphore.release()
         consumer.join(timeout=1)
 
 
+@mock.patch.object(WorkerLane, 'add_worker')
+class TestWorkerLane(BaseTestCase, unittest.TestCase):
+    def setUp(self):
+        self.setup_objects()
+        self.worker_lane = WorkerLane(self.task_pool, TaskLanes.METADATA, min_workers=1, max_workers=4)
+        self.worker = mock.Mock()
+        self.worker_lane.workers.add(self.worker)
+        self.worker_lane._last_sample = (0, 0)
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            self.task_pool.add_task(tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name=name))
+
+    def add_worker(self):
+        self.worker_lane.workers.add(mock.Mock())
+
+    def run_interval(self, now, tasks_done):
+        self.worker_lane.tasks_done += tasks_done
+        return self.worker_lane.adjust(now=now)
+
+    def test_grow_with_backlog(self, mock_add):
+        mock_add.side_effect = self.add_worker
+        self.assertTrue(self.run_interval(10, 10))
+        self.assertTrue(self.run_interval(20, 20))
+        self.assertTrue(self.run_interval(30, 30))
+        # Max workers reached.
+        self.assertFalse(self.run_interval(40, 40))
+        self.assertEqual(4, self.worker_lane.num_workers)
+
+    def test_stop_growing_without_gain(self, mock_add):
+        mock_add.side_effect = self.add_worker
+        self.assertTrue(self.run_interval(10, 10))
+        # The new worker did not speed the lane up.
+        self.assertFalse(self.run_interval(20, 10))
+        self.assertFalse(self.run_interval(30, 20))
+        # The ceiling is lifted once the queue drains.
+        while self.task_pool.pop_task() is not None:
+            pass
+        self.assertFalse(self.run_interval(40, 10))
+        self.task_pool.add_task(tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='f'))
+        self.task_pool.add_task(tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='g'))
+        self.task_pool.add_task(tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='h'))
+        self.assertTrue(self.run_interval(50, 10))
+
+    def test_no_backlog(self, mock_add):
+        while self.task_pool.pop_task() is not None:
+            pass
+        self.assertFalse(self.run_interval(10, 10))
+        self.assertFalse(mock_add.called)
+
+    def test_retire_worker(self, mock_add):
+        other_worker = mock.Mock()
+        self.worker_lane.workers.add(other_worker)
+        self.assertTrue(self.worker_lane.retire_worker(other_worker))
+        self.assertFalse(self.worker_lane.retire_worker(self.worker))
+        self.assertEqual({self.worker}, self.worker_lane.workers)
+
+    def test_idle_worker_retires(self, mock_add):
+        self.worker_lane.idle_timeout_sec = 0.01
+        consumer = TaskConsumer(self.task_pool, lane=TaskLanes.SMALL_TRANSFER, worker_lane=self.worker_lane)
+        self.worker_lane.workers.add(consumer)
+        consumer.start()
+        consumer.join(timeout=5)
+        self.assertFalse(consumer.is_alive())
+        self.assertNotIn(consumer, self.worker_lane.workers)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 __author__ = 'xb'
 
 import os
+import shutil
+import tempfile
 import unittest
 
 try:
@@ -13,6 +15,8 @@ from requests_mock import Mocker
 
 from onedrive_d import datetime_to_timestamp
 from onedrive_d.api import items
+from onedrive_d.common import drive_config
+from onedrive_d.common import hasher
 from onedrive_d.common import tasks
 from onedrive_d.tests import get_data
 from onedrive_d.tests.common import test_tasks
@@ -45,6 +49,62 @@ class TestDownloadFileTask(test_tasks.BaseTestCase, unittest.TestCase):
         ts = datetime_to_timestamp(self.item.modified_time)
         self.assertEqual((ts, ts), self.utime_records[self.file_path])
 
+    def setup_local_copy(self, content, crc32_hash=None):
+        """
+        Record another item with the same hash as self.item, whose local file holds the content given.
+        :param bytes content:
+        :param str | None crc32_hash: (Optional) If given, give the items this CRC32 hash of the content but no SHA-1
+        hash.
+        """
+        self.drive.config = drive_config.DriveConfig({'local_root': tempfile.mkdtemp()})
+        self.addCleanup(shutil.rmtree, self.drive.config.local_root)
+        self.file_path = self.drive.config.local_root + '/test'
+        self.tmp_file_path = self.drive.config.local_root + '/' + self.task.get_temp_filename()
+        copy_path = self.drive.config.local_root + '/copy'
+        with open(copy_path, 'wb') as f:
+            f.write(content)
+        item_data = get_data('image_item.json')
+        item_data['id'] += '0'
+        item_data['name'] = 'copy'
+        item_data['size'] = 1
+        if crc32_hash is not None:
+            hashes = {'crc32Hash': crc32_hash}
+        else:
+            hashes = {'sha1Hash': hasher.hash_value(copy_path)}
+        item_data['file']['hashes'] = dict(hashes)
+        self.items_store.update_item(items.OneDriveItem(self.drive, item_data))
+        self.item._data['file']['hashes'] = dict(hashes)
+
+    @Mocker()
+    def test_clone_local_copy(self, mock_request):
+        self.setup_local_copy(b'1')
+        self.task.handle()
+        self.assertEqual(0, mock_request.call_count)
+        with open(self.tmp_file_path, 'rb') as f:
+            self.assertEqual(b'1', f.read())
+        self.assertListEqual([(self.tmp_file_path, self.file_path)], self.rename_records)
+
+    @Mocker()
+    def test_clone_by_crc32(self, mock_request):
+        # CRC32 of b'1' is 0x83DCEFB7, which the server sends as little-endian hex.
+        self.setup_local_copy(b'1', crc32_hash='B7EFDC83')
+        self.task.handle()
+        self.assertEqual(0, mock_request.call_count)
+        with open(self.tmp_file_path, 'rb') as f:
+            self.assertEqual(b'1', f.read())
+
+    @Mocker()
+    def test_clone_mismatch(self, mock_request):
+        self.setup_local_copy(b'1')
+        with open(self.drive.config.local_root + '/copy', 'wb') as f:
+            f.write(b'2')
+        mock_request.get(self.drive.drive_uri + self.drive.drive_path + '/items/' + self.item.id + '/content',
+                         content=b'1', status_code=codes.ok)
+        self.task.handle()
+        self.assertEqual(1, mock_request.call_count)
+        with open(self.tmp_file_path, 'rb') as f:
+            self.assertEqual(b'1', f.read())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,6 +10,7 @@ except:
 
 from requests_mock import Mocker
 
+from onedrive_d.common import scan_scheduler
 from onedrive_d.common import tasks
 from onedrive_d.tests.common import test_tasks
 
@@ -29,8 +30,36 @@ class TestMoveFromTask(test_tasks.BaseTestCase, unittest.TestCase):
             os.path.exists = lambda s: True
             self.task.handle()
 
+    @mock.patch('os.path.exists', return_value=False)
     @mock.patch('onedrive_d.common.tasks.RemoveItemTask', handle=lambda o: None)
-    def test_handle(self, mock_task):
+    def test_handle(self, mock_task, mock_exists):
+        self.task.remove_after = 0
+        self.task.handle()
+        self.assertTrue(mock_task.called)
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('onedrive_d.common.tasks.RemoveItemTask', handle=lambda o: None)
+    def test_wait_for_move(self, mock_task, mock_exists):
+        self.task.handle()
+        self.assertFalse(mock_task.called)
+        self.assertIsNone(self.task_pool.pop_task())
+        self.assertTrue(self.task_pool.has_pending_task(self.task_pool.get_task_path(self.task)))
+        self.task_pool.release_due_tasks(now=self.task_pool.get_next_due_time())
+        self.assertIs(self.task, self.task_pool.pop_task())
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('onedrive_d.common.tasks.RemoveItemTask', handle=lambda o: None)
+    def test_wait_for_next_pass(self, mock_task, mock_exists):
+        scheduler = scan_scheduler.ScanScheduler(min_interval_sec=10)
+        scan_pass = scheduler.start_pass('drive')
+        self.task = tasks.MoveFromTask(self.task_base, '/foo/bar', 'baz', False, scan_pass=scan_pass)
+        self.task.remove_after = 0
+        scheduler.end_pass(scan_pass)
+        # The pass that found the entry missing is done, but the next one, which scans every directory, is not.
+        self.task.handle()
+        self.assertFalse(mock_task.called)
+        self.assertTrue(self.task_pool.has_pending_task(self.task_pool.get_task_path(self.task)))
+        scheduler.end_pass(scheduler.start_pass('drive'))
         self.task.handle()
         self.assertTrue(mock_task.called)
 
@@ -0,0 +1,59 @@
+__author__ = 'xb'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from requests_mock import Mocker
+
+from onedrive_d.api import items
+from onedrive_d.common import drive_config
+from onedrive_d.common import tasks
+from onedrive_d.tests import get_data
+from onedrive_d.tests.common import test_tasks
+
+
+class TestMoveItemTask(test_tasks.BaseTestCase, unittest.TestCase):
+    def setUp(self):
+        super().setup_objects()
+        self.drive.config = drive_config.DriveConfig({'local_root': tempfile.mkdtemp()})
+        self.addCleanup(shutil.rmtree, self.drive.config.local_root)
+        self.folder_data = get_data('folder_item.json')
+        self.old_path = self.drive.config.local_root + '/' + self.folder_data['name']
+        self.new_path = self.drive.config.local_root + '/Renamed'
+        os.mkdir(self.old_path)
+        self.items_store.update_item(items.OneDriveItem(self.drive, self.folder_data),
+                                     local_stat=os.stat(self.old_path))
+        os.replace(self.old_path, self.new_path)
+        self.sync_task = tasks.SynchronizeDirTask(self.task_base, local_parent_path='', name='')
+
+    def test_detect_move(self):
+        self.sync_task.analyze_untouched_local_item('Renamed')
+        task = self.task_pool.pop_task()
+        self.assertIsInstance(task, tasks.MoveItemTask)
+        self.assertEqual(self.folder_data['id'], task.item_id)
+        self.assertEqual('Renamed', task.name)
+        self.assertEqual(self.drive.drive_path + '/root:', task.parent_path)
+
+    def test_ignore_unrelated_entry(self):
+        os.mkdir(self.old_path)
+        self.sync_task.analyze_untouched_local_item('Renamed')
+        self.assertIsNone(self.task_pool.pop_task())
+
+    @Mocker()
+    def test_handle(self, mock_request):
+        self.folder_data['name'] = 'Renamed'
+        mock_request.patch(self.drive.get_item_uri(item_id=self.folder_data['id']), json=self.folder_data)
+        move_from_task = tasks.MoveFromTask(self.task_base, '', 'Public', is_folder=True,
+                                            item_id=self.folder_data['id'])
+        tasks.MoveItemTask(move_from_task, '', 'Renamed').handle()
+        self.assertEqual(1, mock_request.call_count)
+        self.assertTrue(move_from_task.is_moved())
+        record = self.items_store.get_items_by_id(item_id=self.folder_data['id'])[self.folder_data['id']]
+        self.assertEqual('Renamed', record.item_name)
+        self.assertEqual(os.stat(self.new_path).st_ino, record.inode)
+
+
+if __name__ == '__main__':
+    unittest.main()
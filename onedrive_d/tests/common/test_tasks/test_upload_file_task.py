@@ -12,6 +12,8 @@ except:
 from requests import codes
 from requests_mock import Mocker
 
+from onedrive_d.api import items
+from onedrive_d.common import hasher
 from onedrive_d.common import tasks
 from onedrive_d.tests import get_data
 from onedrive_d.tests.common import test_tasks
@@ -44,6 +46,45 @@ class TestUploadFileTask(test_tasks.BaseTestCase, unittest.TestCase):
             self.task.handle()
             # On Travis CI, program attempted to open '~/.netrc'.
 
+    def add_remote_copy(self, name):
+        data = get_data('image_item.json')
+        data['name'] = name
+        data['size'] = len(self.in_data)
+        m = mock.mock_open()
+        m.return_value = io.BytesIO(self.in_data)
+        with mock.patch('builtins.open', m, create=True):
+            data['file']['hashes'] = {'sha1Hash': hasher.hash_value(self.file_path)}
+        self.items_store.update_item(items.OneDriveItem(self.drive, data))
+        return data
+
+    def run_dedupe(self):
+        self.task.DEDUPE_MIN_SIZE = 0
+        m = mock.mock_open()
+        m.side_effect = lambda *args: io.BytesIO(self.in_data)
+        with mock.patch('builtins.open', m, create=True):
+            self.task.handle()
+        return self.task_pool.pop_task()
+
+    def test_dedupe(self):
+        data = self.add_remote_copy('test_copy')
+        task = self.run_dedupe()
+        self.assertIsInstance(task, tasks.CopyItemTask)
+        self.assertEqual(data['id'], task.from_item_id)
+        self.assertEqual(self.task.parent_path, task.parent_path)
+        self.assertEqual('test', task.name)
+
+    def test_dedupe_ignores_self(self):
+        self.add_remote_copy('test')
+        with mock.patch.object(self.drive, 'upload_file', side_effect=IOError) as upload_file:
+            self.assertIsNone(self.run_dedupe())
+            self.assertTrue(upload_file.called)
+
+    def test_lane_sized_once(self):
+        self.assertEqual(tasks.TaskLanes.SMALL_TRANSFER, self.task.lane)
+        with mock.patch('os.path.getsize', side_effect=AssertionError('File sized in the pool.')):
+            self.task_pool.add_task(self.task)
+        self.assertIs(self.task, self.task_pool.pop_task(lane=tasks.TaskLanes.SMALL_TRANSFER))
+
 
 if __name__ == '__main__':
     unittest.main()
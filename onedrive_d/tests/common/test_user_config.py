@@ -32,6 +32,22 @@ class TestUserConfig(unittest.TestCase):
         new_default = dict(DriveConfig.DEFAULT_VALUES)
         self.assertNotEqual(old_default, new_default)
 
+    def test_worker_lanes(self):
+        self.data['worker_lanes'] = {'metadata': {'max_workers': 8}, 'unknown': {'max_workers': 1}}
+        conf = user_config.UserConfig.load(user_config.UserConfig(self.data).dump())
+        self.assertEqual({'min_workers': 1, 'max_workers': 8}, conf.worker_lanes['metadata'])
+        self.assertEqual(user_config.UserConfig.DEFAULT_WORKER_LANES['large_transfer'],
+                         conf.worker_lanes['large_transfer'])
+        self.assertNotIn('unknown', conf.worker_lanes)
+
+    def test_scan_params(self):
+        self.assertIsNone(self.user_conf.scan_budget)
+        self.data['scan_budget'] = 1000
+        conf = user_config.UserConfig.load(user_config.UserConfig(self.data).dump())
+        self.assertEqual(1000, conf.scan_budget)
+        self.assertEqual(user_config.UserConfig.DEFAULT_CONFIG['max_rescan_interval_seconds'],
+                         conf.max_rescan_interval_seconds)
+
     def test_append(self):
         del self.data['default_drive_config']
         conf = user_config.UserConfig(self.data)
@@ -1,12 +1,15 @@
 __author__ = 'xb'
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from requests import codes
 from requests_mock import Mocker
 
 from onedrive_d.api import accounts
-from onedrive_d.store.account_db import AccountStorage
+from onedrive_d.store.account_db import AccountStorage, TokenStore
 from onedrive_d.tests import get_data
 from onedrive_d.tests.mocks import mock_atexit
 from onedrive_d.tests.mocks import mock_logger
@@ -94,6 +97,19 @@ class TestAccountStorage(unittest.TestCase):
         self.assertIsInstance(all_accounts, dict)
         self.assertEqual(1, len(all_accounts))
 
+    def test_get_all_accounts_is_stable(self):
+        self.account_store.insert_record(self.personal_account)
+        account = self.account_store.get_all_accounts()[(self.personal_account.profile.user_id,
+                                                         self.personal_account.TYPE)]
+        self.assertIs(account, list(self.account_store.get_all_accounts().values())[0])
+
+    def test_get_some_accounts(self):
+        self.account_store.insert_record(self.personal_account)
+        self.account_store.account_keys = {('foo', self.personal_account.TYPE)}
+        self.assertEqual(0, len(self.account_store.get_all_accounts()))
+        self.account_store.account_keys.add((self.personal_account.profile.user_id, self.personal_account.TYPE))
+        self.assertEqual(1, len(self.account_store.get_all_accounts()))
+
     def test_delete_account(self):
         self.account_store.add_account(self.personal_account)
         self.assertEqual(1, len(self.account_store.get_all_accounts()))
@@ -104,5 +120,52 @@ class TestAccountStorage(unittest.TestCase):
         self.account_store.close()
 
 
+class TestTokenStore(unittest.TestCase):
+    """
+    Two account storages on the same database stand for two processes that sync drives of the same account.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, 'accounts.db')
+        personal_account = get_sample_personal_account()
+        self.key = (personal_account.profile.user_id, personal_account.TYPE)
+        stores = []
+        for i in range(2):
+            store = AccountStorage(self.db_path, personal_client=personal_account.client,
+                                   token_store=TokenStore(self.db_path))
+            stores.append(store)
+        stores[0].insert_record(personal_account)
+        self.accounts = [store.get_all_accounts()[self.key] for store in stores]
+        self.stores = stores
+        self.addCleanup(stores[0].close)
+
+    @Mocker()
+    def test_take_tokens_renewed_by_other_process(self, mock):
+        new_data = get_data('personal_access_token_alt.json')
+        mock.post(self.accounts[0].client.OAUTH_TOKEN_URI, json=new_data)
+        old_token = self.accounts[1].access_token
+        self.accounts[0].renew_tokens()
+        self.assertEqual(1, mock.call_count)
+        # The second process must not renew with the refresh token the first one has used up.
+        self.accounts[1].renew_tokens(expired_token=old_token)
+        self.assertEqual(1, mock.call_count)
+        self.assertEqual(new_data['access_token'], self.accounts[1].access_token)
+        self.assertEqual(new_data['refresh_token'], self.accounts[1].refresh_token)
+        self.stores[1].close()
+
+    @Mocker()
+    def test_keep_newer_tokens_on_close(self, mock):
+        new_data = get_data('personal_access_token_alt.json')
+        mock.post(self.accounts[0].client.OAUTH_TOKEN_URI, json=new_data)
+        self.accounts[0].renew_tokens()
+        # The second process, which still has the old tokens, exits after the first one renewed.
+        self.stores[1].close()
+        store = AccountStorage(self.db_path, personal_client=self.accounts[0].client)
+        self.assertEqual(new_data['refresh_token'], store.get_all_accounts()[self.key].refresh_token)
+        store.close()
+
+
 if __name__ == '__main__':
     unittest.main()
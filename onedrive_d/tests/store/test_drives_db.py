@@ -40,6 +40,28 @@ class TestDriveStorage(unittest.TestCase):
             self.assertEqual(drive.drive_id, drive_value.drive_id)
             self.assertEqual(drive.config.local_root, drive_value.config.local_root)
 
+    def test_get_all_drives_is_stable(self):
+        drive = drives.DriveObject(self.drive_root, get_data('drive.json'), DriveConfig({'local_root': '/tmp'}))
+        self.drives_store.add_record(drive)
+        loaded = list(self.drives_store.get_all_drives().values())
+        self.assertEqual(1, len(loaded))
+        self.assertEqual(loaded, list(self.drives_store.get_all_drives().values()))
+        self.assertIs(loaded[0], list(self.drives_store.get_all_drives().values())[0])
+        # A changed record updates the loaded drive in place.
+        drive.config.data['local_root'] = '/tmp/changed'
+        self.drives_store.add_record(drive)
+        self.assertIs(loaded[0], list(self.drives_store.get_all_drives().values())[0])
+        self.assertEqual('/tmp/changed', loaded[0].config.local_root)
+        # A record deleted elsewhere is forgotten.
+        self.drives_store._cursor.execute('DELETE FROM drives')
+        self.assertEqual(0, len(self.drives_store.get_all_drives()))
+
+    def test_get_all_drive_keys(self):
+        drive = drives.DriveObject(self.drive_root, get_data('drive.json'), DriveConfig({'local_root': '/tmp'}))
+        self.drives_store.add_record(drive)
+        self.assertEqual([(drive.drive_id, self.personal_account.profile.user_id, self.personal_account.TYPE)],
+                         self.drives_store.get_all_drive_keys())
+
     def test_assemble_drive_error(self):
         d = {}
         drive = drives.DriveObject(self.drive_root, get_data('drive.json'), DriveConfig.default_config())
@@ -1,6 +1,12 @@
 __author__ = 'xb'
 
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime
 
 from onedrive_d.api import items
 from onedrive_d.store import items_db
@@ -129,6 +135,15 @@ class TestItemStorage(unittest.TestCase):
         records = self.itemdb.get_items_by_id(item_id=item.id)
         self.assert_item_record(item, records, status)
 
+    def test_update_item_without_hashes(self):
+        data = self.all_items_data[0]
+        del data['file']['hashes']
+        item = items.OneDriveItem(self.drive, data)
+        self.itemdb.update_item(item, items_db.ItemRecordStatuses.OK)
+        record = self.itemdb.get_items_by_id(item_id=item.id)[item.id]
+        self.assertIsNone(record.crc32_hash)
+        self.assertIsNone(record.sha1_hash)
+
     def test_update_status(self):
         item = self.all_items[0]
         q = {'item_name': item.name, 'local_parent_path': ''}
@@ -140,9 +155,221 @@ class TestItemStorage(unittest.TestCase):
         name = items_db.create_item_db_name(self.drive)
         self.assertIsInstance(name, str)
 
+    def test_delete_folder_keeps_siblings_with_same_prefix(self):
+        data = get_data('folder_child_item.json')
+        data['id'] = 'sibling_id'
+        data['parentReference'] = {'id': 'other_id', 'path': '/drive/root:/Public2'}
+        self.itemdb.update_item(items.OneDriveItem(self.drive, data))
+        self.itemdb.delete_item(item_id=self.all_items[1].id, is_folder=True)
+        self.assertEqual(1, len(self.itemdb.get_items_by_id(item_id='sibling_id')))
+
+    def test_move_under_unknown_parent(self):
+        """
+        An item whose parent cannot be resolved is not recorded, and the storage stays writable.
+        """
+        folder_data = self.all_items_data[1]
+        old_name = folder_data['name']
+        folder_data['name'] = 'Renamed'
+        del folder_data['parentReference']['path']
+        self.itemdb.update_item(items.OneDriveItem(self.drive, folder_data))
+        records = self.itemdb.get_items_by_id(item_id=folder_data['id'])
+        self.assertEqual(old_name, records[folder_data['id']].item_name)
+        writer = threading.Thread(target=self.itemdb.update_status,
+                                  args=(items_db.ItemRecordStatuses.MOVING,), kwargs={'item_id': folder_data['id']})
+        writer.start()
+        writer.join(timeout=1)
+        self.assertFalse(writer.is_alive())
+        records = self.itemdb.get_items_by_id(item_id=folder_data['id'])
+        self.assertEqual(items_db.ItemRecordStatuses.MOVING, records[folder_data['id']].status)
+
+    def test_move_folder(self):
+        folder_data = self.all_items_data[1]
+        folder_data['name'] = 'Renamed'
+        folder_data['parentReference']['path'] = '/drive/root:/foo'
+        self.itemdb.update_item(items.OneDriveItem(self.drive, folder_data))
+        child = self.all_items[2]
+        records = self.itemdb.get_items_by_id(item_id=child.id)
+        self.assertEqual('/drive/root:/foo/Renamed', records[child.id].parent_path)
+        self.assertEqual('/foo/Renamed/' + child.name, records[child.id].local_path)
+        self.assertEqual(0, len(self.itemdb.get_items_by_id(local_parent_path='/Public', item_name=child.name)))
+        self.assertEqual(1, len(self.itemdb.get_items_by_id(local_parent_path='/foo/Renamed', item_name=child.name)))
+        # Moving the folder does not touch the records of its descendants.
+        self.itemdb.delete_item(item_id=folder_data['id'], is_folder=True)
+        self.assertEqual(0, len(self.itemdb.get_items_by_id(item_id=child.id)))
+
+    def test_failed_move_leaves_nothing(self):
+        """
+        A mutation that fails halfway rolls back the directory nodes it created or moved.
+        """
+        dir_count = self.itemdb._conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+        folder_data = self.all_items_data[1]
+        folder_data['name'] = 'Renamed'
+        folder_data['parentReference']['path'] = '/drive/root:/foo/bar'
+        self.itemdb.UPDATE_ITEM_SQL = 'INSERT INTO no_such_table VALUES (?)'
+        self.assertRaises(sqlite3.OperationalError, self.itemdb.update_item,
+                          items.OneDriveItem(self.drive, folder_data))
+        del self.itemdb.UPDATE_ITEM_SQL
+        self.assertEqual(dir_count, self.itemdb._conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0])
+        child = self.all_items[2]
+        records = self.itemdb.get_items_by_id(item_id=child.id)
+        self.assertEqual(child.parent_reference.path, records[child.id].parent_path)
+        # Earlier mutations of the batch survive, and later ones still go through.
+        self.assertEqual(3, self.itemdb._conn.execute('SELECT COUNT(*) FROM items').fetchone()[0])
+        self.itemdb.update_item(items.OneDriveItem(self.drive, folder_data))
+        records = self.itemdb.get_items_by_id(item_id=child.id)
+        self.assertEqual('/drive/root:/foo/bar/Renamed', records[child.id].parent_path)
+
+    def test_delete_nested_folder(self):
+        data = get_data('folder_child_item.json')
+        data['id'] = 'grandchild_id'
+        data['parentReference'] = {'id': 'unrecorded_id', 'path': '/drive/root:/Public/sub/dir'}
+        self.itemdb.update_item(items.OneDriveItem(self.drive, data))
+        self.itemdb.delete_item(item_id=self.all_items[1].id, is_folder=True)
+        self.assertEqual(0, len(self.itemdb.get_items_by_id(item_id='grandchild_id')))
+        self.assertEqual(1, self.itemdb._conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0])
+
+    def test_get_items_by_inode(self):
+        item = self.all_items[0]
+        local_stat = os.stat_result((0o100644, 1234, 56, 1, 0, 0, 0, 0, 0, 0))
+        self.itemdb.update_local_stat(item.id, local_stat)
+        self.assert_item_record(item, self.itemdb.get_items_by_inode(1234, 56))
+        # Updating the item from the server keeps the inode of the local entry.
+        self.itemdb.update_item(item)
+        self.assertEqual(1234, self.itemdb.get_items_by_id(item_id=item.id)[item.id].inode)
+        self.assertEqual(0, len(self.itemdb.get_items_by_inode(1234, 78)))
+
+    def test_get_items_in_unknown_dir(self):
+        self.assertEqual(0, len(self.itemdb.get_items_by_id(local_parent_path='/nonexistent', item_name='a')))
+
+    def test_query_plans_use_indexes(self):
+        queries = [
+            ('SELECT item_id FROM items WHERE dir_id=? AND item_name=?', (1, 'b')),
+            ('SELECT item_id FROM items WHERE crc32_hash=? OR sha1_hash=?', ('a', 'b')),
+            ('SELECT dir_id FROM dirs WHERE parent_dir_id=? AND dir_name=?', (1, 'b')),
+            ('DELETE FROM items WHERE dir_id IN (SELECT ?)', (1,)),
+        ]
+        for sql, args in queries:
+            plan = ' '.join(str(r) for r in self.itemdb._conn.execute('EXPLAIN QUERY PLAN ' + sql, args))
+            self.assertIn('INDEX', plan, sql)
+
+    def test_schema_version(self):
+        self.assertEqual(items_db.ItemStorage.SCHEMA_VERSION, self.itemdb.get_schema_version())
+
+    def test_get_item_storage_of_reloaded_drive(self):
+        drive = drive_factory.get_sample_drive_object()
+        self.assertIsNot(self.drive, drive)
+        self.assertIs(self.itemdb, self.itemdb_mgr.get_item_storage(drive))
+        self.assertIs(self.drive.storage_lock, drive.storage_lock)
+        self.assertEqual(1, len(self.itemdb_mgr.item_storages))
+
     def tearDown(self):
         self.itemdb.close()
 
 
+class TestItemStorageMigration(unittest.TestCase):
+    LEGACY_SCHEMA = """CREATE TABLE items (
+      item_id TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE, type TEXT, item_name TEXT, parent_id TEXT,
+      parent_path TEXT, etag TEXT, ctag TEXT, size INT, created_time TEXT, modified_time TEXT, status TEXT,
+      crc32_hash TEXT, sha1_hash TEXT)"""
+
+    def setUp(self):
+        self.drive = drive_factory.get_sample_drive_object()
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+    def test_migrate_legacy_database(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(self.LEGACY_SCHEMA)
+        conn.execute('INSERT INTO items (item_id, item_name, parent_path, created_time, modified_time) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     ('legacy_id', 'foo', '/drive/root:', '2015-01-01T00:00:00Z', '2015-01-01T00:00:00Z'))
+        conn.commit()
+        conn.close()
+        itemdb = items_db.ItemStorage(self.db_path, self.drive)
+        self.assertEqual(items_db.ItemStorage.SCHEMA_VERSION, itemdb.get_schema_version())
+        indexes = {r[0] for r in itemdb._conn.execute('SELECT name FROM sqlite_master WHERE type=\'index\'')}
+        self.assertIn('items_dir_name', indexes)
+        self.assertIn('items_sha1_hash', indexes)
+        records = itemdb.get_items_by_id(local_parent_path='', item_name='foo')
+        self.assertEqual(1, len(records))
+        self.assertEqual('/drive/root:', records['legacy_id'].parent_path)
+        self.assertEqual(1420070400 * 10 ** 9, records['legacy_id'].modified_time_ns)
+        self.assertEqual(datetime(2015, 1, 1), records['legacy_id'].modified_time)
+        stored = itemdb._conn.execute('SELECT modified_time FROM items').fetchone()[0]
+        self.assertIsInstance(stored, int)
+        itemdb.close()
+
+    def _count_committed(self):
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+        conn.close()
+        return count
+
+    def test_write_behind(self):
+        itemdb = items_db.ItemStorage(self.db_path, self.drive, commit_interval_sec=60)
+        item = items.OneDriveItem(self.drive, get_data('image_item.json'))
+        itemdb.update_item(item)
+        self.assertEqual(1, itemdb.pending_writes)
+        # Reads on the storage see the pending write; other connections do not.
+        self.assertEqual(1, len(itemdb.get_items_by_id(item_id=item.id)))
+        self.assertEqual(0, self._count_committed())
+        itemdb.update_status(items_db.ItemRecordStatuses.MOVING, item_id=item.id)
+        self.assertEqual(2, itemdb.pending_writes)
+        itemdb.flush()
+        self.assertEqual(0, itemdb.pending_writes)
+        self.assertEqual(1, self._count_committed())
+        itemdb.delete_item(item_id=item.id)
+        itemdb.close()
+        self.assertEqual(0, self._count_committed())
+
+    def test_commit_by_batch_size(self):
+        itemdb = items_db.ItemStorage(self.db_path, self.drive, commit_interval_sec=60, max_batch_size=2)
+        data = get_data('image_item.json')
+        for i in range(3):
+            data['id'] = str(i)
+            itemdb.update_item(items.OneDriveItem(self.drive, data))
+        self.assertEqual(1, itemdb.pending_writes)
+        self.assertEqual(2, self._count_committed())
+        itemdb.close()
+
+    def test_commit_by_interval(self):
+        itemdb = items_db.ItemStorage(self.db_path, self.drive, commit_interval_sec=0.01)
+        item = items.OneDriveItem(self.drive, get_data('image_item.json'))
+        itemdb.update_item(item)
+        for i in range(100):
+            if itemdb.pending_writes == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(1, self._count_committed())
+        # Later batches are committed by the same thread.
+        flusher = itemdb._flusher
+        itemdb.update_status(items_db.ItemRecordStatuses.MOVING, item_id=item.id)
+        for i in range(100):
+            if itemdb.pending_writes == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(0, itemdb.pending_writes)
+        self.assertIs(flusher, itemdb._flusher)
+        itemdb.close()
+        flusher.join(timeout=1)
+        self.assertFalse(flusher.is_alive())
+
+    def test_wal_mode(self):
+        itemdb = items_db.ItemStorage(self.db_path, self.drive)
+        self.assertEqual('wal', itemdb._conn.execute('PRAGMA journal_mode').fetchone()[0])
+        itemdb.close()
+        # Reopening an up-to-date database must not run any migration.
+        itemdb = items_db.ItemStorage(self.db_path, self.drive)
+        self.assertEqual(items_db.ItemStorage.SCHEMA_VERSION, itemdb.get_schema_version())
+        itemdb.close()
+
+    def tearDown(self):
+        for suffix in ['', '-wal', '-shm']:
+            try:
+                os.remove(self.db_path + suffix)
+            except OSError:
+                pass
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,14 @@
 __author__ = 'xb'
 
+import time
 import unittest
 
+from onedrive_d.common import drive_config
+from onedrive_d.common import scan_scheduler
 from onedrive_d.common import tasks
 from onedrive_d.store import task_pool
+from onedrive_d.tests import get_data
+from onedrive_d.tests.api import drive_factory
 from onedrive_d.tests.common.test_tasks import BaseTestCase
 
 
@@ -25,6 +30,98 @@ class TestTaskPool(BaseTestCase, unittest.TestCase):
         self.task_pool.pop_task()
         self.assertFalse(self.task_pool.has_pending_task(self.task_pool.get_task_path(self.task)))
 
+    def test_delayed_task(self):
+        self.task_pool.pop_task()
+        later = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='later')
+        sooner = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='sooner')
+        self.task_pool.add_task(later, delay_sec=600)
+        self.task_pool.add_task(sooner, delay_sec=300)
+        self.assertIsNone(self.task_pool.pop_task())
+        self.assertTrue(self.task_pool.has_pending_task(self.task_pool.get_task_path(later)))
+        self.assertAlmostEqual(time.monotonic() + 300, self.task_pool.get_next_due_time(), delta=10)
+        self.assertEqual(1, self.task_pool.release_due_tasks(now=time.monotonic() + 400))
+        self.assertIs(sooner, self.task_pool.pop_task())
+        self.assertEqual(1, self.task_pool.release_due_tasks(now=time.monotonic() + 700))
+        self.assertIs(later, self.task_pool.pop_task())
+        self.assertIsNone(self.task_pool.get_next_due_time())
+
+    def test_remove_delayed_task(self):
+        task = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='/foo', name='bar')
+        self.task_pool.add_task(task, delay_sec=300)
+        self.task_pool.remove_children_tasks('/foo')
+        self.assertFalse(self.task_pool.has_pending_task(self.task_pool.get_task_path(task)))
+        self.assertEqual(0, self.task_pool.release_due_tasks(now=time.monotonic() + 400))
+
+    def test_remove_task_of_scan_pass(self):
+        scheduler = scan_scheduler.ScanScheduler(min_interval_sec=10)
+        scan_pass = scheduler.start_pass('drive')
+        task = tasks.SynchronizeDirTask(self.task_base, local_parent_path='/foo', name='bar', scan_pass=scan_pass)
+        self.task_pool.add_task(task)
+        self.task_pool.remove_children_tasks('/foo')
+        # The pass ends even though the task is still referenced.
+        self.assertIsNone(scheduler.get_running_pass('drive'))
+
+    def test_timer_releases_task(self):
+        self.task_pool.pop_task()
+        self.assertTrue(self.task_pool.semaphore.acquire(timeout=1))
+        self.task_pool.add_task(self.task, delay_sec=0.05)
+        self.assertTrue(self.task_pool.semaphore.acquire(timeout=5))
+        self.assertIs(self.task, self.task_pool.pop_task())
+
+    def test_lanes(self):
+        transfer = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='bar')
+        transfer.lane = task_pool.TaskLanes.LARGE_TRANSFER
+        self.task_pool.add_task(transfer)
+        self.assertEqual(1, self.task_pool.get_queue_length(task_pool.TaskLanes.METADATA))
+        self.assertEqual(2, self.task_pool.get_queue_length())
+        self.assertTrue(self.task_pool.get_semaphore(task_pool.TaskLanes.LARGE_TRANSFER).acquire(blocking=False))
+        self.assertFalse(self.task_pool.get_semaphore(task_pool.TaskLanes.SMALL_TRANSFER).acquire(blocking=False))
+        self.assertIsNone(self.task_pool.pop_task(lane=task_pool.TaskLanes.SMALL_TRANSFER))
+        self.assertIs(transfer, self.task_pool.pop_task(lane=task_pool.TaskLanes.LARGE_TRANSFER))
+        self.assertIs(self.task, self.task_pool.pop_task())
+
+    def test_pop_oldest_across_lanes(self):
+        transfer = tasks.CreateDirTask(task_base=self.task_base, local_parent_path='', name='bar')
+        transfer.lane = task_pool.TaskLanes.SMALL_TRANSFER
+        self.task_pool.add_task(transfer)
+        self.assertIs(self.task, self.task_pool.pop_task())
+        self.assertIs(transfer, self.task_pool.pop_task())
+
+    def add_drive_tasks(self, drive_id, count, **config):
+        data = get_data('drive.json')
+        data['id'] = drive_id
+        drive = drive_factory.get_sample_drive_object(data)
+        drive.config = drive_config.DriveConfig(dict(config, local_root='/' + drive_id))
+        task_base = tasks.TaskMixin(drive=drive, items_store=self.items_store, task_pool=self.task_pool)
+        for i in range(count):
+            self.task_pool.add_task(tasks.CreateDirTask(task_base=task_base, local_parent_path='/' + drive_id,
+                                                        name=str(i)))
+
+    def test_weighted_share_across_drives(self):
+        self.task_pool.pop_task()
+        self.add_drive_tasks('big', 100)
+        self.add_drive_tasks('small', 10, weight=2)
+        popped = [self.task_pool.pop_task().drive.drive_id for _ in range(15)]
+        self.assertEqual(10, popped.count('small'))
+        self.assertEqual(5, popped.count('big'))
+        # A drive that was idle does not wait behind the backlog of another one.
+        self.add_drive_tasks('late', 1)
+        self.assertIn('late', [self.task_pool.pop_task().drive.drive_id for _ in range(2)])
+
+    def test_max_concurrent_tasks(self):
+        self.task_pool.pop_task()
+        self.add_drive_tasks('capped', 3, max_concurrent_tasks=1)
+        while self.task_pool.semaphore.acquire(blocking=False):
+            pass
+        first = self.task_pool.pop_task()
+        self.assertIsNone(self.task_pool.pop_task())
+        self.assertEqual(2, self.task_pool.get_queue_length())
+        self.task_pool.task_done(first)
+        # The wake-up spent on the held task is given back.
+        self.assertTrue(self.task_pool.semaphore.acquire(blocking=False))
+        self.assertFalse(self.task_pool.semaphore.acquire(blocking=False))
+        self.assertIsNotNone(self.task_pool.pop_task())
+
     def test_singleton(self):
         a = task_pool.TaskPool.get_instance()
         b = task_pool.TaskPool.get_instance()
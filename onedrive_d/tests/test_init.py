@@ -16,6 +16,16 @@ class TestTimeConversion(unittest.TestCase):
         self.assertEqual(self.t, onedrive_d.datetime_to_timestamp(self.d))
         # self.assertEqual(self.d, onedrive_d.timestamp_to_datetime(self.t))
 
+    def test_convert_ns(self):
+        ns = onedrive_d.datetime_to_ns(self.d)
+        self.assertEqual(61860000000, ns)
+        self.assertEqual(self.d, onedrive_d.ns_to_datetime(ns))
+
+    def test_compare_ns(self):
+        self.assertEqual(0, onedrive_d.compare_timestamps_ns(1000000000, 1000999999))
+        self.assertEqual(-1, onedrive_d.compare_timestamps_ns(1000000000, 1001000001))
+        self.assertEqual(1, onedrive_d.compare_timestamps_ns(1001000001, 1000000000))
+
 
 class TestGetCurrentOsUser(unittest.TestCase):
     def assert_values(self):
@@ -39,3 +49,10 @@ class TestGetCurrentOsUser(unittest.TestCase):
             if k in os.environ:
                 del os.environ[k]
         self.assert_values()
+
+    def test_get_os_user(self):
+        os_user = onedrive_d.get_os_user()
+        self.assertEqual(onedrive_d.get_current_os_user(), os_user)
+        self.assertIs(os_user, onedrive_d.get_os_user())
+        self.assertEqual(os_user[1], onedrive_d.get_os_user_name())
+        self.assertEqual(os_user[2], onedrive_d.get_os_user_home())
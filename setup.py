@@ -25,6 +25,10 @@ install_requires = [
     'zgitignore>=0.7.1'
 ]
 
+extras_require = {
+    'fast_json': ['orjson>=3.0']
+}
+
 test_requires = [
     'requests-mock>=0.6',
     'coverage>=3.7.1'
@@ -35,8 +39,8 @@ python_version = sys.version_info
 if python_version[0] < 3:
     raise Exception('This package does not support Python 2.x. Please run with Python 3.x and newer instead.')
 
-if python_version[0] == 3 and python_version[1] == 2:
-    test_requires.append('mock>=1.3.0')
+if python_version < (3, 4):
+    raise Exception('This package requires Python 3.4 or newer.')
 
 setup(
     name='onedrive_d',
@@ -57,7 +61,7 @@ setup(
         'onedrive_d.tests.common',
     ],
     package_data={
-        'onedrive_d': ['lang/*.json'],
+        'onedrive_d': ['lang/*.json', 'data/*.sql'],
         'onedrive_d.tests': ['data/*.json']
     },
     entry_point={
@@ -68,9 +72,11 @@ setup(
     },
     setup_requires=setup_requires,
     install_requires=install_requires,
+    extras_require=extras_require,
     tests_require=test_requires,
     test_suite='onedrive_d.tests',
     include_package_data=True,
     url='https://github.com/xybu/onedrive-d',
-    zip_safe=False
+    zip_safe=False,
+    python_requires='>=3.4'
 )